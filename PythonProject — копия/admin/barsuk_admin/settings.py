@@ -31,6 +31,10 @@ INSTALLED_APPS = [
 
 # Промежуточные слои
 MIDDLEWARE = [
+    # Первым: время ответа вместе со всеми остальными middleware
+    'barsuk_app.metrics.MetricsMiddleware',
+    # Профилирование view по команде profile_admin (вне окна - только проверка триггера)
+    'barsuk_app.profiler.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -132,4 +136,51 @@ LOGIN_URL = '/admin/login/'
 LOGIN_REDIRECT_URL = '/admin/'
 
 # Настройки импорта/экспорта
-IMPORT_EXPORT_USE_TRANSACTIONS = True
\ No newline at end of file
+IMPORT_EXPORT_USE_TRANSACTIONS = True
+
+# Канал NOTIFY для сброса кэша пользователей в боте (USER_CACHE_CHANNEL в config.py бота)
+BOT_USER_CHANGED_CHANNEL = 'barsuk_user_changed'
+# Канал NOTIFY для пересборки меню в боте (MENU_CACHE_CHANNEL в config.py бота)
+BOT_MENU_CHANGED_CHANNEL = 'barsuk_menu_changed'
+
+# Bot API (для локального фейкового сервера можно переопределить URL)
+# Токен бота - только из окружения; без него отправка из админки падает с ImproperlyConfigured
+TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_TOKEN', '')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+TELEGRAM_API_TIMEOUT = int(os.getenv('TELEGRAM_API_TIMEOUT', 10))
+TELEGRAM_API_CONNECT_TIMEOUT = float(os.getenv('TELEGRAM_API_CONNECT_TIMEOUT', 3))
+TELEGRAM_API_RETRIES = int(os.getenv('TELEGRAM_API_RETRIES', 3))
+# Размер пула keep-alive соединений и число потоков фоновой отправки
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', 10))
+TELEGRAM_BACKGROUND_WORKERS = int(os.getenv('TELEGRAM_BACKGROUND_WORKERS', 4))
+
+# Рассылки: сообщений в секунду на всех и число одновременных запросов
+BROADCAST_RATE = int(os.getenv('BROADCAST_RATE', 25))
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', 10))
+# Через сколько секунд без heartbeat рассылку может подхватить другой воркер
+BROADCAST_LEASE_SECONDS = int(os.getenv('BROADCAST_LEASE_SECONDS', 60))
+
+# Список заявок: при фильтрах, которых нет в сводной таблице, число строк оценивается
+# по плану запроса; точный COUNT - только если строк не больше ADMIN_EXACT_COUNT_LIMIT
+ADMIN_ESTIMATED_COUNT = os.getenv('ADMIN_ESTIMATED_COUNT', '1') == '1'
+ADMIN_EXACT_COUNT_LIMIT = int(os.getenv('ADMIN_EXACT_COUNT_LIMIT', 10000))
+
+# События: секций вперед (месяцев) и сколько полных месяцев хранить сырые события
+# (0 - хранить всегда). Старые секции удаляет manage_event_partitions, сводка по дням остается
+EVENT_PARTITIONS_AHEAD = int(os.getenv('EVENT_PARTITIONS_AHEAD', 3))
+EVENT_RETENTION_MONTHS = int(os.getenv('EVENT_RETENTION_MONTHS', 12))
+
+# Воронка: события моложе FUNNEL_LAG_SECONDS не обрабатываются (их транзакции могли еще не закоммититься)
+FUNNEL_LAG_SECONDS = int(os.getenv('FUNNEL_LAG_SECONDS', 60))
+
+# Выгрузки из админки: строк за одно чтение серверного курсора
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 2000))
+
+# /metrics (Prometheus) без входа доступен только с этих адресов, через запятую
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+
+# Профилирование по команде profile_admin: куда писать стеки, интервал снимков (сек.) и длительность окна
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.01))
+PROFILE_SECONDS = float(os.getenv('PROFILE_SECONDS', 30))
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', 300))
@@ -10,6 +10,9 @@ from barsuk_app import views
 urlpatterns = [
     # НАШ КАСТОМНЫЙ URL - ДОЛЖЕН БЫТЬ ПЕРВЫМ!
     path('admin/reply-to-request/<int:request_id>/', views.reply_to_request_view, name='reply_to_request'),
+    path('admin/funnel/', views.funnel_view, name='funnel'),
+    path('admin/exports/<int:job_id>/download/', views.download_export_view, name='download_export'),
+    path('metrics/', views.metrics_view, name='metrics'),
 
     # СТАНДАРТНЫЕ URL АДМИНКИ
     path('admin/', admin.site.urls),
@@ -1,31 +1,53 @@
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, User
+from django.db.models import Count, Prefetch
+from django.urls import reverse
 from django.utils.html import format_html
-from import_export.admin import ImportExportModelAdmin
+from import_export.admin import ImportMixin
 from rangefilter.filters import DateRangeFilter
 import json
 from django.utils.timesince import timesince
 from django.utils.safestring import mark_safe
 
 # ИСПРАВЛЕННЫЙ ИМПОРТ
-from .admin_actions import reply_to_request, send_telegram_message
-
-from .models import TelegramUser, Event, Request, ContentCategory, ContentItem
+from .admin_actions import (reply_to_request, create_broadcast_for_users, start_broadcast, pause_broadcast,
+                            send_reply_in_background, REPLY_PENDING, REPLY_SENT, REPLY_FAILED, REPLY_MARKERS,
+                            requeue_outbox, export_csv, export_xlsx)
+
+from .request_stats import (RequestStatsPaginator, RequestTypeFilter, RequestStatusFilter,
+                            stats_available, stats_filters_from_params)
+from .event_store import EventTypeFilter
+from .exports import fail_stale_jobs
+from .paginators import EstimatedCountPaginator
+from .models import (TelegramUser, Event, Request, ContentCategory, ContentItem,
+                     Broadcast, BroadcastRecipient, Outbox, EventDailyRollup, ExportJob)
 
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'get_role')
     list_filter = UserAdmin.list_filter + ('groups',)
 
+    # Группа -> роль, в порядке приоритета
+    ROLE_GROUPS = (
+        ('Manager', 'Менеджер'),
+        ('Marketer', 'Маркетолог'),
+        ('Viewer', 'Наблюдатель'),
+    )
+
+    def get_queryset(self, request):
+        # Группы всех пользователей страницы - одним запросом
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('groups', queryset=Group.objects.only('name'))
+        )
+
     def get_role(self, obj):
         if obj.is_superuser:
             return 'Администратор'
-        elif obj.groups.filter(name='Manager').exists():
-            return 'Менеджер'
-        elif obj.groups.filter(name='Marketer').exists():
-            return 'Маркетолог'
-        elif obj.groups.filter(name='Viewer').exists():
-            return 'Наблюдатель'
+        group_names = {group.name for group in obj.groups.all()}
+        for group_name, role in self.ROLE_GROUPS:
+            if group_name in group_names:
+                return role
         return 'Пользователь'
 
     get_role.short_description = 'Роль'
@@ -36,7 +58,7 @@ admin.site.register(User, CustomUserAdmin)
 
 
 @admin.register(TelegramUser)
-class TelegramUserAdmin(ImportExportModelAdmin):
+class TelegramUserAdmin(ImportMixin, admin.ModelAdmin):
     list_display = ('id', 'telegram_id', 'username', 'full_name', 'phone', 'get_status_colored',
                     'is_18_confirmed', 'points', 'created_at')
     list_display_links = ('id', 'telegram_id', 'username')
@@ -46,6 +68,14 @@ class TelegramUserAdmin(ImportExportModelAdmin):
     search_fields = ('telegram_id', 'username', 'first_name', 'last_name', 'phone')
     readonly_fields = ('created_at', 'updated_at', 'last_activity')
     list_per_page = 50
+    actions = [create_broadcast_for_users, export_csv, export_xlsx]
+    export_columns = [
+        ('ID', 'id'), ('Telegram ID', 'telegram_id'), ('Username', 'username'),
+        ('Имя', 'first_name'), ('Фамилия', 'last_name'), ('Телефон', 'phone'),
+        ('Статус', 'status'), ('18+', 'is_18_confirmed'), ('Город', 'city'), ('Источник', 'source'),
+        ('Баллы', 'points'), ('Уровень', 'level'),
+        ('Дата регистрации', 'created_at'), ('Последняя активность', 'last_activity'),
+    ]
 
     fieldsets = (
         ('Основная информация', {
@@ -91,27 +121,64 @@ class TelegramUserAdmin(ImportExportModelAdmin):
 
 
 @admin.register(Event)
-class EventAdmin(ImportExportModelAdmin):
+class EventAdmin(ImportMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'event_type', 'created_at')
-    list_filter = ('event_type', ('created_at', DateRangeFilter))
+    list_select_related = ('user',)
+    list_filter = (EventTypeFilter, ('created_at', DateRangeFilter))
     search_fields = ('user__telegram_id', 'user__username', 'user__first_name')
     readonly_fields = ('created_at',)
     list_per_page = 100
+    show_full_result_count = False
+    actions = [export_csv, export_xlsx]
+    export_columns = [
+        ('ID', 'id'), ('Telegram ID', 'user__telegram_id'), ('Тип события', 'event_type'),
+        ('Данные', 'event_data'), ('Время', 'created_at'),
+    ]
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        # Без COUNT(*) по всем секциям событий
+        return EstimatedCountPaginator(
+            queryset, per_page, orphans, allow_empty_first_page,
+            estimate=settings.ADMIN_ESTIMATED_COUNT,
+            exact_limit=settings.ADMIN_EXACT_COUNT_LIMIT,
+        )
+
+
+@admin.register(EventDailyRollup)
+class EventDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ('day', 'event_type', 'count', 'users', 'updated_at')
+    list_filter = ('event_type', ('day', DateRangeFilter))
+    date_hierarchy = 'day'
+    readonly_fields = ('day', 'event_type', 'count', 'users', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
 
 
 @admin.register(Request)
-class RequestAdmin(ImportExportModelAdmin):
+class RequestAdmin(ImportMixin, admin.ModelAdmin):
     # Основные поля для отображения
     list_display = ('id', 'user', 'request_type', 'status', 'reply_status', 'created_at', 'assigned_to')
-    list_filter = ('request_type', 'status', 'assigned_to',
+    list_select_related = ('user', 'assigned_to')
+    list_filter = (RequestTypeFilter, RequestStatusFilter, 'assigned_to',
                    ('created_at', DateRangeFilter),
                    ('updated_at', DateRangeFilter))
     search_fields = ('user__telegram_id', 'user__username', 'user__phone', 'manager_notes')
     list_per_page = 50
     list_editable = ('status', 'assigned_to')
 
+    # Итоги и счетчики фильтров - из сводной таблицы RequestDailyStat (см. request_stats.py)
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
     # Действия
-    actions = [reply_to_request]
+    actions = [reply_to_request, export_csv, export_xlsx]
+    export_columns = [
+        ('ID', 'id'), ('Telegram ID', 'user__telegram_id'), ('Username', 'user__username'),
+        ('Тип', 'request_type'), ('Статус', 'status'), ('Данные', 'data'),
+        ('Заметки менеджера', 'manager_notes'), ('Ответственный', 'assigned_to__username'),
+        ('Создана', 'created_at'), ('Обновлена', 'updated_at'),
+    ]
 
     fieldsets = (
         ('Основная информация', {
@@ -128,26 +195,51 @@ class RequestAdmin(ImportExportModelAdmin):
         }),
     )
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name == 'assigned_to' and field is not None:
+            # Список ответственных строится один раз, а не в каждой строке list_editable
+            field.choices = list(field.choices)
+        return field
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        stats_filters = stats_filters_from_params(request.GET) if stats_available() else None
+        return RequestStatsPaginator(
+            queryset, per_page, orphans, allow_empty_first_page,
+            stats_filters=stats_filters,
+            estimate=settings.ADMIN_ESTIMATED_COUNT,
+            exact_limit=settings.ADMIN_EXACT_COUNT_LIMIT,
+        )
+
     def reply_status(self, obj):
         """Статус ответа на заявку"""
-        if obj.manager_notes and 'reply_sent' in obj.manager_notes:
+        notes = obj.manager_notes or ''
+        if REPLY_SENT in notes:
             return format_html('<span style="color: green;">✅ Отвечено</span>')
+        if REPLY_PENDING in notes:
+            return format_html('<span style="color: steelblue;">📤 Отправляется</span>')
+        if REPLY_FAILED in notes:
+            return format_html('<span style="color: red;">❌ Не доставлено</span>')
         return format_html('<span style="color: orange;">⏳ Ожидает ответа</span>')
 
     reply_status.short_description = 'Статус ответа'
 
     def save_model(self, request, obj, form, change):
+        # Новые заметки без метки считаются ответом - отправляем пользователю в фоне
+        notes = obj.manager_notes or ''
+        need_reply = notes and not any(marker in notes for marker in REPLY_MARKERS)
+        user = obj.user
+        if need_reply and user and user.telegram_id:
+            obj.manager_notes = f"{notes}\n\n{REPLY_PENDING}"
+        else:
+            need_reply = False
+
         super().save_model(request, obj, form, change)
-        # Если есть заметки и они изменились - возможно это ответ
-        if obj.manager_notes and 'reply_sent' not in obj.manager_notes:
-            # Отправляем пользователю уведомление
-            user = obj.user
-            if user and user.telegram_id:
-                message = f"📬 <b>Ответ на вашу заявку #{obj.id}</b>\n\n{obj.manager_notes}"
-                if send_telegram_message(user.telegram_id, message):
-                    # Помечаем, что ответ отправлен
-                    obj.manager_notes += "\n\n[reply_sent]"
-                    obj.save()
+
+        if need_reply:
+            # Уйдет после commit транзакции формы
+            message = f"📬 <b>Ответ на вашу заявку #{obj.id}</b>\n\n{notes}"
+            send_reply_in_background(obj, message)
 
 
 @admin.register(ContentCategory)
@@ -157,15 +249,20 @@ class ContentCategoryAdmin(admin.ModelAdmin):
     list_filter = ('is_active',)
     search_fields = ('name', 'description')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(items_total=Count('items'))
+
     def item_count(self, obj):
-        return obj.items.count()
+        return obj.items_total
 
     item_count.short_description = 'Кол-во позиций'
+    item_count.admin_order_field = 'items_total'
 
 
 @admin.register(ContentItem)
 class ContentItemAdmin(admin.ModelAdmin):
     list_display = ('name', 'category', 'price_display', 'order', 'is_active', 'created_at')
+    list_select_related = ('category',)
     list_editable = ('order', 'is_active')
     list_filter = ('category', 'is_active')
     search_fields = ('name', 'description')
@@ -177,6 +274,112 @@ class ContentItemAdmin(admin.ModelAdmin):
     price_display.short_description = 'Цена'
 
 
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'total_count', 'sent_count', 'failed_count',
+                    'blocked_count', 'progress', 'created_by', 'created_at')
+    list_select_related = ('created_by',)
+    list_display_links = ('id', 'name')
+    list_filter = ('status', ('created_at', DateRangeFilter))
+    search_fields = ('name', 'text')
+    readonly_fields = ('status', 'segment', 'total_count', 'sent_count', 'failed_count', 'blocked_count',
+                       'created_by', 'created_at', 'started_at', 'finished_at', 'recipients_link')
+    actions = [start_broadcast, pause_broadcast]
+
+    fieldsets = (
+        ('Сообщение', {
+            'fields': ('name', 'text')
+        }),
+        ('Получатели', {
+            'fields': ('segment', 'total_count')
+        }),
+        ('Статистика', {
+            'fields': ('status', 'sent_count', 'failed_count', 'blocked_count', 'recipients_link')
+        }),
+        ('Даты', {
+            'fields': ('created_by', 'created_at', 'started_at', 'finished_at')
+        }),
+    )
+
+    def progress(self, obj):
+        if not obj.total_count:
+            return '-'
+        done = obj.total_count - obj.pending_count
+        return f"{done * 100 // obj.total_count}%"
+
+    progress.short_description = 'Прогресс'
+
+    def recipients_link(self, obj):
+        url = reverse('admin:barsuk_app_broadcastrecipient_changelist')
+        return format_html('<a href="{}?broadcast__id__exact={}">Открыть список</a>', url, obj.id)
+
+    recipients_link.short_description = 'Получатели'
+
+    def save_model(self, request, obj, form, change):
+        if not obj.created_by_id:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(BroadcastRecipient)
+class BroadcastRecipientAdmin(admin.ModelAdmin):
+    list_display = ('id', 'broadcast', 'user', 'chat_id', 'status', 'attempts', 'error', 'sent_at')
+    list_filter = ('status', 'broadcast')
+    search_fields = ('chat_id', 'user__username')
+    list_select_related = ('broadcast', 'user')
+    readonly_fields = ('broadcast', 'user', 'chat_id', 'status', 'attempts', 'error', 'sent_at')
+    list_per_page = 100
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Outbox)
+class OutboxAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'target', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'kind', ('created_at', DateRangeFilter))
+    search_fields = ('target', 'last_error')
+    readonly_fields = ('kind', 'target', 'payload', 'status', 'attempts', 'next_attempt_at', 'last_error',
+                       'created_at', 'sent_at')
+    actions = [requeue_outbox]
+    list_per_page = 100
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'model', 'status', 'rows', 'download_link', 'created_by', 'created_at', 'finished_at')
+    list_select_related = ('created_by',)
+    list_filter = ('status', 'model')
+    readonly_fields = ('model', 'columns', 'status', 'rows', 'file', 'error', 'created_by', 'created_at',
+                       'finished_at')
+    exclude = ('params', 'pks', 'heartbeat_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        # Задания, потоки которых умерли вместе с процессом, не висят "Выполняется"
+        fail_stale_jobs()
+        return super().changelist_view(request, extra_context)
+
+    def get_queryset(self, request):
+        # Файлы выгрузок видны автору и суперпользователю
+        queryset = super().get_queryset(request)
+        if request.user.is_superuser:
+            return queryset
+        return queryset.filter(created_by=request.user)
+
+    def download_link(self, obj):
+        if obj.status != 'done' or not obj.file:
+            return '-'
+        return format_html('<a href="{}">⬇️ Скачать</a>', reverse('download_export', args=[obj.id]))
+
+    download_link.short_description = 'Файл'
+
+
 admin.site.site_header = "Панель управления БарсукЪ"
 admin.site.site_title = "Админ-панель БарсукЪ"
-admin.site.index_title = "Добро пожаловать в панель управления"
\ No newline at end of file
+admin.site.index_title = "Добро пожаловать в панель управления"
@@ -1,60 +1,61 @@
 from django.http import HttpResponseRedirect
 from django.urls import reverse
 from django.contrib import messages
-import requests
-import json
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Replace
+from django.utils import timezone
+import logging
+import threading
+
+from .broadcast import create_broadcast, run_broadcast, worker_alive
+from .exports import create_xlsx_job, stream_csv
+from .models import Request, UserStatus
+from .telegram_client import get_client
+
+logger = logging.getLogger(__name__)
 
 
 def send_telegram_message(telegram_id, text):
-    """Отправка сообщения пользователю через бота"""
-    print(f"\n📤 ФУНКЦИЯ send_telegram_message:")
-    print(f"   Telegram ID: {telegram_id}")
-    print(f"   Текст: {text[:50]}...")
-
-    try:
-        # Токен вашего бота
-        BOT_TOKEN = "8557869481:AAGM6AJ86Os6lbV_3Csydcrgo8hZpqtldtk"
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-
-        data = {
-            "chat_id": telegram_id,
-            "text": text,
-            "parse_mode": "HTML"
+    """Отправка сообщения пользователю через бота (синхронно, через общий пул соединений)"""
+    return get_client().send_message(telegram_id, text)
+
+
+# Метки статуса ответа в manager_notes
+REPLY_PENDING = '[reply_pending]'
+REPLY_SENT = '[reply_sent]'
+REPLY_FAILED = '[reply_failed]'
+REPLY_MARKERS = (REPLY_PENDING, REPLY_SENT, REPLY_FAILED)
+
+
+def send_reply_in_background(request_obj, message, on_sent_status=None):
+    """
+    Отправка ответа на заявку без ожидания Telegram.
+
+    Заявка должна быть сохранена с меткой [reply_pending] в заметках:
+    после отправки метка меняется на [reply_sent] или [reply_failed].
+    on_sent_status - статус заявки, который ставится при успешной отправке.
+
+    Отправка начинается после commit текущей транзакции (в админке save_model
+    идет внутри транзакции): иначе фоновый поток мог бы ждать блокировку строки
+    и не видеть сохраненного ответа.
+    """
+    request_id = request_obj.id
+    telegram_id = request_obj.user.telegram_id
+    client = get_client()
+
+    def on_done(ok):
+        # Замена метки одним UPDATE - заметки, сохраненные за время отправки, не затираются
+        fields = {
+            'manager_notes': Replace(F('manager_notes'), Value(REPLY_PENDING), Value(REPLY_SENT if ok else REPLY_FAILED)),
+            'updated_at': timezone.now(),
         }
+        if ok and on_sent_status:
+            fields['status'] = on_sent_status
+        Request.objects.filter(id=request_id).update(**fields)
+        logger.info("reply_delivery request_id=%s ok=%s", request_id, ok)
 
-        print(f"   URL: {url}")
-        print(f"   Данные: {json.dumps(data, ensure_ascii=False)}")
-
-        print("   Отправка запроса...")
-        response = requests.post(url, json=data, timeout=10)
-
-        print(f"   Статус ответа: {response.status_code}")
-        print(f"   Тело ответа: {response.text}")
-
-        # Проверяем ответ
-        if response.status_code == 200:
-            result = response.json()
-            if result.get('ok'):
-                print("   ✅ Успешно!")
-                return True
-            else:
-                print(f"   ❌ Ошибка API: {result}")
-                return False
-        else:
-            print(f"   ❌ HTTP ошибка: {response.status_code}")
-            return False
-
-    except requests.exceptions.Timeout:
-        print("   ❌ Таймаут")
-        return False
-    except requests.exceptions.ConnectionError:
-        print("   ❌ Ошибка соединения")
-        return False
-    except Exception as e:
-        print(f"   ❌ Исключение: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+    transaction.on_commit(lambda: client.send_message_background(telegram_id, message, callback=on_done))
 
 
 # Кастомное действие для админки - ЭТА ФУНКЦИЯ ДОЛЖНА БЫТЬ!
@@ -71,4 +72,103 @@ def reply_to_request(modeladmin, request, queryset):
         messages.warning(request, "Выберите одну заявку для ответа")
 
 
-reply_to_request.short_description = "📝 Ответить на заявку"
\ No newline at end of file
+reply_to_request.short_description = "📝 Ответить на заявку"
+
+
+# ====== РАССЫЛКИ ======
+
+def _segment_from_changelist(request):
+    """Фильтры списка пользователей, по которым выбраны получатели (для истории)"""
+    return {key: value for key, value in request.GET.items() if key not in ('p', 'o', 'q')}
+
+
+def create_broadcast_for_users(modeladmin, request, queryset):
+    """Создание черновика рассылки по выбранным пользователям (только активным, как segment_queryset)"""
+    # Заблокированным и не завершившим регистрацию/согласие не пишем
+    skipped = queryset.exclude(status=UserStatus.ACTIVE).count()
+    users = queryset.filter(status=UserStatus.ACTIVE)
+    if not users.exists():
+        messages.warning(request, f"Среди выбранных нет активных пользователей (пропущено {skipped})")
+        return
+
+    broadcast = create_broadcast(
+        name=f"Рассылка от {request.user.username}",
+        users=users,
+        segment=_segment_from_changelist(request),
+        created_by=request.user,
+    )
+    skipped_note = f" Пропущено неактивных пользователей: {skipped}." if skipped else ""
+    messages.success(
+        request,
+        f"Создана рассылка #{broadcast.id} на {broadcast.total_count} получателей.{skipped_note} "
+        f"Заполните текст и запустите отправку."
+    )
+    return HttpResponseRedirect(
+        reverse('admin:barsuk_app_broadcast_change', args=[broadcast.id])
+    )
+
+
+create_broadcast_for_users.short_description = "📣 Создать рассылку по выбранным"
+
+
+def start_broadcast(modeladmin, request, queryset):
+    """Запуск (или продолжение) рассылки в фоновом потоке"""
+    for broadcast in queryset:
+        if not broadcast.text:
+            messages.error(request, f"{broadcast}: не заполнен текст")
+            continue
+        if broadcast.status == 'done' or (broadcast.status == 'running' and worker_alive(broadcast)):
+            messages.warning(request, f"{broadcast}: уже {broadcast.get_status_display().lower()}")
+            continue
+
+        # Если прежний воркер еще дорабатывает пачку после паузы, он и продолжит:
+        # новый поток не получит аренду рассылки и сразу завершится
+        broadcast.status = 'running'
+        broadcast.save(update_fields=['status'])
+        threading.Thread(target=run_broadcast, args=(broadcast.id,), daemon=True).start()
+        messages.success(request, f"{broadcast}: отправка запущена")
+
+
+start_broadcast.short_description = "▶️ Запустить / продолжить"
+
+
+def pause_broadcast(modeladmin, request, queryset):
+    """Приостановка: воркер остановится после текущей пачки"""
+    updated = queryset.filter(status='running').update(status='paused')
+    messages.info(request, f"Приостановлено рассылок: {updated}")
+
+
+pause_broadcast.short_description = "⏸ Приостановить"
+
+
+# ====== OUTBOX ======
+
+def requeue_outbox(modeladmin, request, queryset):
+    """Повторная отправка недоставленных уведомлений"""
+    updated = queryset.filter(status='dead').update(
+        status='pending', attempts=0, next_attempt_at=timezone.now()
+    )
+    messages.success(request, f"Поставлено в повторную отправку: {updated}")
+
+
+requeue_outbox.short_description = "🔁 Отправить повторно"
+
+
+# ====== ВЫГРУЗКИ ======
+
+def export_csv(modeladmin, request, queryset):
+    """CSV без загрузки всего списка в память (колонки - modeladmin.export_columns)"""
+    return stream_csv(queryset, modeladmin.export_columns)
+
+
+export_csv.short_description = "📄 Выгрузить в CSV"
+
+
+def export_xlsx(modeladmin, request, queryset):
+    """XLSX собирается в фоне, файл появится в разделе «Выгрузки»"""
+    job = create_xlsx_job(modeladmin, request, modeladmin.export_columns)
+    messages.success(request, f"Выгрузка #{job.id} запущена, файл будет в разделе «Выгрузки»")
+    return HttpResponseRedirect(reverse('admin:barsuk_app_exportjob_changelist'))
+
+
+export_xlsx.short_description = "📊 Выгрузить в Excel (в фоне)"
@@ -4,4 +4,8 @@ from django.apps import AppConfig
 class BarsukAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'barsuk_app'
-    verbose_name = 'БарсукЪ Админка'
\ No newline at end of file
+    verbose_name = 'БарсукЪ Админка'
+
+    def ready(self):
+        # Подключаем сигналы (уведомления бота об изменениях)
+        from . import signals  # noqa: F401
@@ -0,0 +1,330 @@
+"""
+Массовые рассылки пользователям бота.
+
+Получатели фиксируются при создании рассылки (BroadcastRecipient), отправка
+идет асинхронным воркером с ограничением скорости. Повтор - только при 429
+и если соединение не открылось; таймаут, 5xx и нечитаемый ответ - ошибка
+получателя без повтора (Telegram мог уже доставить сообщение).
+Статус каждого получателя сохраняется в БД сразу после ответа Telegram,
+поэтому прерванную рассылку можно продолжить с того же места.
+
+Одну рассылку отправляет один воркер: он берет ее в аренду (worker_id +
+heartbeat_at) и продлевает аренду, пока работает. Повторный запуск при живом
+воркере ничего не делает; аренду умершего воркера можно забрать через
+BROADCAST_LEASE_SECONDS. Получатели, которые были в отправке у умершего
+воркера, помечаются ошибкой, а не отправляются повторно (доставка неизвестна).
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import timedelta
+
+import aiohttp
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+
+from .models import Broadcast, BroadcastRecipient, TelegramUser, UserStatus
+
+logger = logging.getLogger(__name__)
+
+
+# ====== СЕГМЕНТЫ ======
+
+def _parse_moment(value):
+    return parse_datetime(value) or parse_date(value)
+
+
+def segment_queryset(segment):
+    """
+    Выборка пользователей по описанию сегмента:
+    status, level, city (строка или список), last_activity_from/last_activity_to.
+    По умолчанию - только активные пользователи.
+    """
+    queryset = TelegramUser.objects.all()
+
+    statuses = segment.get('status') or [UserStatus.ACTIVE]
+    if isinstance(statuses, str):
+        statuses = [statuses]
+    queryset = queryset.filter(status__in=statuses)
+
+    for field in ('level', 'city'):
+        value = segment.get(field)
+        if value:
+            values = [value] if isinstance(value, str) else value
+            queryset = queryset.filter(**{f'{field}__in': values})
+
+    if segment.get('last_activity_from'):
+        queryset = queryset.filter(last_activity__gte=_parse_moment(segment['last_activity_from']))
+    if segment.get('last_activity_to'):
+        queryset = queryset.filter(last_activity__lte=_parse_moment(segment['last_activity_to']))
+
+    return queryset
+
+
+def create_broadcast(name, users, text='', segment=None, created_by=None, chunk_size=2000):
+    """Создание рассылки и списка получателей из queryset пользователей"""
+    broadcast = Broadcast.objects.create(
+        name=name,
+        text=text,
+        segment=segment or {},
+        created_by=created_by,
+    )
+
+    total = 0
+    chunk = []
+    for user_id, telegram_id in users.order_by('id').values_list('id', 'telegram_id').iterator(chunk_size=chunk_size):
+        chunk.append(BroadcastRecipient(broadcast=broadcast, user_id=user_id, chat_id=telegram_id))
+        if len(chunk) >= chunk_size:
+            BroadcastRecipient.objects.bulk_create(chunk, ignore_conflicts=True)
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        BroadcastRecipient.objects.bulk_create(chunk, ignore_conflicts=True)
+        total += len(chunk)
+
+    broadcast.total_count = total
+    broadcast.save(update_fields=['total_count'])
+    return broadcast
+
+
+# ====== ОГРАНИЧЕНИЕ СКОРОСТИ ======
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ChatRateLimiter:
+    """Не чаще одного сообщения в min_interval секунд в один чат"""
+
+    def __init__(self, min_interval=1.0):
+        self.min_interval = min_interval
+        self._last_sent = {}
+
+    async def acquire(self, chat_id):
+        last = self._last_sent.get(chat_id)
+        if last is not None:
+            delay = last + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self._last_sent[chat_id] = time.monotonic()
+
+
+# ====== ВОРКЕР ======
+
+def worker_alive(broadcast, lease=None):
+    """Есть ли у рассылки воркер со свежим heartbeat"""
+    lease = lease or settings.BROADCAST_LEASE_SECONDS
+    return bool(broadcast.worker_id and broadcast.heartbeat_at
+                and broadcast.heartbeat_at >= timezone.now() - timedelta(seconds=lease))
+
+
+class BroadcastWorker:
+    """Асинхронная отправка рассылки через Bot API"""
+
+    def __init__(self, broadcast_id, rate=None, concurrency=None, chunk_size=200, max_attempts=3,
+                 api_url=None, token=None, lease=None):
+        self.broadcast_id = broadcast_id
+        self.rate = rate or settings.BROADCAST_RATE
+        self.concurrency = concurrency or settings.BROADCAST_CONCURRENCY
+        self.chunk_size = chunk_size
+        self.max_attempts = max_attempts
+        self.api_url = (api_url or settings.TELEGRAM_API_URL).rstrip('/')
+        self.token = token or settings.TELEGRAM_BOT_TOKEN
+        if not self.token:
+            raise ImproperlyConfigured("TELEGRAM_TOKEN не задан в окружении")
+        self.lease = lease or settings.BROADCAST_LEASE_SECONDS
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self.global_limiter = TokenBucket(self.rate)
+        self.chat_limiter = ChatRateLimiter()
+        # Время, до которого Telegram попросил не слать ничего (429 retry_after)
+        self._flood_wait_until = 0.0
+
+    def _owned(self):
+        return Broadcast.objects.filter(id=self.broadcast_id, worker_id=self.worker_id)
+
+    async def _claim(self):
+        """Аренда рассылки: свободной или с протухшим heartbeat; False - ее уже отправляет другой воркер"""
+        now = timezone.now()
+        claimed = await Broadcast.objects.filter(
+            Q(worker_id='') | Q(heartbeat_at__isnull=True) | Q(heartbeat_at__lt=now - timedelta(seconds=self.lease)),
+            id=self.broadcast_id,
+        ).exclude(status='done').aupdate(status='running', worker_id=self.worker_id, heartbeat_at=now)
+        return claimed == 1
+
+    async def _should_stop(self):
+        """
+        Пауза из админки или потерянная аренда. Аренда снимается одним UPDATE
+        вместе с проверкой статуса: если рассылку успели запустить снова, воркер
+        продолжает сам, а не оставляет ее без воркера.
+        """
+        if await self._owned().exclude(status='running').aupdate(worker_id='', heartbeat_at=None):
+            return True
+        # Заодно продлеваем аренду; 0 строк - ее забрал другой воркер
+        return not await self._owned().aupdate(heartbeat_at=timezone.now())
+
+    async def _heartbeat(self):
+        """Продление аренды, пока идет пачка (при flood wait она может идти дольше lease)"""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            await self._owned().aupdate(heartbeat_at=timezone.now())
+
+    async def run(self):
+        broadcast = await Broadcast.objects.aget(id=self.broadcast_id)
+        if not broadcast.text:
+            raise ValueError(f"У рассылки #{broadcast.id} нет текста")
+
+        if not await self._claim():
+            logger.info("Рассылка #%s: уже отправляется другим воркером", broadcast.id)
+            return await Broadcast.objects.aget(id=broadcast.id)
+
+        # Кто остался в отправке у прошлого воркера - неизвестно, доставлено ли; повторно не шлем
+        interrupted = await BroadcastRecipient.objects.filter(broadcast_id=broadcast.id, status='sending').aupdate(
+            status='failed', error='Отправка прервана, доставка неизвестна')
+        if interrupted:
+            logger.warning("Рассылка #%s: %s получателей прерваны при отправке", broadcast.id, interrupted)
+
+        broadcast.status = 'running'
+        broadcast.started_at = broadcast.started_at or timezone.now()
+        await broadcast.asave(update_fields=['started_at'])
+        logger.info("Рассылка #%s: старт, получателей %s", broadcast.id, broadcast.total_count)
+
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            return await self._send_all(broadcast)
+        finally:
+            heartbeat.cancel()
+            await self._owned().aupdate(worker_id='', heartbeat_at=None)
+
+    async def _send_all(self, broadcast):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=settings.TELEGRAM_API_TIMEOUT)
+        async with aiohttp.ClientSession(timeout=timeout) as http:
+            while True:
+                # Рассылку могли приостановить из админки
+                if await self._should_stop():
+                    await self._update_counters(broadcast)
+                    await broadcast.arefresh_from_db(fields=['status'])
+                    logger.info("Рассылка #%s: остановлена (%s)", broadcast.id, broadcast.status)
+                    return broadcast
+
+                chunk = [
+                    recipient async for recipient in BroadcastRecipient.objects.filter(
+                        broadcast_id=broadcast.id, status='pending'
+                    ).order_by('id')[:self.chunk_size]
+                ]
+                if not chunk:
+                    break
+
+                async def deliver(recipient):
+                    async with semaphore:
+                        # Отметка до запроса: после падения воркера этот получатель не получит сообщение дважды
+                        recipient.status = 'sending'
+                        await recipient.asave(update_fields=['status'])
+                        await self._deliver(http, broadcast.text, recipient)
+                        await recipient.asave(update_fields=['status', 'attempts', 'error', 'sent_at'])
+
+                await asyncio.gather(*(deliver(recipient) for recipient in chunk))
+                await self._update_counters(broadcast)
+
+        broadcast.status = 'done'
+        broadcast.finished_at = timezone.now()
+        await self._owned().aupdate(status='done', finished_at=broadcast.finished_at)
+        await self._update_counters(broadcast)
+        logger.info("Рассылка #%s: завершена, доставлено %s из %s",
+                    broadcast.id, broadcast.sent_count, broadcast.total_count)
+        return broadcast
+
+    async def _update_counters(self, broadcast):
+        counts = {
+            row['status']: row['count']
+            async for row in BroadcastRecipient.objects.filter(broadcast_id=broadcast.id)
+            .values('status').annotate(count=Count('id'))
+        }
+        broadcast.sent_count = counts.get('sent', 0)
+        broadcast.failed_count = counts.get('failed', 0)
+        broadcast.blocked_count = counts.get('blocked', 0)
+        await broadcast.asave(update_fields=['sent_count', 'failed_count', 'blocked_count'])
+
+    async def _wait_flood(self):
+        delay = self._flood_wait_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _deliver(self, http, text, recipient):
+        url = f"{self.api_url}/bot{self.token}/sendMessage"
+        payload = {"chat_id": recipient.chat_id, "text": text, "parse_mode": "HTML"}
+
+        while recipient.attempts < self.max_attempts:
+            await self._wait_flood()
+            await self.global_limiter.acquire()
+            await self.chat_limiter.acquire(recipient.chat_id)
+            recipient.attempts += 1
+
+            try:
+                async with http.post(url, json=payload) as response:
+                    result = await response.json(content_type=None)
+                    status_code = response.status
+            except aiohttp.ClientConnectorError as e:
+                # Соединение не открылось - сообщение точно не ушло, можно повторить
+                recipient.error = f"{type(e).__name__}: {e}"[:255]
+                await asyncio.sleep(2 ** recipient.attempts)
+                continue
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                # Таймаут, обрыв или нечитаемый ответ: Telegram мог уже доставить - не повторяем
+                recipient.error = f"{type(e).__name__}: {e}"[:255]
+                recipient.status = 'failed'
+                return
+
+            if result.get('ok'):
+                recipient.status = 'sent'
+                recipient.sent_at = timezone.now()
+                recipient.error = ''
+                return
+
+            description = result.get('description', '')
+            recipient.error = f"{status_code}: {description}"[:255]
+
+            if status_code == 429:
+                # Flood control: ждем, сколько сказал Telegram, и пробуем снова (попытку не считаем)
+                retry_after = (result.get('parameters') or {}).get('retry_after', 5)
+                self._flood_wait_until = max(self._flood_wait_until, time.monotonic() + retry_after)
+                recipient.attempts -= 1
+                continue
+            if status_code == 403:
+                recipient.status = 'blocked'
+                return
+            # Остальные ошибки, в том числе 5xx (доставка неизвестна), не повторяем
+            recipient.status = 'failed'
+            return
+
+        recipient.status = 'failed'
+
+
+def run_broadcast(broadcast_id, **kwargs):
+    """Синхронный запуск воркера (для management-команды и фонового потока)"""
+    return asyncio.run(BroadcastWorker(broadcast_id, **kwargs).run())
@@ -0,0 +1,251 @@
+"""
+Хранение событий: месячные секции barsuk_app_event, удаление старых секций
+и сводка EventDailyRollup (число событий по дню и типу).
+
+Секции создаются миграцией 0005 и командой manage_event_partitions (запускать
+раз в день по cron). Аналитика читает сводку, а не сырые события.
+Границы месяцев и дней - в TIME_ZONE админки.
+"""
+import re
+from datetime import datetime, time, timedelta
+
+from django.contrib import admin
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Event, EventDailyRollup
+
+PARENT_TABLE = 'barsuk_app_event'
+DEFAULT_PARTITION = 'barsuk_app_event_default'
+PARTITION_RE = re.compile(r'^barsuk_app_event_p(\d{4})(\d{2})$')
+EVENT_COLUMNS = 'id, event_type, event_data, created_at, user_id'
+
+
+def month_start(value):
+    """Начало месяца (aware datetime) для даты или времени"""
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return timezone.make_aware(datetime(value.year, value.month, 1))
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return timezone.make_aware(datetime(index // 12, index % 12 + 1, 1))
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def partition_name(month):
+    return f'barsuk_app_event_p{month:%Y%m}'
+
+
+def partitioning_available():
+    """Секционирование есть только в PostgreSQL после миграции 0005"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [PARENT_TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def list_partitions():
+    """Месячные секции: [(начало месяца, имя)] по возрастанию"""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+        """, [PARENT_TABLE])
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            month = timezone.make_aware(datetime(int(match.group(1)), int(match.group(2)), 1))
+            partitions.append((month, name))
+    return sorted(partitions)
+
+
+def create_partition(month):
+    """
+    Секция на месяц. События этого месяца, попавшие в секцию по умолчанию,
+    переносятся в нее. Возвращает число перенесенных событий.
+
+    Секция по умолчанию блокируется до конца транзакции: иначе событие,
+    вставленное между переносом и ATTACH PARTITION, нарушило бы ограничение
+    новой секции, и ATTACH упал бы. ATTACH при наличии секции по умолчанию
+    тоже ее блокирует, поэтому на время переноса вставка событий ждет -
+    ensure_partitions создает секции заранее, и обычно переносить нечего.
+    """
+    name = partition_name(month)
+    upper = add_months(month, 1)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {DEFAULT_PARTITION} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS)")
+        cursor.execute(f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE created_at >= %s AND created_at < %s
+                RETURNING {EVENT_COLUMNS}
+            )
+            INSERT INTO {name} ({EVENT_COLUMNS}) SELECT {EVENT_COLUMNS} FROM moved
+        """, [month, upper])
+        moved = cursor.rowcount
+        cursor.execute(
+            f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+    return moved
+
+
+def default_partition_months():
+    """Месяцы, события которых лежат в секции по умолчанию"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT min(created_at), max(created_at) FROM {DEFAULT_PARTITION}")
+        first, last = cursor.fetchone()
+    if first is None:
+        return []
+
+    months = []
+    month = month_start(first)
+    while month <= month_start(last):
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def ensure_partitions(ahead=3, dry_run=False):
+    """Секции на текущий месяц и ahead месяцев вперед. Возвращает [(имя, перенесено событий)]"""
+    existing = {month for month, name in list_partitions()}
+    current = month_start(timezone.now())
+    wanted = {add_months(current, offset) for offset in range(ahead + 1)}
+    wanted.update(default_partition_months())
+
+    created = []
+    for month in sorted(wanted - existing):
+        moved = 0 if dry_run else create_partition(month)
+        created.append((partition_name(month), moved))
+    return created
+
+
+def drop_old_partitions(retention_months, dry_run=False):
+    """
+    Удаление событий старше retention_months полных месяцев: в PostgreSQL -
+    DROP TABLE секций, иначе - DELETE. Перед удалением дни досчитываются в
+    сводку, поэтому статистика за эти дни сохраняется.
+    Возвращает [(имя секции или диапазон, число дней в сводке)].
+    """
+    cutoff = add_months(month_start(timezone.now()), -retention_months)
+
+    if not partitioning_available():
+        first = Event.objects.aggregate(first=Min('created_at'))['first']
+        if first is None or first >= cutoff:
+            return []
+        label = f"события до {cutoff:%Y-%m-%d}"
+        if dry_run:
+            return [(label, 0)]
+        days = rollup_events(since=timezone.localdate(first), until=cutoff.date() - timedelta(days=1))
+        Event.objects.filter(created_at__lt=cutoff).delete()
+        return [(label, days)]
+
+    dropped = []
+    for month, name in list_partitions():
+        if month >= cutoff:
+            break
+        if dry_run:
+            dropped.append((name, 0))
+            continue
+        last_day = add_months(month, 1).date() - timedelta(days=1)
+        days = rollup_events(since=month.date(), until=last_day)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {name}")
+        dropped.append((name, days))
+
+    if not dry_run:
+        # Старые события, попавшие в секцию по умолчанию
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT min(created_at) FROM {DEFAULT_PARTITION} WHERE created_at < %s", [cutoff])
+            first = cursor.fetchone()[0]
+        if first is not None:
+            rollup_events(since=timezone.localdate(first), until=cutoff.date() - timedelta(days=1))
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {DEFAULT_PARTITION} WHERE created_at < %s", [cutoff])
+    return dropped
+
+
+def rollup_events(since=None, until=None):
+    """
+    Пересчет сводки EventDailyRollup за дни [since, until].
+
+    По умолчанию - с последнего дня в сводке (он мог быть посчитан не
+    полностью) по сегодня. Дни раньше самого старого хранимого события не
+    пересчитываются, иначе сводка за удаленные секции обнулилась бы.
+    Возвращает число пересчитанных дней.
+    """
+    first = Event.objects.aggregate(first=Min('created_at'))['first']
+    if first is None:
+        return 0
+    first_day = timezone.localdate(first)
+
+    if since is None:
+        since = EventDailyRollup.objects.aggregate(day=Max('day'))['day'] or first_day
+    since = max(since, first_day)
+    until = until or timezone.localdate()
+    if since > until:
+        return 0
+
+    rows = (
+        Event.objects
+        .filter(created_at__gte=day_start(since), created_at__lt=day_start(until + timedelta(days=1)))
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'event_type')
+        .annotate(total=Count('id'), user_total=Count('user', distinct=True))
+        .order_by()
+    )
+    with transaction.atomic():
+        # Дни пересчитываются целиком: типы, которых в дне больше нет, тоже уходят
+        EventDailyRollup.objects.filter(day__gte=since, day__lte=until).delete()
+        EventDailyRollup.objects.bulk_create([
+            EventDailyRollup(day=row['day'], event_type=row['event_type'],
+                             count=row['total'], users=row['user_total'])
+            for row in rows
+        ], batch_size=1000)
+    return (until - since).days + 1
+
+
+def event_counts(event_types=None, date_from=None, date_to=None):
+    """Число событий по типам за период - из сводки, без чтения barsuk_app_event"""
+    rows = EventDailyRollup.objects.all()
+    if event_types is not None:
+        rows = rows.filter(event_type__in=event_types)
+    if date_from is not None:
+        rows = rows.filter(day__gte=date_from)
+    if date_to is not None:
+        rows = rows.filter(day__lte=date_to)
+    totals = rows.values('event_type').annotate(total=Sum('count')).order_by()
+    return {row['event_type']: row['total'] for row in totals}
+
+
+class EventTypeFilter(admin.SimpleListFilter):
+    """Фильтр по типу события; список типов берется из сводки, а не DISTINCT по всем событиям"""
+    title = 'Тип события'
+    parameter_name = 'event_type'
+
+    def lookups(self, request, model_admin):
+        types = EventDailyRollup.objects.values_list('event_type', flat=True).distinct().order_by('event_type')
+        if not types:
+            # Сводка еще не считалась
+            types = Event.objects.values_list('event_type', flat=True).distinct().order_by('event_type')
+        return [(event_type, event_type) for event_type in types]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(event_type=self.value())
+        return queryset
+
@@ -0,0 +1,188 @@
+"""
+Потоковая выгрузка списков из админки.
+
+Строки читаются серверным курсором (QuerySet.iterator(chunk_size=...)), в
+памяти одновременно только одна пачка:
+- CSV отдается сразу через StreamingHttpResponse;
+- XLSX пишется в фоне (openpyxl write-only) в MEDIA_ROOT/exports, ссылка на
+  файл - в списке "Выгрузки" (ExportJob).
+
+Задание XLSX хранит не запрос, а параметры списка админки и выбранные id:
+строки заново выбирает тот же ModelAdmin от имени автора выгрузки. Поток
+выгрузки живет в процессе админки; если процесс перезапустили, задание
+без heartbeat помечается ошибкой (fail_stale_jobs).
+"""
+import csv
+import json
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.db import connections
+from django.http import HttpRequest, QueryDict, StreamingHttpResponse
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+# Строк данных на лист XLSX (плюс заголовок)
+XLSX_SHEET_ROWS = 1048575
+# Как часто поток выгрузки продлевает heartbeat и через сколько задание считается брошенным, секунд
+HEARTBEAT_INTERVAL = 30
+STALE_AFTER = 120
+# Параметры списка, которые не влияют на выборку строк
+IGNORED_PARAMS = {'p', 'e', '_changelist_filters'}
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: строка сразу уходит в ответ"""
+
+    def write(self, value):
+        return value
+
+
+def format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if hasattr(value, 'tzinfo') and value.tzinfo is not None:
+        return timezone.localtime(value).strftime('%d.%m.%Y %H:%M:%S')
+    return value
+
+
+def iter_rows(queryset, columns):
+    """Строки выгрузки: только нужные колонки, пачками по EXPORT_CHUNK_SIZE"""
+    paths = [path for header, path in columns]
+    for row in queryset.values_list(*paths).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        yield [format_value(value) for value in row]
+
+
+def export_filename(queryset, extension):
+    return f"{queryset.model._meta.model_name}_{timezone.localtime():%Y%m%d_%H%M}.{extension}"
+
+
+def stream_csv(queryset, columns):
+    """CSV-ответ, который пишется по мере чтения строк из БД"""
+    writer = csv.writer(Echo())
+
+    def rows():
+        # BOM - чтобы Excel открыл UTF-8 с кириллицей
+        yield '\ufeff' + writer.writerow([header for header, path in columns])
+        for row in iter_rows(queryset, columns):
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(rows(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(queryset, "csv")}"'
+    return response
+
+
+def create_xlsx_job(modeladmin, request, columns):
+    """
+    Задание на XLSX-выгрузку выбранных в списке строк. При "выбрать все"
+    сохраняются только параметры списка - выгрузка всех событий не раздувает задание.
+    """
+    fail_stale_jobs()
+    select_across = request.POST.get('select_across') == '1'
+    job = ExportJob.objects.create(
+        model=modeladmin.model._meta.label_lower,
+        params={key: values for key, values in request.GET.lists() if key not in IGNORED_PARAMS},
+        pks=None if select_across else request.POST.getlist(ACTION_CHECKBOX_NAME),
+        columns=[list(column) for column in columns],
+        created_by=request.user,
+        heartbeat_at=timezone.now(),
+    )
+    threading.Thread(target=run_export_job, args=(job.id,), daemon=True).start()
+    return job
+
+
+def job_queryset(job):
+    """Строки задания: список админки с сохраненными параметрами от имени автора"""
+    if job.created_by is None:
+        raise ValueError("Автор выгрузки удален")
+    request = HttpRequest()
+    request.method = 'GET'
+    request.GET = QueryDict(mutable=True)
+    for key, values in job.params.items():
+        request.GET.setlist(key, values)
+    request.user = job.created_by
+
+    model_admin = admin.site.get_model_admin(apps.get_model(job.model))
+    queryset = model_admin.get_changelist_instance(request).get_queryset(request)
+    if job.pks is not None:
+        queryset = queryset.filter(pk__in=job.pks)
+    return queryset
+
+
+def fail_stale_jobs():
+    """Задания, поток которых перестал продлевать heartbeat (процесс перезапущен), - в ошибку"""
+    cutoff = timezone.now() - timedelta(seconds=STALE_AFTER)
+    return ExportJob.objects.filter(status__in=('pending', 'running')).exclude(heartbeat_at__gte=cutoff).update(
+        status='failed', error='Выгрузка прервана перезапуском админки', finished_at=timezone.now())
+
+
+def _heartbeat(job_id, stop):
+    try:
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            ExportJob.objects.filter(id=job_id).update(heartbeat_at=timezone.now())
+    finally:
+        connections.close_all()
+
+
+def run_export_job(job_id):
+    """Выполнение задания в фоновом потоке"""
+    job = ExportJob.objects.select_related('created_by').get(id=job_id)
+    job.status = 'running'
+    job.heartbeat_at = timezone.now()
+    job.save(update_fields=['status', 'heartbeat_at'])
+    path = None
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job.id, stop), daemon=True).start()
+
+    try:
+        queryset = job_queryset(job)
+
+        name = os.path.join('exports', f"{job.id}_{export_filename(queryset, 'xlsx')}")
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write-only: строки сбрасываются во временный файл, а не копятся в памяти
+        workbook = Workbook(write_only=True)
+        title = str(queryset.model._meta.verbose_name_plural)[:25]
+        headers = [header for header, column in job.columns]
+        sheet = None
+        rows = 0
+        for row in iter_rows(queryset, job.columns):
+            if rows % XLSX_SHEET_ROWS == 0:
+                # В листе Excel не больше 1 048 576 строк - дальше новый лист
+                sheet = workbook.create_sheet(f"{title} {rows // XLSX_SHEET_ROWS + 1}")
+                sheet.append(headers)
+            sheet.append(row)
+            rows += 1
+            if rows % 50000 == 0:
+                ExportJob.objects.filter(id=job.id).update(rows=rows)
+        if sheet is None:
+            workbook.create_sheet(title).append(headers)
+        workbook.save(path)
+
+        job.file.name = name
+        job.rows = rows
+        job.status = 'done'
+    except Exception as e:
+        logger.exception("Выгрузка %s не удалась", job.id)
+        if path and os.path.exists(path):
+            os.remove(path)
+        job.status = 'failed'
+        job.error = str(e)[:1000]
+    finally:
+        stop.set()
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'rows', 'file', 'error', 'finished_at'])
+        connections.close_all()
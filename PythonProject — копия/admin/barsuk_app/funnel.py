@@ -0,0 +1,230 @@
+"""
+Воронка регистрации и удержание по когортам.
+
+Сырые события не сканируются при каждом открытии отчета: refresh_funnel
+обрабатывает только события новее отметки (AggregationWatermark) и
+обновляет FunnelUserProgress (первое время каждого шага у пользователя) и
+UserActiveDay (дни активности). Отчет считается по этим таблицам.
+Обновление - командой refresh_funnel по cron или кнопкой на странице отчета.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Max, Q
+from django.utils import timezone
+
+from .models import AggregationWatermark, Event, FunnelUserProgress, UserActiveDay
+
+WATERMARK_NAME = 'funnel'
+
+# Тип события -> поле FunnelUserProgress, название шага. Порядок - порядок воронки
+FUNNEL_STEPS = [
+    ('bot_start', 'bot_start_at', 'Старт бота'),
+    ('age_confirmed', 'age_confirmed_at', 'Подтвердил 18+'),
+    ('consent_accepted', 'consent_accepted_at', 'Принял согласие'),
+    ('phone_captured', 'phone_captured_at', 'Оставил телефон'),
+    ('menu_opened', 'menu_opened_at', 'Открыл меню'),
+    ('transfer_requested', 'transfer_requested_at', 'Начал заявку на трансфер'),
+    ('transfer_request_submitted', 'transfer_submitted_at', 'Отправил заявку'),
+]
+STEP_FIELDS = {event_type: field for event_type, field, label in FUNNEL_STEPS}
+STEP_FIELDS['age_failed'] = 'age_failed_at'
+
+# Удержание: доля когорты, вернувшаяся на N-й день
+RETENTION_DAYS = (1, 7, 30)
+
+
+def _watermark(for_update=False):
+    AggregationWatermark.objects.get_or_create(name=WATERMARK_NAME)
+    queryset = AggregationWatermark.objects.select_for_update() if for_update else AggregationWatermark.objects
+    return queryset.get(name=WATERMARK_NAME)
+
+
+def refresh_funnel(batch_size=5000, max_batches=None, lag=None):
+    """
+    Обработать события новее отметки. Возвращает число обработанных событий.
+
+    События моложе lag секунд не берутся: id выдаются при вставке, а
+    коммит бывает позже, и событие с меньшим id могло бы проскочить отметку.
+    """
+    lag = settings.FUNNEL_LAG_SECONDS if lag is None else lag
+    processed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        now = timezone.now()
+        count = _refresh_batch(batch_size, now - timedelta(seconds=lag), now + timedelta(seconds=lag))
+        processed += count
+        batches += 1
+        if count < batch_size:
+            break
+    return processed
+
+
+def _refresh_batch(batch_size, before, future):
+    with transaction.atomic():
+        # Блокировка отметки - два обновления одновременно не обработают одни и те же события
+        watermark = _watermark(for_update=True)
+        events = list(
+            Event.objects
+            .filter(id__gt=watermark.last_event_id)
+            .order_by('id')
+            .values_list('id', 'user_id', 'event_type', 'created_at')[:batch_size]
+        )
+        # Отметка двигается только по непрерывному началу: на первом свежем событии стоп.
+        # Время далеко в будущем (импорт, сбитые часы) не ждем - такие события не "в полете"
+        for index, (_, _, _, created_at) in enumerate(events):
+            if before <= created_at <= future:
+                events = events[:index]
+                break
+        if not events:
+            return 0
+
+        user_ids = {user_id for _, user_id, _, _ in events}
+        progress = {p.user_id: p for p in FunnelUserProgress.objects.filter(user_id__in=user_ids)}
+        created = {}
+        changed = set()
+        active_days = {}
+
+        for event_id, user_id, event_type, created_at in events:
+            day = timezone.localdate(created_at)
+            item = progress.get(user_id)
+            if item is None:
+                item = FunnelUserProgress(user_id=user_id, cohort_day=day)
+                progress[user_id] = created[user_id] = item
+
+            field = STEP_FIELDS.get(event_type)
+            if field is not None:
+                current = getattr(item, field)
+                if current is None or created_at < current:
+                    setattr(item, field, created_at)
+                    changed.add(user_id)
+
+            active_days[(user_id, day)] = UserActiveDay(
+                user_id=user_id, day=day, cohort_day=item.cohort_day,
+                day_offset=(day - item.cohort_day).days,
+            )
+
+        FunnelUserProgress.objects.bulk_create(created.values(), batch_size=1000)
+        updated = [progress[user_id] for user_id in changed - created.keys()]
+        FunnelUserProgress.objects.bulk_update(updated, sorted(set(STEP_FIELDS.values())), batch_size=1000)
+        UserActiveDay.objects.bulk_create(active_days.values(), batch_size=1000, ignore_conflicts=True)
+
+        watermark.last_event_id = events[-1][0]
+        watermark.last_event_at = max(created_at for _, _, _, created_at in events)
+        watermark.save()
+    return len(events)
+
+
+def funnel_freshness():
+    """До какого события посчитан отчет и сколько примерно событий еще не обработано"""
+    watermark = _watermark()
+    max_id = Event.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+    return {
+        'updated_at': watermark.updated_at,
+        'last_event_at': watermark.last_event_at,
+        'backlog': max(0, max_id - watermark.last_event_id),
+    }
+
+
+def _step_aggregates():
+    """
+    Шаг считается пройденным, если пройдены и все предыдущие, поэтому число
+    дошедших не растет от шага к шагу (меню, например, открывают и без регистрации).
+    """
+    aggregates = {'age_failed_count': Count('age_failed_at')}
+    passed = Q()
+    previous = None
+    for _, field, _ in FUNNEL_STEPS:
+        passed &= Q(**{f'{field}__isnull': False})
+        aggregates[f'{field}_count'] = Count('id', filter=passed)
+        if previous is not None:
+            # Среднее время от предыдущего шага
+            aggregates[f'{field}_time'] = Avg(
+                ExpressionWrapper(F(field) - F(previous), output_field=DurationField()),
+                filter=passed,
+            )
+        previous = field
+    return aggregates
+
+
+def _format_duration(value):
+    if value is None:
+        return ''
+    minutes = int(value.total_seconds() // 60)
+    if minutes < 1:
+        return f"{int(value.total_seconds())} с"
+    if minutes < 60:
+        return f"{minutes} мин"
+    if minutes < 24 * 60:
+        return f"{minutes // 60} ч {minutes % 60} мин"
+    return f"{minutes // (24 * 60)} д {minutes % (24 * 60) // 60} ч"
+
+
+def _percent(part, total):
+    return round(part * 100 / total, 1) if total else None
+
+
+def _steps(row):
+    """Шаги воронки: сколько дошло, конверсия, отвал и время от предыдущего шага"""
+    steps = []
+    first = row[f'{FUNNEL_STEPS[0][1]}_count']
+    previous = None
+    for event_type, field, label in FUNNEL_STEPS:
+        reached = row[f'{field}_count']
+        steps.append({
+            'event_type': event_type,
+            'label': label,
+            'reached': reached,
+            'conversion': _percent(reached, previous) if previous is not None else None,
+            'total_conversion': _percent(reached, first),
+            'dropoff': previous - reached if previous is not None else None,
+            'time_from_previous': _format_duration(row.get(f'{field}_time')),
+        })
+        previous = reached
+    return steps
+
+
+def funnel_report(date_from, date_to):
+    """Воронка за когорты [date_from, date_to] и по каждому дню когорты, с удержанием"""
+    progress = FunnelUserProgress.objects.filter(cohort_day__gte=date_from, cohort_day__lte=date_to)
+    aggregates = _step_aggregates()
+
+    total = progress.aggregate(users=Count('id'), **aggregates)
+    daily = progress.values('cohort_day').annotate(users=Count('id'), **aggregates).order_by('-cohort_day')
+
+    retention = {}
+    rows = (
+        UserActiveDay.objects
+        .filter(cohort_day__gte=date_from, cohort_day__lte=date_to, day_offset__in=RETENTION_DAYS)
+        .values('cohort_day', 'day_offset')
+        .annotate(users=Count('id'))
+        .order_by()
+    )
+    for row in rows:
+        retention[(row['cohort_day'], row['day_offset'])] = row['users']
+
+    today = timezone.localdate()
+    cohorts = []
+    for row in daily:
+        cohort_day = row['cohort_day']
+        cohorts.append({
+            'day': cohort_day,
+            'users': row['users'],
+            'age_failed': row['age_failed_count'],
+            'steps': _steps(row),
+            'retention': [
+                # Для слишком молодых когорт день N еще не наступил
+                _percent(retention.get((cohort_day, offset), 0), row['users'])
+                if cohort_day + timedelta(days=offset) <= today else None
+                for offset in RETENTION_DAYS
+            ],
+        })
+
+    return {
+        'users': total['users'],
+        'age_failed': total['age_failed_count'],
+        'steps': _steps(total),
+        'cohorts': cohorts,
+        'retention_days': RETENTION_DAYS,
+    }
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from barsuk_app.event_store import drop_old_partitions, ensure_partitions, partitioning_available
+
+
+class Command(BaseCommand):
+    help = "Месячные секции событий: создание на несколько месяцев вперед и удаление старых"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=settings.EVENT_PARTITIONS_AHEAD,
+                            help="Сколько месяцев вперед держать секции")
+        parser.add_argument('--retention', type=int, default=settings.EVENT_RETENTION_MONTHS,
+                            help="Сколько полных месяцев хранить события (0 - не удалять)")
+        parser.add_argument('--dry-run', action='store_true', help="Только показать, что будет сделано")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        if partitioning_available():
+            for name, moved in ensure_partitions(options['ahead'], dry_run=dry_run):
+                self.stdout.write(f"Секция {name} создана" + (f", перенесено событий: {moved}" if moved else ""))
+        else:
+            self.stdout.write(self.style.WARNING("Таблица событий не секционирована, создавать секции не нужно"))
+
+        if options['retention'] > 0:
+            for name, days in drop_old_partitions(options['retention'], dry_run=dry_run):
+                self.stdout.write(f"Удалено: {name} (дней в сводке: {days})")
+
+        self.stdout.write(self.style.SUCCESS("Готово" + (" (dry run)" if dry_run else "")))
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from barsuk_app.profiler import request_trigger
+
+
+class Command(BaseCommand):
+    help = "Включить профилирование view во всех процессах админки (без перезапуска)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=settings.PROFILE_SECONDS,
+                            help="Длительность окна, секунд (не больше PROFILE_MAX_SECONDS)")
+        parser.add_argument('--stop', action='store_true', help="Остановить досрочно")
+
+    def handle(self, *args, **options):
+        if options['stop']:
+            request_trigger(0)
+            self.stdout.write(self.style.SUCCESS("Профилирование будет остановлено в течение секунды"))
+            return
+
+        seconds = min(options['seconds'], settings.PROFILE_MAX_SECONDS)
+        request_trigger(seconds)
+        self.stdout.write(self.style.SUCCESS(
+            f"Профилирование включено на {seconds:.0f} с. Процессы начнут с первым запросом, "
+            f"результаты - в {settings.PROFILE_DIR}"
+        ))
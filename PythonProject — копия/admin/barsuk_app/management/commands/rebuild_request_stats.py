@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from barsuk_app.request_stats import rebuild_request_stats
+
+
+class Command(BaseCommand):
+    help = "Пересчет сводной таблицы заявок по дням (RequestDailyStat)"
+
+    def handle(self, *args, **options):
+        rows = rebuild_request_stats()
+        self.stdout.write(self.style.SUCCESS(f"Сводная таблица пересчитана: {rows} строк"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from barsuk_app.funnel import refresh_funnel
+
+
+class Command(BaseCommand):
+    help = "Обработка новых событий для воронки и удержания (запускать по cron раз в несколько минут)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--max-batches', type=int, default=None, help="Ограничение числа пачек за запуск")
+
+    def handle(self, *args, **options):
+        processed = refresh_funnel(batch_size=options['batch_size'], max_batches=options['max_batches'])
+        self.stdout.write(self.style.SUCCESS(f"Обработано событий: {processed}"))
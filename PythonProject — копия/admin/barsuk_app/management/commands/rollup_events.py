@@ -0,0 +1,18 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from barsuk_app.event_store import rollup_events
+
+
+class Command(BaseCommand):
+    help = "Пересчет сводки событий по дням (EventDailyRollup)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat,
+                            help="С какого дня (YYYY-MM-DD), по умолчанию - с последнего дня в сводке")
+        parser.add_argument('--until', type=date.fromisoformat, help="По какой день (YYYY-MM-DD), по умолчанию - сегодня")
+
+    def handle(self, *args, **options):
+        days = rollup_events(since=options['since'], until=options['until'])
+        self.stdout.write(self.style.SUCCESS(f"Сводка событий пересчитана: {days} дней"))
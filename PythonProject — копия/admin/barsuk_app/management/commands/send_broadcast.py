@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from barsuk_app.broadcast import create_broadcast, run_broadcast, segment_queryset
+from barsuk_app.models import Broadcast
+
+
+class Command(BaseCommand):
+    help = "Создание и отправка рассылки по сегменту пользователей (или продолжение прерванной)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--resume', type=int, metavar='ID', help="Продолжить рассылку с указанным ID")
+        parser.add_argument('--name', default="Рассылка из консоли")
+        parser.add_argument('--text', help="Текст сообщения (HTML)")
+        parser.add_argument('--text-file', help="Файл с текстом сообщения")
+
+        # Сегмент
+        parser.add_argument('--status', action='append', help="Статус пользователя (можно несколько раз)")
+        parser.add_argument('--level', action='append', help="Уровень лояльности")
+        parser.add_argument('--city', action='append', help="Город")
+        parser.add_argument('--active-from', help="Последняя активность не раньше (YYYY-MM-DD)")
+        parser.add_argument('--active-to', help="Последняя активность не позже (YYYY-MM-DD)")
+
+        parser.add_argument('--rate', type=int, help="Сообщений в секунду (по умолчанию BROADCAST_RATE)")
+        parser.add_argument('--dry-run', action='store_true', help="Только посчитать получателей")
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            try:
+                broadcast = Broadcast.objects.get(id=options['resume'])
+            except Broadcast.DoesNotExist:
+                raise CommandError(f"Рассылка #{options['resume']} не найдена")
+            if broadcast.status == 'done':
+                raise CommandError(f"{broadcast} уже завершена")
+        else:
+            text = options['text']
+            if options['text_file']:
+                with open(options['text_file'], encoding='utf-8') as f:
+                    text = f.read()
+            if not text:
+                raise CommandError("Укажите --text или --text-file")
+
+            segment = {
+                'status': options['status'],
+                'level': options['level'],
+                'city': options['city'],
+                'last_activity_from': options['active_from'],
+                'last_activity_to': options['active_to'],
+            }
+            segment = {key: value for key, value in segment.items() if value}
+            users = segment_queryset(segment)
+
+            if options['dry_run']:
+                self.stdout.write(f"Получателей: {users.count()}")
+                return
+
+            broadcast = create_broadcast(options['name'], users, text=text, segment=segment)
+            self.stdout.write(f"Создана {broadcast}, получателей: {broadcast.total_count}")
+
+        broadcast = run_broadcast(broadcast.id, rate=options['rate'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{broadcast}: {broadcast.get_status_display()}. "
+            f"Доставлено {broadcast.sent_count}, ошибок {broadcast.failed_count}, "
+            f"заблокировали {broadcast.blocked_count}, осталось {broadcast.pending_count}"
+        ))
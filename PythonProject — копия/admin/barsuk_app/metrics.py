@@ -0,0 +1,191 @@
+"""
+Метрики админки в формате Prometheus (/metrics, views.metrics_view): время
+и ответы по view и вызовы Bot API из telegram_client (send_telegram_message,
+ответы на заявки, рассылки). Имена и формат - как у /metrics бота.
+
+Админка работает в нескольких потоках, поэтому у каждой метрики одна
+блокировка на словарь серий и их значения: число серий ограничено числом
+сочетаний меток и не растет с числом потоков, инкременты не теряются.
+Блокировка без конкуренции стоит доли микросекунды - на фоне запроса к
+админке это незаметно. Метрики - на процесс: при нескольких воркерах
+gunicorn каждый отдает свои.
+
+Формат и классы повторяют app/utils/metrics.py, но общий код не вынесен:
+админка запускается из admin/ отдельным процессом и не видит пакет бота
+(общего пакета, который ставился бы в оба окружения, в проекте нет), а
+модуль бота импортирует aiogram и aiohttp и рассчитан на один поток event
+loop без блокировок. Совпадают только форматирование и корзины - при
+изменении формата правятся оба файла.
+"""
+import bisect
+import threading
+import time
+
+# Границы корзин гистограмм, секунд
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return '+Inf' if value == float('inf') else repr(value)
+    return str(value)
+
+
+class CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self, lock):
+        self._lock = lock
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, lock, buckets):
+        self._lock = lock
+        self.buckets = buckets
+        # Последняя корзина - значения больше всех границ (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Metric:
+    """Метрика с метками; серия создается при первом обращении и дальше берется из словаря"""
+    type = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Одна блокировка на словарь серий и значения всех серий метрики
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def _new_child(self):
+        return CounterChild(self._lock)
+
+    def samples(self):
+        with self._lock:
+            snapshot = [(values, child.value) for values, child in self._children.items()]
+        for values, value in snapshot:
+            yield self.name + '_total', _format_labels(self.labelnames, values), value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return HistogramChild(self._lock, self.buckets)
+
+    def samples(self):
+        # Корзины и сумма серии снимаются вместе - _count и _sum согласованы
+        with self._lock:
+            snapshot = [(values, list(child.counts), child.sum) for values, child in self._children.items()]
+        for values, counts, total_sum in snapshot:
+            total = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                total += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                yield self.name + '_bucket', _format_labels(self.labelnames, values, le), total
+            labels = _format_labels(self.labelnames, values)
+            yield self.name + '_sum', labels, total_sum
+            yield self.name + '_count', labels, total
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            family = metric.name + '_total' if metric.type == 'counter' else metric.name
+            lines.append(f'# HELP {family} {metric.documentation}')
+            lines.append(f'# TYPE {family} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+HTTP_DURATION = registry.histogram(
+    'barsuk_admin_http_duration_seconds', 'Время ответа админки', ['view', 'method'])
+HTTP_RESPONSES = registry.counter('barsuk_admin_http_responses', 'Ответы админки по статусу', ['view', 'status'])
+HTTP_EXCEPTIONS = registry.counter('barsuk_admin_http_exceptions', 'Исключения во view', ['view', 'error'])
+TELEGRAM_DURATION = registry.histogram(
+    'barsuk_admin_telegram_duration_seconds', 'Время вызова Bot API из админки (с повторами)', ['method'])
+TELEGRAM_ERRORS = registry.counter(
+    'barsuk_admin_telegram_errors', 'Неудачные вызовы Bot API из админки', ['method', 'error'])
+
+
+def _view_name(request):
+    match = request.resolver_match
+    return match.view_name if match is not None else 'unresolved'
+
+
+class MetricsMiddleware:
+    """Время и статус каждого ответа по имени view (первым в MIDDLEWARE - учитывает все остальные)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        view = _view_name(request)
+        HTTP_DURATION.labels(view, request.method).observe(time.perf_counter() - started)
+        HTTP_RESPONSES.labels(view, response.status_code).inc()
+        return response
+
+    def process_exception(self, request, exception):
+        HTTP_EXCEPTIONS.labels(_view_name(request), type(exception).__name__).inc()
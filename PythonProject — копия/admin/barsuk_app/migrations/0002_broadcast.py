@@ -0,0 +1,59 @@
+# Generated by Django 5.0.6 on 2026-10-17 22:32
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barsuk_app', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+                ('text', models.TextField(blank=True, verbose_name='Текст сообщения (HTML)')),
+                ('segment', models.JSONField(blank=True, default=dict, verbose_name='Сегмент')),
+                ('status', models.CharField(choices=[('draft', 'Черновик'), ('running', 'Отправляется'), ('paused', 'Приостановлена'), ('done', 'Завершена')], default='draft', max_length=20, verbose_name='Статус')),
+                ('total_count', models.IntegerField(default=0, verbose_name='Получателей')),
+                ('sent_count', models.IntegerField(default=0, verbose_name='Доставлено')),
+                ('failed_count', models.IntegerField(default=0, verbose_name='Ошибок')),
+                ('blocked_count', models.IntegerField(default=0, verbose_name='Заблокировали бота')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Создана')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начало отправки')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Окончание отправки')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='broadcasts', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Рассылка',
+                'verbose_name_plural': 'Рассылки',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BroadcastRecipient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.BigIntegerField(verbose_name='Chat ID')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('sent', 'Доставлено'), ('failed', 'Ошибка'), ('blocked', 'Бот заблокирован')], default='pending', max_length=20, verbose_name='Статус')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Попыток')),
+                ('error', models.CharField(blank=True, max_length=255, verbose_name='Ошибка')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Отправлено')),
+                ('broadcast', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipients', to='barsuk_app.broadcast', verbose_name='Рассылка')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='broadcast_messages', to='barsuk_app.telegramuser', verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Получатель рассылки',
+                'verbose_name_plural': 'Получатели рассылки',
+                'indexes': [models.Index(fields=['broadcast', 'status'], name='barsuk_app__broadca_3640ac_idx')],
+                'unique_together': {('broadcast', 'user')},
+            },
+        ),
+    ]
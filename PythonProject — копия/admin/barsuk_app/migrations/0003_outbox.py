@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-17 22:37
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barsuk_app', '0002_broadcast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Outbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50, verbose_name='Тип')),
+                ('target', models.CharField(max_length=100, verbose_name='Получатель')),
+                ('payload', models.JSONField(default=dict, verbose_name='Данные')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('sent', 'Доставлено'), ('dead', 'Не доставлено')], default='pending', max_length=20, verbose_name='Статус')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Попыток')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Создано')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Доставлено')),
+            ],
+            options={
+                'verbose_name': 'Исходящее уведомление',
+                'verbose_name_plural': 'Исходящие уведомления',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='barsuk_app__status_b8c380_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 5.0.6 on 2026-10-17 22:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Счетчики ведет триггер: заявки вставляет бот (SQLAlchemy), сигналы Django их не видят.
+# День считается в TIME_ZONE админки - так же, как фильтр по датам в списке заявок.
+CREATE_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION barsuk_request_stat_add(p_day date, p_type varchar, p_status varchar, p_delta integer)
+RETURNS void AS $$
+BEGIN
+    INSERT INTO barsuk_app_requestdailystat (day, request_type, status, count)
+    VALUES (p_day, p_type, p_status, p_delta)
+    ON CONFLICT (day, request_type, status)
+    DO UPDATE SET count = barsuk_app_requestdailystat.count + EXCLUDED.count;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION barsuk_request_stat_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM barsuk_request_stat_add((OLD.created_at AT TIME ZONE %(tz)s)::date,
+                                        OLD.request_type, OLD.status, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM barsuk_request_stat_add((NEW.created_at AT TIME ZONE %(tz)s)::date,
+                                        NEW.request_type, NEW.status, 1);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER barsuk_request_stat_insert_delete
+    AFTER INSERT OR DELETE ON barsuk_app_request
+    FOR EACH ROW EXECUTE FUNCTION barsuk_request_stat_trigger();
+
+-- Django сохраняет все поля, поэтому триггер на UPDATE срабатывает только при реальном изменении
+CREATE TRIGGER barsuk_request_stat_update
+    AFTER UPDATE OF status, request_type, created_at ON barsuk_app_request
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status
+          OR OLD.request_type IS DISTINCT FROM NEW.request_type
+          OR OLD.created_at IS DISTINCT FROM NEW.created_at)
+    EXECUTE FUNCTION barsuk_request_stat_trigger();
+
+-- Заполнение по существующим заявкам (триггер уже держит блокировку таблицы до конца миграции)
+INSERT INTO barsuk_app_requestdailystat (day, request_type, status, count)
+SELECT (created_at AT TIME ZONE %(tz)s)::date, request_type, status, count(*)
+FROM barsuk_app_request
+GROUP BY 1, 2, 3;
+"""
+
+DROP_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS barsuk_request_stat_update ON barsuk_app_request;
+DROP TRIGGER IF EXISTS barsuk_request_stat_insert_delete ON barsuk_app_request;
+DROP FUNCTION IF EXISTS barsuk_request_stat_trigger();
+DROP FUNCTION IF EXISTS barsuk_request_stat_add(date, varchar, varchar, integer);
+"""
+
+
+def create_trigger(apps, schema_editor):
+    # Только PostgreSQL; на других БД админка считает заявки обычным COUNT
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    tz = "'%s'" % settings.TIME_ZONE.replace("'", "''")
+    schema_editor.execute(CREATE_TRIGGER_SQL % {'tz': tz})
+
+
+def drop_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(DROP_TRIGGER_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barsuk_app', '0003_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('request_type', models.CharField(max_length=20, verbose_name='Тип заявки')),
+                ('status', models.CharField(max_length=20, verbose_name='Статус')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество')),
+            ],
+            options={
+                'verbose_name': 'Статистика заявок за день',
+                'verbose_name_plural': 'Статистика заявок по дням',
+                'unique_together': {('day', 'request_type', 'status')},
+            },
+        ),
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
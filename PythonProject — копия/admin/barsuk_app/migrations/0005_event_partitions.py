@@ -0,0 +1,174 @@
+# Generated by Django 5.0.6 on 2026-10-17 22:48
+
+from datetime import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# barsuk_app_event -> таблица, секционированная по месяцам created_at.
+# Границы месяцев - в TIME_ZONE админки, чтобы день сводки не попадал в две секции.
+# Первичный ключ секционированной таблицы обязан включать ключ секционирования,
+# поэтому он (id, created_at); id по-прежнему выдается одной последовательностью.
+PARTITION_SQL = """
+ALTER TABLE barsuk_app_event RENAME TO barsuk_app_event_legacy;
+
+CREATE SEQUENCE barsuk_app_event_part_id_seq;
+
+CREATE TABLE barsuk_app_event (
+    id bigint NOT NULL DEFAULT nextval('barsuk_app_event_part_id_seq'),
+    event_type varchar(100) NOT NULL,
+    event_data jsonb NULL,
+    created_at timestamp with time zone NOT NULL,
+    user_id bigint NOT NULL REFERENCES barsuk_app_telegramuser (id) DEFERRABLE INITIALLY DEFERRED
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE barsuk_app_event_part_id_seq OWNED BY barsuk_app_event.id;
+
+-- Сюда попадают события вне созданных секций (если команда давно не запускалась)
+CREATE TABLE barsuk_app_event_default PARTITION OF barsuk_app_event DEFAULT;
+"""
+
+COPY_SQL = """
+INSERT INTO barsuk_app_event (id, event_type, event_data, created_at, user_id)
+SELECT id, event_type, event_data, created_at, user_id FROM barsuk_app_event_legacy;
+
+SELECT setval('barsuk_app_event_part_id_seq', coalesce(max(id), 0) + 1, false) FROM barsuk_app_event_legacy;
+
+DROP TABLE barsuk_app_event_legacy;
+
+ALTER SEQUENCE barsuk_app_event_part_id_seq RENAME TO barsuk_app_event_id_seq;
+ALTER TABLE barsuk_app_event ADD CONSTRAINT barsuk_app_event_pkey PRIMARY KEY (id, created_at);
+"""
+
+UNPARTITION_SQL = """
+ALTER TABLE barsuk_app_event RENAME TO barsuk_app_event_partitioned;
+ALTER TABLE barsuk_app_event_partitioned RENAME CONSTRAINT barsuk_app_event_pkey TO barsuk_app_event_partitioned_pkey;
+ALTER SEQUENCE barsuk_app_event_id_seq RENAME TO barsuk_app_event_part_id_seq;
+
+CREATE TABLE barsuk_app_event (
+    id bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    event_type varchar(100) NOT NULL,
+    event_data jsonb NULL,
+    created_at timestamp with time zone NOT NULL,
+    user_id bigint NOT NULL REFERENCES barsuk_app_telegramuser (id) DEFERRABLE INITIALLY DEFERRED
+);
+
+INSERT INTO barsuk_app_event (id, event_type, event_data, created_at, user_id)
+SELECT id, event_type, event_data, created_at, user_id FROM barsuk_app_event_partitioned;
+
+SELECT setval(pg_get_serial_sequence('barsuk_app_event', 'id'), coalesce(max(id), 0) + 1, false)
+FROM barsuk_app_event;
+
+DROP TABLE barsuk_app_event_partitioned;
+"""
+
+# Секций вперед от текущего месяца
+PARTITIONS_AHEAD = 3
+
+
+def month_start(value):
+    return timezone.make_aware(datetime(value.year, value.month, 1))
+
+
+def next_month(value):
+    return month_start(datetime(value.year + value.month // 12, value.month % 12 + 1, 1))
+
+
+def saved_indexes(cursor, table):
+    """Определения индексов таблицы (кроме первичного ключа), чтобы пересоздать их на новой"""
+    cursor.execute("""
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = %s
+          AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)
+    """, [table, table])
+    return cursor.fetchall()
+
+
+def restore_indexes(schema_editor, indexes):
+    # Старая таблица к этому моменту удалена, имена индексов свободны.
+    # У секционированной таблицы определение содержит ON ONLY - индекс без секций.
+    for name, definition in indexes:
+        schema_editor.execute(definition.replace(' ON ONLY ', ' ON '))
+
+
+def partition_events(apps, schema_editor):
+    # Только PostgreSQL; на других БД события остаются обычной таблицей
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        indexes = saved_indexes(cursor, 'barsuk_app_event')
+        cursor.execute("SELECT min(created_at) FROM barsuk_app_event")
+        first = cursor.fetchone()[0] or timezone.now()
+
+    schema_editor.execute(PARTITION_SQL)
+
+    month = month_start(timezone.localtime(first))
+    last = month_start(timezone.localtime())
+    for _ in range(PARTITIONS_AHEAD):
+        last = next_month(last)
+    while month <= last:
+        upper = next_month(month)
+        schema_editor.execute(
+            f"CREATE TABLE barsuk_app_event_p{month:%Y%m} PARTITION OF barsuk_app_event "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+        month = upper
+
+    schema_editor.execute(COPY_SQL)
+    restore_indexes(schema_editor, indexes)
+
+
+def unpartition_events(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        indexes = saved_indexes(cursor, 'barsuk_app_event')
+
+    schema_editor.execute(UNPARTITION_SQL)
+    restore_indexes(schema_editor, indexes)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barsuk_app', '0004_request_daily_stat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('event_type', models.CharField(max_length=100, verbose_name='Тип события')),
+                ('count', models.IntegerField(default=0, verbose_name='Событий')),
+                ('users', models.IntegerField(default=0, verbose_name='Пользователей')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Пересчитано')),
+            ],
+            options={
+                'verbose_name': 'Статистика событий за день',
+                'verbose_name_plural': 'Статистика событий по дням',
+                'ordering': ['-day', 'event_type'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='event',
+            name='barsuk_app__event_t_0f1242_idx',
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['event_type', 'created_at'], name='barsuk_app_event_type_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['user', 'created_at'], name='barsuk_app_event_user_day_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='eventdailyrollup',
+            unique_together={('day', 'event_type')},
+        ),
+        migrations.RunPython(partition_events, unpartition_events),
+    ]
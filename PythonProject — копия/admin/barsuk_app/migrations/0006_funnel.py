@@ -0,0 +1,64 @@
+# Generated by Django 5.0.6 on 2026-10-17 22:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barsuk_app', '0005_event_partitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AggregationWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Агрегат')),
+                ('last_event_id', models.BigIntegerField(default=0, verbose_name='Последнее событие')),
+                ('last_event_at', models.DateTimeField(blank=True, null=True, verbose_name='Время последнего события')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Отметка агрегации',
+                'verbose_name_plural': 'Отметки агрегации',
+            },
+        ),
+        migrations.CreateModel(
+            name='FunnelUserProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cohort_day', models.DateField(db_index=True, verbose_name='День когорты')),
+                ('bot_start_at', models.DateTimeField(blank=True, null=True, verbose_name='Старт бота')),
+                ('age_confirmed_at', models.DateTimeField(blank=True, null=True, verbose_name='Подтвердил 18+')),
+                ('age_failed_at', models.DateTimeField(blank=True, null=True, verbose_name='Не прошел 18+')),
+                ('consent_accepted_at', models.DateTimeField(blank=True, null=True, verbose_name='Принял согласие')),
+                ('phone_captured_at', models.DateTimeField(blank=True, null=True, verbose_name='Оставил телефон')),
+                ('menu_opened_at', models.DateTimeField(blank=True, null=True, verbose_name='Открыл меню')),
+                ('transfer_requested_at', models.DateTimeField(blank=True, null=True, verbose_name='Начал заявку')),
+                ('transfer_submitted_at', models.DateTimeField(blank=True, null=True, verbose_name='Отправил заявку')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='funnel_progress', to='barsuk_app.telegramuser', verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Прогресс по воронке',
+                'verbose_name_plural': 'Прогресс по воронке',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserActiveDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('cohort_day', models.DateField(verbose_name='День когорты')),
+                ('day_offset', models.IntegerField(verbose_name='День от когорты')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='active_days', to='barsuk_app.telegramuser', verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Активный день пользователя',
+                'verbose_name_plural': 'Активные дни пользователей',
+                'indexes': [models.Index(fields=['cohort_day', 'day_offset'], name='barsuk_app_active_cohort_idx')],
+                'unique_together': {('user', 'day')},
+            },
+        ),
+    ]
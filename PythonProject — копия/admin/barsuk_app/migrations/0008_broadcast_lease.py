@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-17 23:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barsuk_app', '0007_export_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcast',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Heartbeat воркера'),
+        ),
+        migrations.AddField(
+            model_name='broadcast',
+            name='worker_id',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='Воркер'),
+        ),
+        migrations.AlterField(
+            model_name='broadcastrecipient',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Ожидает'), ('sending', 'Отправляется'), ('sent', 'Доставлено'), ('failed', 'Ошибка'), ('blocked', 'Бот заблокирован')], default='pending', max_length=20, verbose_name='Статус'),
+        ),
+    ]
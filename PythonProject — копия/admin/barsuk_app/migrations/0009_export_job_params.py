@@ -0,0 +1,39 @@
+# Generated by Django 5.0.6 on 2026-10-17 23:26
+
+from django.db import migrations, models
+
+
+def fail_unfinished_jobs(apps, schema_editor):
+    # Незавершенные задания хранили запрос в pickle - выполнить их уже нельзя
+    apps.get_model('barsuk_app', 'ExportJob').objects.filter(status__in=('pending', 'running')).update(
+        status='failed', error='Задание прервано обновлением, запустите выгрузку заново')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barsuk_app', '0008_broadcast_lease'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_unfinished_jobs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='exportjob',
+            name='query',
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Heartbeat'),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='params',
+            field=models.JSONField(default=dict, verbose_name='Параметры списка'),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='pks',
+            field=models.JSONField(blank=True, null=True, verbose_name='Выбранные строки'),
+        ),
+    ]
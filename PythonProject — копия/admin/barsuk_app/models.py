@@ -77,7 +77,11 @@ class TelegramUser(models.Model):
 
 
 class Event(models.Model):
-    """События пользователей"""
+    """
+    События пользователей.
+    В PostgreSQL таблица секционирована по месяцам created_at (миграция 0005,
+    команда manage_event_partitions), счетчики по дням - в EventDailyRollup.
+    """
     user = models.ForeignKey(TelegramUser, on_delete=models.CASCADE, related_name='events', verbose_name="Пользователь")
     event_type = models.CharField(max_length=100, verbose_name="Тип события")
     event_data = models.JSONField(null=True, blank=True, verbose_name="Данные события")
@@ -88,7 +92,8 @@ class Event(models.Model):
         verbose_name_plural = "События"
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['event_type']),
+            models.Index(fields=['event_type', 'created_at'], name='barsuk_app_event_type_day_idx'),
+            models.Index(fields=['user', 'created_at'], name='barsuk_app_event_user_day_idx'),
             models.Index(fields=['created_at']),
         ]
 
@@ -257,4 +262,247 @@ class ContentItem(models.Model):
     def price_display(self):
         if self.price:
             return f"{self.price} ₽"
-        return "Цена по запросу"
\ No newline at end of file
+        return "Цена по запросу"
+
+
+# Рассылки
+class Broadcast(models.Model):
+    """Рассылка (кампания)"""
+    STATUS_CHOICES = [
+        ('draft', 'Черновик'),
+        ('running', 'Отправляется'),
+        ('paused', 'Приостановлена'),
+        ('done', 'Завершена'),
+    ]
+
+    name = models.CharField(max_length=200, verbose_name="Название")
+    text = models.TextField(blank=True, verbose_name="Текст сообщения (HTML)")
+    segment = models.JSONField(default=dict, blank=True, verbose_name="Сегмент")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft', verbose_name="Статус")
+
+    # Статистика доставки
+    total_count = models.IntegerField(default=0, verbose_name="Получателей")
+    sent_count = models.IntegerField(default=0, verbose_name="Доставлено")
+    failed_count = models.IntegerField(default=0, verbose_name="Ошибок")
+    blocked_count = models.IntegerField(default=0, verbose_name="Заблокировали бота")
+
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='broadcasts', verbose_name="Автор")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Создана")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начало отправки")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Окончание отправки")
+
+    # Аренда рассылки воркером: пока heartbeat свежий, второй воркер ее не возьмет
+    worker_id = models.CharField(max_length=100, blank=True, default='', verbose_name="Воркер")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Heartbeat воркера")
+
+    class Meta:
+        verbose_name = "Рассылка"
+        verbose_name_plural = "Рассылки"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Рассылка #{self.id} - {self.name}"
+
+    @property
+    def pending_count(self):
+        return self.total_count - self.sent_count - self.failed_count - self.blocked_count
+
+
+class BroadcastRecipient(models.Model):
+    """Получатель рассылки - прогресс отправки хранится здесь, поэтому рассылку можно продолжить"""
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает'),
+        ('sending', 'Отправляется'),
+        ('sent', 'Доставлено'),
+        ('failed', 'Ошибка'),
+        ('blocked', 'Бот заблокирован'),
+    ]
+
+    broadcast = models.ForeignKey(Broadcast, on_delete=models.CASCADE, related_name='recipients',
+                                  verbose_name="Рассылка")
+    user = models.ForeignKey(TelegramUser, on_delete=models.CASCADE, related_name='broadcast_messages',
+                             verbose_name="Пользователь")
+    chat_id = models.BigIntegerField(verbose_name="Chat ID")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Статус")
+    attempts = models.IntegerField(default=0, verbose_name="Попыток")
+    error = models.CharField(max_length=255, blank=True, verbose_name="Ошибка")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Отправлено")
+
+    class Meta:
+        verbose_name = "Получатель рассылки"
+        verbose_name_plural = "Получатели рассылки"
+        unique_together = ('broadcast', 'user')
+        indexes = [
+            models.Index(fields=['broadcast', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.broadcast_id} -> {self.chat_id}"
+
+
+# Транзакционный outbox: уведомления пишутся в одной транзакции с заявкой,
+# доставляет их фоновый диспетчер бота (app/utils/outbox.py)
+class Outbox(models.Model):
+    """Исходящее уведомление"""
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает'),
+        ('sent', 'Доставлено'),
+        ('dead', 'Не доставлено'),
+    ]
+
+    kind = models.CharField(max_length=50, verbose_name="Тип")
+    target = models.CharField(max_length=100, verbose_name="Получатель")  # telegram:<chat_id> или webhook
+    payload = models.JSONField(default=dict, verbose_name="Данные")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Статус")
+    attempts = models.IntegerField(default=0, verbose_name="Попыток")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Следующая попытка")
+    last_error = models.TextField(blank=True, default='', verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Создано")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Доставлено")
+
+    class Meta:
+        verbose_name = "Исходящее уведомление"
+        verbose_name_plural = "Исходящие уведомления"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} -> {self.target}"
+
+
+class RequestDailyStat(models.Model):
+    """
+    Число заявок по дню, типу и статусу.
+    Ведется триггером в БД (миграция 0004) - учитываются и заявки из бота.
+    """
+    day = models.DateField(verbose_name="День")
+    request_type = models.CharField(max_length=20, verbose_name="Тип заявки")
+    status = models.CharField(max_length=20, verbose_name="Статус")
+    count = models.IntegerField(default=0, verbose_name="Количество")
+
+    class Meta:
+        verbose_name = "Статистика заявок за день"
+        verbose_name_plural = "Статистика заявок по дням"
+        unique_together = ('day', 'request_type', 'status')
+
+    def __str__(self):
+        return f"{self.day} {self.request_type}/{self.status}: {self.count}"
+
+
+class EventDailyRollup(models.Model):
+    """
+    Число событий по дню и типу.
+    Заполняется командой rollup_events (и перед удалением старых секций событий).
+    """
+    day = models.DateField(verbose_name="День")
+    event_type = models.CharField(max_length=100, verbose_name="Тип события")
+    count = models.IntegerField(default=0, verbose_name="Событий")
+    users = models.IntegerField(default=0, verbose_name="Пользователей")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Пересчитано")
+
+    class Meta:
+        verbose_name = "Статистика событий за день"
+        verbose_name_plural = "Статистика событий по дням"
+        ordering = ['-day', 'event_type']
+        unique_together = ('day', 'event_type')
+
+    def __str__(self):
+        return f"{self.day} {self.event_type}: {self.count}"
+
+
+class FunnelUserProgress(models.Model):
+    """
+    Первое время каждого шага воронки регистрации для пользователя.
+    Обновляется инкрементально по событиям (barsuk_app.funnel.refresh_funnel).
+    """
+    user = models.OneToOneField(TelegramUser, on_delete=models.CASCADE, related_name='funnel_progress',
+                                verbose_name="Пользователь")
+    cohort_day = models.DateField(db_index=True, verbose_name="День когорты")
+    bot_start_at = models.DateTimeField(null=True, blank=True, verbose_name="Старт бота")
+    age_confirmed_at = models.DateTimeField(null=True, blank=True, verbose_name="Подтвердил 18+")
+    age_failed_at = models.DateTimeField(null=True, blank=True, verbose_name="Не прошел 18+")
+    consent_accepted_at = models.DateTimeField(null=True, blank=True, verbose_name="Принял согласие")
+    phone_captured_at = models.DateTimeField(null=True, blank=True, verbose_name="Оставил телефон")
+    menu_opened_at = models.DateTimeField(null=True, blank=True, verbose_name="Открыл меню")
+    transfer_requested_at = models.DateTimeField(null=True, blank=True, verbose_name="Начал заявку")
+    transfer_submitted_at = models.DateTimeField(null=True, blank=True, verbose_name="Отправил заявку")
+
+    class Meta:
+        verbose_name = "Прогресс по воронке"
+        verbose_name_plural = "Прогресс по воронке"
+
+    def __str__(self):
+        return f"{self.user_id}: {self.cohort_day}"
+
+
+class UserActiveDay(models.Model):
+    """День, в который пользователь что-то делал в боте (для удержания по когортам)"""
+    user = models.ForeignKey(TelegramUser, on_delete=models.CASCADE, related_name='active_days',
+                             verbose_name="Пользователь")
+    day = models.DateField(verbose_name="День")
+    cohort_day = models.DateField(verbose_name="День когорты")
+    day_offset = models.IntegerField(verbose_name="День от когорты")
+
+    class Meta:
+        verbose_name = "Активный день пользователя"
+        verbose_name_plural = "Активные дни пользователей"
+        unique_together = ('user', 'day')
+        indexes = [
+            models.Index(fields=['cohort_day', 'day_offset'], name='barsuk_app_active_cohort_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.day}"
+
+
+class AggregationWatermark(models.Model):
+    """До какого события (id) обработаны инкрементальные агрегаты"""
+    name = models.CharField(max_length=50, unique=True, verbose_name="Агрегат")
+    last_event_id = models.BigIntegerField(default=0, verbose_name="Последнее событие")
+    last_event_at = models.DateTimeField(null=True, blank=True, verbose_name="Время последнего события")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    class Meta:
+        verbose_name = "Отметка агрегации"
+        verbose_name_plural = "Отметки агрегации"
+
+    def __str__(self):
+        return f"{self.name}: {self.last_event_id}"
+
+
+class ExportJob(models.Model):
+    """Фоновая выгрузка в XLSX (barsuk_app.exports)"""
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+
+    model = models.CharField(max_length=100, verbose_name="Модель")
+    # Строки выгрузки - список админки с этими параметрами (фильтры, поиск, сортировка)
+    params = models.JSONField(default=dict, verbose_name="Параметры списка")
+    # Выбранные строки; null - все строки списка
+    pks = models.JSONField(null=True, blank=True, verbose_name="Выбранные строки")
+    columns = models.JSONField(default=list, verbose_name="Колонки")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Статус")
+    rows = models.IntegerField(default=0, verbose_name="Строк")
+    file = models.FileField(upload_to='exports/', blank=True, verbose_name="Файл")
+    error = models.TextField(blank=True, default='', verbose_name="Ошибка")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='export_jobs', verbose_name="Создал")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Создана")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершена")
+    # Поток выгрузки продлевает heartbeat; задание без heartbeat - поток умер вместе с процессом
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Heartbeat")
+
+    class Meta:
+        verbose_name = "Выгрузка"
+        verbose_name_plural = "Выгрузки"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Выгрузка #{self.id} ({self.model})"
\ No newline at end of file
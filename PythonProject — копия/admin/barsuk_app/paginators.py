@@ -0,0 +1,49 @@
+"""
+Пагинатор списков админки для больших таблиц (заявки, события): число строк
+оценивается по плану запроса вместо COUNT(*).
+"""
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану запроса (EXPLAIN), без выполнения COUNT"""
+    db_connection = connections[queryset.db]
+    if db_connection.vendor != 'postgresql':
+        return None
+
+    sql, params = queryset.query.sql_with_params()
+    with db_connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор без COUNT(*) по большой таблице: если включена оценка, число
+    строк берется из плана запроса, а точный COUNT делается только когда
+    строк заведомо немного (не больше exact_limit).
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True,
+                 estimate=False, exact_limit=10000):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.estimate = estimate
+        self.exact_limit = exact_limit
+        self.is_estimated = False
+
+    @cached_property
+    def count(self):
+        if self.estimate:
+            estimated = estimate_count(self.object_list)
+            if estimated is not None and estimated > self.exact_limit:
+                self.is_estimated = True
+                return estimated
+
+        return super().count
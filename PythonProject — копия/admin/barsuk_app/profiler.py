@@ -0,0 +1,185 @@
+"""
+Сэмплирующий профилировщик view админки - включается без перезапуска.
+
+Команда `manage.py profile_admin --seconds 60` пишет файл-триггер в
+PROFILE_DIR; ProfilingMiddleware каждого процесса (воркера gunicorn)
+проверяет его не чаще раза в секунду и на это время запускает поток,
+который каждые PROFILE_INTERVAL секунд снимает стеки потоков, занятых
+запросами. Вне окна профилирования middleware только сравнивает время.
+
+По окончании каждый процесс пишет в PROFILE_DIR:
+- admin-<pid>-<время>.collapsed - свернутые стеки, корень - имя view
+  (flamegraph.pl, speedscope);
+- admin-<pid>-<время>-views.txt - время по view и функции, в которых оно
+  проведено (self-time), по числу сэмплов.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TRIGGER_FILE = 'admin-profile.json'
+
+
+def frame_name(code):
+    filename = code.co_filename
+    # Путь внутри проекта или библиотеки - без начала до site-packages/корня проекта
+    for marker in ('site-packages' + os.sep, str(settings.BASE_DIR) + os.sep):
+        index = filename.find(marker)
+        if index != -1:
+            filename = filename[index + len(marker):]
+            break
+    return f'{filename}:{code.co_name}'
+
+
+def request_trigger(seconds):
+    """Включить профилирование во всех процессах на seconds секунд (0 - выключить)"""
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    path = os.path.join(settings.PROFILE_DIR, TRIGGER_FILE)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'until': time.time() + seconds if seconds else 0}, f)
+    return path
+
+
+def read_trigger():
+    """До какого времени (unix) должно идти профилирование; 0 - не должно"""
+    try:
+        with open(os.path.join(settings.PROFILE_DIR, TRIGGER_FILE), encoding='utf-8') as f:
+            return float(json.load(f).get('until') or 0)
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+class ViewSampler:
+    """Поток-сэмплер стеков потоков, которые сейчас обрабатывают запросы"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        # id потока -> имя view, которое он сейчас обрабатывает (dict - атомарные операции под GIL)
+        self.active = {}
+        self.last_files = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds):
+        if self.is_running:
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(seconds,), name='view-sampler', daemon=True)
+        self._thread.start()
+        logger.warning("Профилирование админки включено на %.0f с (pid %s)", seconds, os.getpid())
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, seconds):
+        # (view, стек код-объектов от корня к листу) -> сэмплов
+        stacks = Counter()
+        own = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        started = time.monotonic()
+
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frames = sys._current_frames()
+            for thread_id, view in list(self.active.items()):
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                stack.reverse()
+                stacks[(view, tuple(stack))] += 1
+            del frames
+
+        try:
+            self.last_files = self._write(stacks, time.monotonic() - started)
+            logger.warning("Профилирование админки завершено: %s", ', '.join(self.last_files))
+        except Exception:
+            logger.exception("Не удалось записать результаты профилирования")
+
+    def _write(self, stacks, elapsed):
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        prefix = os.path.join(settings.PROFILE_DIR, f'admin-{os.getpid()}-{datetime.now():%Y%m%d-%H%M%S}')
+        names = {}
+
+        def name(code):
+            if code not in names:
+                names[code] = frame_name(code)
+            return names[code]
+
+        view_total = Counter()
+        view_self = defaultdict(Counter)
+        with open(prefix + '.collapsed', 'w', encoding='utf-8') as f:
+            for (view, stack), count in stacks.items():
+                if not stack:
+                    continue
+                f.write(';'.join([view] + [name(code) for code in stack]) + f' {count}\n')
+                view_total[view] += count
+                view_self[view][name(stack[-1])] += count
+
+        with open(prefix + '-views.txt', 'w', encoding='utf-8') as f:
+            f.write(f'Окно {elapsed:.1f} с, интервал {self.interval * 1000:.0f} мс, pid {os.getpid()}\n')
+            for view, total in view_total.most_common():
+                f.write(f'\n{view}: {total} сэмплов (~{total * self.interval * 1000:.0f} мс)\n')
+                for function, count in view_self[view].most_common(15):
+                    f.write(f'    {count:>6}  {function}\n')
+        return [prefix + '.collapsed', prefix + '-views.txt']
+
+
+sampler = ViewSampler()
+
+
+class ProfilingMiddleware:
+    """Отмечает, какой view обрабатывает поток, пока идет профилирование"""
+
+    check_interval = 1.0
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        sampler.interval = settings.PROFILE_INTERVAL
+        self._next_check = 0.0
+
+    def _check_trigger(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        until = read_trigger()
+        remaining = min(until - time.time(), settings.PROFILE_MAX_SECONDS)
+        if remaining > 0 and not sampler.is_running:
+            sampler.start(remaining)
+        elif remaining <= 0 and sampler.is_running:
+            sampler.stop()
+
+    def __call__(self, request):
+        self._check_trigger()
+        if not sampler.is_running:
+            return self.get_response(request)
+
+        thread_id = threading.get_ident()
+        sampler.active[thread_id] = request.path
+        try:
+            return self.get_response(request)
+        finally:
+            sampler.active.pop(thread_id, None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # После разрешения URL - имя view вместо пути (пути с id не склеиваются)
+        thread_id = threading.get_ident()
+        if thread_id in sampler.active and request.resolver_match is not None:
+            sampler.active[thread_id] = request.resolver_match.view_name
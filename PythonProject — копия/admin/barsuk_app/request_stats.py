@@ -0,0 +1,139 @@
+"""
+Быстрые счетчики для списка заявок в админке.
+
+Итоги и счетчики в фильтрах берутся из RequestDailyStat (ведется триггером,
+см. миграцию 0004) вместо COUNT(*) по barsuk_app_request. Если в списке
+включены фильтры, которых нет в сводной таблице (поиск, ответственный,
+дата обновления), число строк оценивается по плану запроса.
+"""
+from django import forms
+from django.contrib import admin
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils.functional import cached_property
+
+from .models import Request, RequestDailyStat
+from .paginators import EstimatedCountPaginator
+
+# Параметры списка, которые не влияют на число строк
+IGNORED_PARAMS = {'p', 'o', 'e', '_changelist_filters', 'all'}
+
+# Параметр списка -> поле RequestDailyStat
+STAT_PARAMS = {
+    'request_type': 'request_type',
+    'status': 'status',
+    'created_at__range__gte': 'day__gte',
+    'created_at__range__lte': 'day__lte',
+}
+
+
+def stats_filters_from_params(params, exclude=None):
+    """
+    Фильтры RequestDailyStat для параметров списка заявок.
+    None - если какой-то фильтр сводной таблицей не покрывается.
+    """
+    result = {}
+    for key, value in params.items():
+        if key in IGNORED_PARAMS or key == exclude or value in ('', None):
+            continue
+        if key == 'q' and not value.strip():
+            continue
+        if key not in STAT_PARAMS:
+            return None
+
+        field = STAT_PARAMS[key]
+        if field.startswith('day__'):
+            try:
+                value = forms.DateField().to_python(value)
+            except forms.ValidationError:
+                return None
+        result[field] = value
+    return result
+
+
+def stats_available():
+    return connection.vendor == 'postgresql'
+
+
+def stats_count(filters):
+    """Число заявок по сводной таблице"""
+    return RequestDailyStat.objects.filter(**filters).aggregate(total=Sum('count'))['total'] or 0
+
+
+def stats_facets(field, filters):
+    """Счетчики по значениям поля (request_type или status) с учетом остальных фильтров"""
+    rows = RequestDailyStat.objects.filter(**filters).values(field).annotate(total=Sum('count'))
+    return {row[field]: row['total'] for row in rows}
+
+
+class RequestStatsPaginator(EstimatedCountPaginator):
+    """
+    Пагинатор, который не делает COUNT(*) по заявкам:
+    - stats_filters заданы - итог из сводной таблицы;
+    - иначе - как EstimatedCountPaginator.
+    """
+
+    def __init__(self, *args, stats_filters=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_filters = stats_filters
+
+    @cached_property
+    def count(self):
+        if self.stats_filters is not None:
+            return stats_count(self.stats_filters)
+        return super().count
+
+
+class StatsFacetFilter(admin.SimpleListFilter):
+    """Фильтр по полю заявки со счетчиками из сводной таблицы"""
+    field = None
+
+    def lookups(self, request, model_admin):
+        choices = Request._meta.get_field(self.field).choices
+        filters = stats_filters_from_params(request.GET, exclude=self.parameter_name) if stats_available() else None
+        if filters is None:
+            return choices
+
+        counts = stats_facets(self.field, filters)
+        return [(value, f"{label} ({counts.get(value, 0)})") for value, label in choices]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.field: self.value()})
+        return queryset
+
+
+class RequestTypeFilter(StatsFacetFilter):
+    title = 'Тип заявки'
+    parameter_name = 'request_type'
+    field = 'request_type'
+
+
+class RequestStatusFilter(StatsFacetFilter):
+    title = 'Статус'
+    parameter_name = 'status'
+    field = 'status'
+
+
+def rebuild_request_stats():
+    """Пересчет сводной таблицы с нуля (если счетчики разошлись с заявками)"""
+    rows = (
+        Request.objects
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'request_type', 'status')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Не даем триггеру менять счетчики, пока таблица пересобирается
+            with connection.cursor() as cursor:
+                cursor.execute("LOCK TABLE barsuk_app_request IN SHARE MODE")
+        RequestDailyStat.objects.all().delete()
+        RequestDailyStat.objects.bulk_create([
+            RequestDailyStat(day=row['day'], request_type=row['request_type'],
+                             status=row['status'], count=row['total'])
+            for row in rows
+        ], batch_size=1000)
+    return len(rows)
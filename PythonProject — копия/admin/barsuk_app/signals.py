@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import TelegramUser, ContentCategory, ContentItem
+
+
+def notify_bot(channel, payload=''):
+    """
+    Отправка NOTIFY боту.
+    Postgres доставляет уведомление только после commit транзакции,
+    поэтому бот не увидит незафиксированных изменений.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", [channel, str(payload)])
+
+
+@receiver(post_save, sender=TelegramUser)
+@receiver(post_delete, sender=TelegramUser)
+def telegram_user_changed(sender, instance, **kwargs):
+    """Сброс кэша пользователя в боте (статус, блокировка, контакты)"""
+    notify_bot(settings.BOT_USER_CHANGED_CHANNEL, instance.telegram_id)
+
+
+@receiver(post_save, sender=ContentCategory)
+@receiver(post_delete, sender=ContentCategory)
+@receiver(post_save, sender=ContentItem)
+@receiver(post_delete, sender=ContentItem)
+def menu_changed(sender, instance, **kwargs):
+    """Пересборка кэша меню в боте"""
+    notify_bot(settings.BOT_MENU_CHANGED_CHANNEL)
@@ -0,0 +1,128 @@
+"""
+Клиент Bot API для админки.
+
+Одна requests.Session на процесс: соединения с api.telegram.org держатся
+открытыми (keep-alive) и переиспользуются. urllib3 повторяет запрос только
+там, где Telegram его точно не выполнил: ошибка подключения и 429. После
+таймаута чтения или 5xx сообщение могло уйти - повтор дал бы дубль, поэтому
+такой вызов считается неудачным. Для отправки без ожидания в запросе админки
+есть фоновый вариант на пуле потоков.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import TELEGRAM_DURATION, TELEGRAM_ERRORS
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramClient:
+    """Синхронный клиент с пулом соединений и фоновой отправкой"""
+
+    def __init__(self, token, api_url='https://api.telegram.org', connect_timeout=3.0, read_timeout=10.0,
+                 retries=3, pool_size=10, background_workers=4):
+        self.token = token
+        self.api_url = api_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            other=0,
+            backoff_factor=0.5,
+            status_forcelist=(429,),
+            allowed_methods=frozenset({'POST'}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._executor = ThreadPoolExecutor(max_workers=background_workers, thread_name_prefix='telegram')
+
+    def call(self, method, **params):
+        """Вызов метода Bot API; возвращает result или None при ошибке"""
+        url = f"{self.api_url}/bot{self.token}/{method}"
+        started = time.perf_counter()
+        try:
+            response = self.session.post(url, json=params, timeout=self.timeout)
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            TELEGRAM_ERRORS.labels(method, type(e).__name__).inc()
+            logger.warning("telegram_call_failed method=%s chat_id=%s error=%s: %s",
+                           method, params.get('chat_id'), type(e).__name__, e)
+            return None
+        finally:
+            TELEGRAM_DURATION.labels(method).observe(time.perf_counter() - started)
+
+        if not data.get('ok'):
+            TELEGRAM_ERRORS.labels(method, response.status_code).inc()
+            logger.warning("telegram_api_error method=%s chat_id=%s status=%s description=%s",
+                           method, params.get('chat_id'), response.status_code, data.get('description'))
+            return None
+
+        logger.info("telegram_call_ok method=%s chat_id=%s", method, params.get('chat_id'))
+        return data.get('result', True)
+
+    def send_message(self, chat_id, text, parse_mode='HTML'):
+        """Отправка сообщения; True, если Telegram его принял"""
+        return self.call('sendMessage', chat_id=chat_id, text=text, parse_mode=parse_mode) is not None
+
+    def send_message_background(self, chat_id, text, callback=None, parse_mode='HTML'):
+        """
+        Отправка в фоновом потоке. callback(ok) вызывается в том же потоке
+        после отправки - в нем можно записать статус доставки в БД.
+        """
+        def task():
+            ok = self.send_message(chat_id, text, parse_mode=parse_mode)
+            if callback is not None:
+                try:
+                    callback(ok)
+                except Exception:
+                    logger.exception("telegram_callback_failed chat_id=%s", chat_id)
+                finally:
+                    # Поток живет дольше запроса - соединение с БД закрываем сами
+                    connections.close_all()
+            return ok
+
+        return self._executor.submit(task)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Общий клиент процесса (создается при первом обращении)"""
+    global _client
+    if _client is None:
+        if not settings.TELEGRAM_BOT_TOKEN:
+            raise ImproperlyConfigured("TELEGRAM_TOKEN не задан в окружении")
+        with _client_lock:
+            if _client is None:
+                _client = TelegramClient(
+                    token=settings.TELEGRAM_BOT_TOKEN,
+                    api_url=settings.TELEGRAM_API_URL,
+                    connect_timeout=settings.TELEGRAM_API_CONNECT_TIMEOUT,
+                    read_timeout=settings.TELEGRAM_API_TIMEOUT,
+                    retries=settings.TELEGRAM_API_RETRIES,
+                    pool_size=settings.TELEGRAM_POOL_SIZE,
+                    background_workers=settings.TELEGRAM_BACKGROUND_WORKERS,
+                )
+    return _client
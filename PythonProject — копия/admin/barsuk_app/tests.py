@@ -0,0 +1,348 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import aiohttp
+
+from django.contrib.auth.models import Group, User
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from .broadcast import BroadcastWorker
+from .exports import STALE_AFTER
+from .metrics import Counter as MetricCounter
+from .models import (UserStatus, TelegramUser, Event, Request, ContentCategory, ContentItem,
+                     Broadcast, BroadcastRecipient, ExportJob)
+from .profiler import request_trigger, sampler
+from .telegram_client import TelegramClient
+
+
+class ChangelistQueryCountTests(TestCase):
+    """Число запросов на странице списка не должно зависеть от числа строк (N+1)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.groups = [Group.objects.create(name=name) for name in ('Manager', 'Marketer', 'Viewer')]
+        cls.category = ContentCategory.objects.create(name='Кальяны')
+        cls.broadcast = Broadcast.objects.create(name='Тест', text='Привет', created_by=cls.admin)
+        cls.counter = 0
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def make_rows(self, count):
+        """count новых строк во всех моделях со связями"""
+        for _ in range(count):
+            type(self).counter += 1
+            n = self.counter
+            manager = User.objects.create_user(f'manager{n}', password='password', is_staff=True)
+            manager.groups.add(self.groups[n % len(self.groups)])
+            tg_user = TelegramUser.objects.create(telegram_id=1000 + n, username=f'user{n}')
+            Event.objects.create(user=tg_user, event_type='bot_start')
+            Request.objects.create(user=tg_user, request_type='transfer', data={}, assigned_to=manager)
+            category = ContentCategory.objects.create(name=f'Категория {n}')
+            ContentItem.objects.create(category=category, name=f'Позиция {n}', description='')
+            ContentItem.objects.create(category=self.category, name=f'Кальян {n}', description='')
+            Broadcast.objects.create(name=f'Рассылка {n}', created_by=manager)
+            BroadcastRecipient.objects.create(broadcast=self.broadcast, user=tg_user, chat_id=tg_user.telegram_id)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return context
+
+    def test_changelists_do_not_grow_with_rows(self):
+        names = [
+            'auth_user', 'barsuk_app_telegramuser', 'barsuk_app_event', 'barsuk_app_request',
+            'barsuk_app_contentcategory', 'barsuk_app_contentitem', 'barsuk_app_broadcast',
+            'barsuk_app_broadcastrecipient', 'barsuk_app_outbox', 'barsuk_app_eventdailyrollup', 'barsuk_app_exportjob',
+        ]
+        self.make_rows(2)
+        small = {name: self.count_queries(reverse(f'admin:{name}_changelist')) for name in names}
+        self.make_rows(8)
+        for name in names:
+            with self.subTest(changelist=name):
+                large = self.count_queries(reverse(f'admin:{name}_changelist'))
+                self.assertEqual(
+                    len(small[name]), len(large),
+                    '\n'.join(query['sql'] for query in large.captured_queries),
+                )
+
+
+class MetricsTests(TestCase):
+    """/metrics админки: время ответов по view и закрытый доступ снаружи"""
+
+    def test_metrics_count_admin_views(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        self.client.get(reverse('admin:barsuk_app_request_changelist'))
+        self.client.logout()
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('barsuk_admin_http_responses_total{view="admin:barsuk_app_request_changelist",status="200"}', body)
+        self.assertIn('barsuk_admin_http_duration_seconds_count{view="admin:barsuk_app_request_changelist",method="GET"}', body)
+
+    def test_metrics_hidden_from_other_addresses(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 404)
+
+    def test_series_do_not_grow_with_threads(self):
+        counter = MetricCounter('test_calls', 'Тест', ['view'])
+
+        def work():
+            for _ in range(1000):
+                counter.labels('index').inc()
+
+        # Потоки, как у сервера, приходят и уходят
+        for _ in range(5):
+            threads = [threading.Thread(target=work) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(list(counter.samples()), [('test_calls_total', '{view="index"}', 40000)])
+
+
+class ProfilingTests(TestCase):
+    """Профилирование по триггеру profile_admin: стеки пишутся с именем view в корне"""
+
+    def test_trigger_starts_sampler_and_writes_views(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(PROFILE_DIR=directory):
+            request_trigger(30)
+            for _ in range(5):
+                self.client.get(reverse('admin:barsuk_app_request_changelist'))
+            self.assertTrue(sampler.is_running)
+
+            request_trigger(0)
+            sampler.stop()
+            sampler._thread.join(timeout=5)
+            self.assertEqual(len(sampler.last_files), 2)
+            for path in sampler.last_files:
+                self.assertTrue(os.path.exists(path))
+
+
+class StubBotAPI(BaseHTTPRequestHandler):
+    """Bot API, отвечающий заранее заданными ответами: [(статус, тело, заголовки, задержка)]"""
+    responses = []
+    requests = []
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        type(self).requests.append(json.loads(self.rfile.read(length)))
+        status, body, headers, delay = type(self).responses.pop(0)
+        time.sleep(delay)
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент не дождался ответа (тест таймаута)
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class StubBotAPITestCase(TestCase):
+    """Тесты с локальной заглушкой Bot API"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubBotAPI)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubBotAPI.responses = []
+        StubBotAPI.requests = []
+        self.api_url = f'http://127.0.0.1:{self.server.server_port}'
+
+
+class TelegramClientTests(StubBotAPITestCase):
+    """Клиент Bot API на локальной заглушке: повтор только там, где сообщение точно не ушло"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = TelegramClient('42:TEST', api_url=f'http://127.0.0.1:{self.server.server_port}',
+                                     read_timeout=0.5, retries=3, background_workers=1)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_success(self):
+        StubBotAPI.responses = [(200, {'ok': True, 'result': {'message_id': 1}}, {}, 0)]
+        self.assertTrue(self.client.send_message(100, 'Привет'))
+        self.assertEqual(StubBotAPI.requests, [{'chat_id': 100, 'text': 'Привет', 'parse_mode': 'HTML'}])
+
+    def test_retries_after_429(self):
+        StubBotAPI.responses = [
+            (429, {'ok': False, 'error_code': 429, 'parameters': {'retry_after': 0}}, {'Retry-After': '0'}, 0),
+            (200, {'ok': True, 'result': {'message_id': 1}}, {}, 0),
+        ]
+        self.assertTrue(self.client.send_message(100, 'Привет'))
+        self.assertEqual(len(StubBotAPI.requests), 2)
+
+    def test_no_retry_after_5xx(self):
+        StubBotAPI.responses = [
+            (502, {'ok': False, 'description': 'Bad Gateway'}, {}, 0),
+            (200, {'ok': True, 'result': {'message_id': 1}}, {}, 0),
+        ]
+        self.assertFalse(self.client.send_message(100, 'Привет'))
+        self.assertEqual(len(StubBotAPI.requests), 1)
+
+    def test_no_retry_after_read_timeout(self):
+        StubBotAPI.responses = [
+            (200, {'ok': True, 'result': {'message_id': 1}}, {}, 1.0),
+            (200, {'ok': True, 'result': {'message_id': 2}}, {}, 0),
+        ]
+        self.assertFalse(self.client.send_message(100, 'Привет'))
+        self.assertEqual(len(StubBotAPI.requests), 1)
+
+
+class BroadcastDeliverTests(StubBotAPITestCase):
+    """Рассылка: повтор только при 429, при неизвестной доставке - ошибка без повтора"""
+
+    def deliver(self):
+        worker = BroadcastWorker(1, rate=100, api_url=self.api_url, token='42:TEST')
+        recipient = SimpleNamespace(chat_id=100, attempts=0, status='sending', error='', sent_at=None)
+
+        async def run():
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=0.5)) as http:
+                await worker._deliver(http, 'Привет', recipient)
+
+        asyncio.run(run())
+        return recipient
+
+    def test_retries_after_429(self):
+        StubBotAPI.responses = [
+            (429, {'ok': False, 'description': 'Too Many Requests', 'parameters': {'retry_after': 0}}, {}, 0),
+            (200, {'ok': True, 'result': {'message_id': 1}}, {}, 0),
+        ]
+        self.assertEqual(self.deliver().status, 'sent')
+        self.assertEqual(len(StubBotAPI.requests), 2)
+
+    def test_no_retry_after_5xx(self):
+        StubBotAPI.responses = [
+            (502, {'ok': False, 'description': 'Bad Gateway'}, {}, 0),
+            (200, {'ok': True, 'result': {'message_id': 1}}, {}, 0),
+        ]
+        recipient = self.deliver()
+        self.assertEqual((recipient.status, recipient.error), ('failed', '502: Bad Gateway'))
+        self.assertEqual(len(StubBotAPI.requests), 1)
+
+    def test_no_retry_after_timeout(self):
+        StubBotAPI.responses = [
+            (200, {'ok': True, 'result': {'message_id': 1}}, {}, 1.0),
+            (200, {'ok': True, 'result': {'message_id': 2}}, {}, 0),
+        ]
+        recipient = self.deliver()
+        self.assertEqual(recipient.status, 'failed')
+        self.assertIn('Timeout', recipient.error)
+        self.assertEqual(len(StubBotAPI.requests), 1)
+
+
+class BroadcastActionTests(TestCase):
+    """Рассылка по выбранным пользователям - только активным, как segment_queryset"""
+
+    def test_inactive_users_are_skipped(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        users = [TelegramUser.objects.create(telegram_id=2000 + n, status=status)
+                 for n, status in enumerate([UserStatus.ACTIVE, UserStatus.ACTIVE, UserStatus.NEW,
+                                             UserStatus.BLOCKED_ADMIN])]
+
+        response = self.client.post(reverse('admin:barsuk_app_telegramuser_changelist'), {
+            'action': 'create_broadcast_for_users',
+            '_selected_action': [user.id for user in users],
+        }, follow=True)
+
+        broadcast = Broadcast.objects.get()
+        self.assertEqual(broadcast.total_count, 2)
+        self.assertEqual(set(broadcast.recipients.values_list('user__status', flat=True)), {UserStatus.ACTIVE})
+        self.assertContains(response, 'Пропущено неактивных пользователей: 2')
+
+
+class ExportTests(TransactionTestCase):
+    """Выгрузки списков: CSV потоком, XLSX фоновым заданием, брошенные задания - в ошибку"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.admin)
+        self.users = [TelegramUser.objects.create(telegram_id=3000 + n, username=f'user{n}',
+                                                  status=UserStatus.ACTIVE if n % 2 else UserStatus.NEW)
+                      for n in range(6)]
+        self.changelist = reverse('admin:barsuk_app_telegramuser_changelist')
+
+    def test_csv_streams_selected_rows(self):
+        response = self.client.post(self.changelist, {
+            'action': 'export_csv',
+            '_selected_action': [user.id for user in self.users[:3]],
+        })
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['ID', 'Telegram ID'])
+        self.assertEqual(sorted(line.split(',')[1] for line in lines[1:]), ['3000', '3001', '3002'])
+
+    def test_xlsx_job_exports_filtered_list(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(MEDIA_ROOT=directory):
+            # "Выбрать все" при фильтре по статусу: в задании только параметры списка
+            response = self.client.post(f'{self.changelist}?status__exact={UserStatus.ACTIVE}', {
+                'action': 'export_xlsx',
+                'select_across': '1',
+                '_selected_action': [self.users[1].id],
+            })
+            self.assertRedirects(response, reverse('admin:barsuk_app_exportjob_changelist'))
+            job = ExportJob.objects.get()
+            self.assertEqual((job.params, job.pks), ({'status__exact': [UserStatus.ACTIVE]}, None))
+
+            for _ in range(100):
+                job.refresh_from_db()
+                if job.status in ('done', 'failed'):
+                    break
+                time.sleep(0.05)
+
+            self.assertEqual((job.status, job.error, job.rows), ('done', '', 3))
+            sheet = load_workbook(job.file.path, read_only=True).worksheets[0]
+            telegram_ids = sorted(row[1] for row in sheet.iter_rows(min_row=2, values_only=True))
+            self.assertEqual(telegram_ids, [3001, 3003, 3005])
+
+    def test_stale_job_is_failed(self):
+        stale = ExportJob.objects.create(model='barsuk_app.telegramuser', status='running', created_by=self.admin,
+                                         heartbeat_at=timezone.now() - timedelta(seconds=STALE_AFTER + 1))
+        alive = ExportJob.objects.create(model='barsuk_app.telegramuser', status='running', created_by=self.admin,
+                                         heartbeat_at=timezone.now())
+
+        self.client.get(reverse('admin:barsuk_app_exportjob_changelist'))
+        stale.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual(stale.status, 'failed')
+        self.assertTrue(stale.error)
+        self.assertEqual(alive.status, 'running')
@@ -1,67 +1,95 @@
+from datetime import timedelta
+
+from django import forms
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.admin.views.decorators import staff_member_required
-from django.contrib import messages
-from .models import Request
-from .admin_actions import send_telegram_message
-import json
+from django.contrib import admin, messages
+from django.utils import timezone
+from .models import ExportJob, Request
+from .admin_actions import REPLY_PENDING, send_reply_in_background
+from .funnel import funnel_freshness, funnel_report, refresh_funnel
+from .metrics import registry
 
 
 @staff_member_required
 def reply_to_request_view(request, request_id):
     """View для ответа на заявку"""
-    print("\n" + "=" * 50)
-    print(f"🔍 ВХОД В VIEW для заявки #{request_id}")
-    print(f"Метод запроса: {request.method}")
-
-    request_obj = get_object_or_404(Request, id=request_id)
-
-    print(f"Заявка: #{request_obj.id}")
-    print(f"Тип: {request_obj.request_type}")
-    print(f"Пользователь: {request_obj.user}")
-    print(f"Telegram ID: {request_obj.user.telegram_id}")
+    request_obj = get_object_or_404(Request.objects.select_related('user'), id=request_id)
 
     if request.method == 'POST':
-        print("\n📨 ПОЛУЧЕН POST ЗАПРОС")
         reply_text = request.POST.get('reply', '').strip()
-        print(f"Текст ответа: {reply_text[:50]}...")
 
         if reply_text:
-            # Отправляем ответ пользователю
             user = request_obj.user
-            print(f"Telegram ID пользователя: {user.telegram_id}")
 
             if user and user.telegram_id:
                 message = f"📬 <b>Ответ на вашу заявку #{request_obj.id}</b>\n\n{reply_text}"
-                print(f"Формируем сообщение: {message[:50]}...")
-
-                print("🚀 Вызываем send_telegram_message...")
-                result = send_telegram_message(user.telegram_id, message)
-                print(f"Результат отправки: {result}")
-
-                if result:
-                    print("✅ Отправка успешна!")
-                    # Сохраняем ответ в заметках
-                    notes = f"Ответ менеджера ({request.user.username}):\n{reply_text}\n\n[reply_sent]"
-                    request_obj.manager_notes = notes
-                    request_obj.status = 'done'
-                    request_obj.save()
-
-                    messages.success(request, f'✅ Ответ отправлен пользователю!')
-                    print("✅ Перенаправление на список заявок")
-                    return redirect('admin:barsuk_app_request_changelist')
-                else:
-                    print("❌ Ошибка при отправке сообщения")
-                    messages.error(request, '❌ Ошибка при отправке сообщения в Telegram')
+
+                # Сохраняем ответ сразу, отправка идет в фоне - статус виден в списке заявок
+                request_obj.manager_notes = (
+                    f"Ответ менеджера ({request.user.username}):\n{reply_text}\n\n{REPLY_PENDING}"
+                )
+                request_obj.save()
+                send_reply_in_background(request_obj, message, on_sent_status='done')
+
+                messages.success(request, '📤 Ответ поставлен в отправку, статус доставки - в колонке «Статус ответа»')
+                return redirect('admin:barsuk_app_request_changelist')
             else:
-                print("❌ У пользователя нет Telegram ID")
                 messages.error(request, '❌ У пользователя нет Telegram ID')
         else:
-            print("❌ Введите текст ответа")
             messages.error(request, '❌ Введите текст ответа')
 
-    print("=" * 50 + "\n")
-
     return render(request, 'admin/reply_to_request.html', {
         'request_obj': request_obj,
         'title': f'Ответ на заявку #{request_obj.id}'
-    })
\ No newline at end of file
+    })
+
+
+class FunnelPeriodForm(forms.Form):
+    date_from = forms.DateField(label='Когорты с', widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(label='по', widget=forms.DateInput(attrs={'type': 'date'}))
+
+
+@staff_member_required
+def funnel_view(request):
+    """Воронка регистрации и удержание по дням когорт"""
+    if request.method == 'POST':
+        # Дообработать новые события, не больше нескольких пачек за запрос
+        processed = refresh_funnel(max_batches=20)
+        messages.success(request, f'🔄 Обработано новых событий: {processed}')
+        return redirect(request.get_full_path())
+
+    today = timezone.localdate()
+    form = FunnelPeriodForm(request.GET or {'date_from': today - timedelta(days=29), 'date_to': today})
+    report = None
+    if form.is_valid():
+        report = funnel_report(form.cleaned_data['date_from'], form.cleaned_data['date_to'])
+
+    return render(request, 'admin/funnel.html', {
+        **admin.site.each_context(request),
+        'title': 'Воронка регистрации',
+        'form': form,
+        'report': report,
+        'freshness': funnel_freshness(),
+    })
+
+
+@staff_member_required
+def download_export_view(request, job_id):
+    """Скачивание готовой выгрузки (только автор или суперпользователь)"""
+    job = get_object_or_404(ExportJob, id=job_id, status='done')
+    if not request.user.is_superuser and job.created_by_id != request.user.id:
+        raise Http404
+    if not job.file:
+        raise Http404
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=job.file.name.split('/')[-1])
+
+
+def metrics_view(request):
+    """Метрики Prometheus: с адресов METRICS_ALLOWED_IPS или для сотрудников"""
+    allowed = request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+    if not allowed and not (request.user.is_authenticated and request.user.is_staff):
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; charset=utf-8')
@@ -1,11 +1,23 @@
+from .debug import register_debug_handlers
 from .start import register_start_handlers
-from .main_menu import register_main_menu_handlers
-from .request import register_requests_handlers
+from .main_menu import register_main_menu_handlers, router as main_menu_router
+from .request import register_requests_handlers, router as request_router, form_router
+from .utils.database import async_session
+from .utils.middlewares import AccessMiddleware
+
+# Роутеры, хендлерам которых не нужна сессия БД
+NO_DB_ROUTERS = (form_router.name,)
+
+# Роутеры только для зарегистрированных активных пользователей
+# (регистрация - app/start.py - доступна всем)
+AccessMiddleware(async_session).attach(main_menu_router, request_router, form_router)
 
 def setup_handlers(dp):
     """
     Регистрация всех хендлеров для бота.
     """
+    # Первым: отладочные команды администраторов не должны перехватываться шагами форм
+    register_debug_handlers(dp)
     register_start_handlers(dp)
     register_main_menu_handlers(dp)
     register_requests_handlers((dp))
\ No newline at end of file
@@ -0,0 +1,57 @@
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+from app.utils.profiler import profiler
+from app.utils.query_budget import format_top, query_stats
+from config import Config
+
+router = Router(name="debug")
+
+# Отладочные команды только для ADMIN_IDS; остальным бот на них не отвечает
+router.message.filter(F.from_user.id.in_(Config.ADMIN_IDS))
+
+
+@router.message(Command("queries"), flags={"db": False})
+async def query_top(message: Message, command: CommandObject):
+    """
+    Топ запросов к БД за последние 1-2 окна QUERY_STATS_WINDOW:
+    /queries - по суммарному времени, /queries max - по максимуму,
+    /queries count - по числу выполнений, /queries reset - сбросить
+    """
+    arg = (command.args or "").strip().lower()
+    if arg == "reset":
+        query_stats.reset()
+        await message.answer("Статистика запросов сброшена")
+        return
+
+    by = {"max": "max", "count": "count"}.get(arg, "total")
+    text = format_top(query_stats.top(Config.QUERY_STATS_TOP, by=by))
+    # Лимит сообщения Telegram - 4096 символов
+    await message.answer(text[:4000], parse_mode=None)
+
+
+@router.message(Command("profile"), flags={"db": False})
+async def profile(message: Message, command: CommandObject):
+    """
+    Профилирование бота: /profile - на PROFILE_SECONDS, /profile 60 - на 60 с,
+    /profile stop - остановить досрочно. Результаты - в PROFILE_DIR
+    """
+    arg = (command.args or "").strip().lower()
+    if arg == "stop":
+        if not profiler.is_running:
+            await message.answer("Профилирование не запущено")
+            return
+        profiler.stop()
+        await message.answer(f"Профилирование остановлено, результаты - в {profiler.directory}")
+        return
+
+    seconds = profiler.start(float(arg) if arg.replace(".", "", 1).isdigit() else None)
+    if seconds is None:
+        await message.answer("Профилирование уже идет: /profile stop - остановить")
+        return
+    await message.answer(f"Профилирование включено на {seconds:.0f} с, результаты - в {profiler.directory}")
+
+
+def register_debug_handlers(dp):
+    dp.include_router(router)
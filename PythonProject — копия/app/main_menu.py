@@ -1,64 +1,38 @@
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message, CallbackQuery
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 
-from app.utils.database import log_event, User, UserStatus, ContentCategory, ContentItem
+from app.utils.database import log_event
 from app.utils.keyboards import get_main_menu_keyboard
 from app.utils.texts.messages import RULES_TEXT
-from app.utils.content import get_categories, get_category_items, format_category_text
+from app.utils.content import menu_cache
 
 router = Router()
 
-# Мидлварь для проверки доступа
-async def check_access(message: Message, db: AsyncSession):
-    """Проверяет, есть ли у пользователя доступ к функциям"""
-    user_id = message.from_user.id
-
-    stmt = select(User).where(User.telegram_id == user_id)
-    result = await db.execute(stmt)
-    user = result.scalar_one_or_none()
-
-    if not user or user.status != UserStatus.ACTIVE:
-        await message.answer(
-            "❌ Доступ запрещен. Пройдите регистрацию через /start"
-        )
-        return False
-    return True
+# Доступ (только активные пользователи) проверяет AccessMiddleware, см. app/__init__.py
 
 
 # Главное меню - ПОКАЗ КАТЕГОРИЙ
-@router.message(F.text == "📌 Меню / Программы")
+@router.message(F.text == "📌 Меню / Программы", flags={"throttle": {"rate": 0.5, "burst": 2}})
 async def menu_programs(message: Message, db: AsyncSession):
     """
     Показ категорий меню из базы данных
     """
-    if not await check_access(message, db):
-        return
-
     await log_event(db, message.from_user.id, "menu_opened")
 
-    # Получаем категории из БД
-    categories = await get_categories(db)
+    # Категории берем из кэша меню
+    menu = await menu_cache.get(db)
 
-    if not categories:
+    if not menu.categories_keyboard:
         await message.answer(
             "🍷 Меню временно не доступно. Скоро обновим!",
             reply_markup=get_main_menu_keyboard()
         )
         return
 
-    # Создаем инлайн клавиатуру с категориями
-    keyboard_buttons = []
-    for cat in categories:
-        keyboard_buttons.append([InlineKeyboardButton(
-            text=cat.name,
-            callback_data=f"category_{cat.id}"
-        )])
-
     await message.answer(
         "🍷 <b>Наше меню:</b>\n\nВыберите категорию:",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_buttons),
+        reply_markup=menu.categories_keyboard,
         parse_mode="HTML"
     )
 
@@ -69,42 +43,15 @@ async def show_category(callback: CallbackQuery, db: AsyncSession):
     """Показ позиций выбранной категории"""
     category_id = int(callback.data.split("_")[1])
 
-    # Получаем категорию
-    from sqlalchemy import select
-    from app.utils.database import ContentCategory
-
-    stmt = select(ContentCategory).where(ContentCategory.id == category_id)
-    result = await db.execute(stmt)
-    category = result.scalar_one_or_none()
+    # Готовый текст и клавиатура категории из кэша меню
+    menu = await menu_cache.get(db)
+    rendered = menu.category(category_id)
 
-    if not category:
+    if not rendered:
         await callback.answer("Категория не найдена")
         return
 
-    # Получаем позиции категории
-    items = await get_category_items(db, category_id)
-
-    if not items:
-        await callback.message.edit_text(
-            f"<b>{category.name}</b>\n\nВ этой категории пока нет позиций",
-            parse_mode="HTML"
-        )
-        return
-
-    # Форматируем текст с позициями
-    text = f"<b>{category.name}</b>\n\n"
-
-    for item in items:
-        text += f"• <b>{item.name}</b>\n"
-        if item.description:
-            text += f"  {item.description}\n"
-        text += f"  {item.price_display}\n\n"
-
-    # Кнопка "Назад к категориям"
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="◀️ Назад к меню", callback_data="back_to_menu")]
-    ])
-
+    text, keyboard = rendered
     await callback.message.edit_text(
         text,
         parse_mode="HTML",
@@ -117,27 +64,19 @@ async def show_category(callback: CallbackQuery, db: AsyncSession):
 @router.callback_query(F.data == "back_to_menu")
 async def back_to_menu(callback: CallbackQuery, db: AsyncSession):
     """Возврат к списку категорий"""
-    # Получаем категории из БД
-    categories = await get_categories(db)
+    # Категории берем из кэша меню
+    menu = await menu_cache.get(db)
 
-    if not categories:
+    if not menu.categories_keyboard:
         await callback.message.edit_text(
             "🍷 Меню временно не доступно.",
             parse_mode="HTML"
         )
         return
 
-    # Создаем клавиатуру с категориями
-    keyboard_buttons = []
-    for cat in categories:
-        keyboard_buttons.append([InlineKeyboardButton(
-            text=cat.name,
-            callback_data=f"category_{cat.id}"
-        )])
-
     await callback.message.edit_text(
         "🍷 <b>Наше меню:</b>\n\nВыберите категорию:",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_buttons),
+        reply_markup=menu.categories_keyboard,
         parse_mode="HTML"
     )
     await callback.answer()
@@ -149,9 +88,6 @@ async def send_rules(message: Message, db: AsyncSession):
     """
     Отправка правил клуба
     """
-    if not await check_access(message, db):
-        return
-
     await log_event(db, message.from_user.id, "rules_opened")
     await message.answer(
         RULES_TEXT,
@@ -163,9 +99,6 @@ async def send_rules(message: Message, db: AsyncSession):
 # Заглушки для будущих функций
 @router.message(F.text == "⭐ Мой статус")
 async def my_status(message: Message, db: AsyncSession):
-    if not await check_access(message, db):
-        return
-
     await message.answer(
         "⭐ <b>Система лояльности</b>\n\n"
         "Функция будет доступна в следующем обновлении.\n"
@@ -176,9 +109,6 @@ async def my_status(message: Message, db: AsyncSession):
 
 @router.message(F.text == "🎁 Промокоды")
 async def promocodes(message: Message, db: AsyncSession):
-    if not await check_access(message, db):
-        return
-
     await message.answer(
         "🎁 <b>Промокоды и акции</b>\n\n"
         "Функция будет доступна в следующем обновлении.\n"
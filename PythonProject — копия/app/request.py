@@ -3,11 +3,11 @@ from aiogram.types import Message, ReplyKeyboardRemove
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from datetime import datetime
 
 # ИСПРАВЛЕННЫЕ ИМПОРТЫ
-from app.utils.database import Request, User, log_event
+from app.utils.database import log_event
+from app.utils.outbox import outbox_dispatcher
+from app.utils.submission import submit_request
 from app.utils.keyboards import (
     get_main_menu_keyboard, get_cancel_keyboard,
     get_confirm_keyboard, get_edit_fields_keyboard
@@ -15,6 +15,10 @@ from app.utils.keyboards import (
 
 router = Router()
 
+# Шаги заполнения форм - чистый FSM без обращений к БД,
+# DatabaseMiddleware не создает для них сессию
+form_router = Router(name="request_forms")
+
 
 # ====== СОСТОЯНИЯ ДЛЯ FSM ======
 
@@ -46,21 +50,6 @@ async def cancel_request(message: Message, state: FSMContext):
     await state.clear()
 
 
-async def get_user_info(db: AsyncSession, user_id: int) -> dict:
-    """Получение информации о пользователе"""
-    stmt = select(User).where(User.telegram_id == user_id)
-    result = await db.execute(stmt)
-    user = result.scalar_one_or_none()
-
-    if user:
-        return {
-            "name": f"{user.first_name or ''} {user.last_name or ''}".strip(),
-            "phone": user.phone or "Не указан",
-            "username": f"@{user.username}" if user.username else "Нет username"
-        }
-    return {"name": "Неизвестно", "phone": "Не указан", "username": "Нет username"}
-
-
 # ====== ТРАНСФЕР (ПОЛНАЯ ФОРМА) ======
 
 @router.message(F.text == "🚖 Заказать трансфер")
@@ -79,7 +68,7 @@ async def start_transfer_request(message: Message, db: AsyncSession, state: FSMC
     )
 
 
-@router.message(TransferRequestStates.address)
+@form_router.message(TransferRequestStates.address)
 async def process_transfer_address(message: Message, state: FSMContext):
     """Обработка адреса"""
     if message.text == "❌ Отмена":
@@ -99,7 +88,7 @@ async def process_transfer_address(message: Message, state: FSMContext):
     )
 
 
-@router.message(TransferRequestStates.date)
+@form_router.message(TransferRequestStates.date)
 async def process_transfer_date(message: Message, state: FSMContext):
     """Обработка даты"""
     if message.text == "❌ Отмена":
@@ -127,7 +116,7 @@ async def process_transfer_date(message: Message, state: FSMContext):
     )
 
 
-@router.message(TransferRequestStates.time)
+@form_router.message(TransferRequestStates.time)
 async def process_transfer_time(message: Message, state: FSMContext):
     """Обработка времени"""
     if message.text == "❌ Отмена":
@@ -151,7 +140,7 @@ async def process_transfer_time(message: Message, state: FSMContext):
     )
 
 
-@router.message(TransferRequestStates.guests)
+@form_router.message(TransferRequestStates.guests)
 async def process_transfer_guests(message: Message, state: FSMContext):
     """Обработка количества гостей"""
     if message.text == "❌ Отмена":
@@ -175,7 +164,7 @@ async def process_transfer_guests(message: Message, state: FSMContext):
     )
 
 
-@router.message(TransferRequestStates.comment)
+@form_router.message(TransferRequestStates.comment)
 async def process_transfer_comment(message: Message, state: FSMContext):
     """Обработка комментария"""
     if message.text == "❌ Отмена":
@@ -232,45 +221,31 @@ async def process_transfer_confirm(message: Message, db: AsyncSession, state: FS
 
     if message.text == "✅ Да, отправить":
         data = await state.get_data()
-        user_info = await get_user_info(db, message.from_user.id)
 
-        # ===== ИСПРАВЛЕНИЕ: сначала находим пользователя по telegram_id =====
-        stmt = select(User).where(User.telegram_id == message.from_user.id)
-        result = await db.execute(stmt)
-        user = result.scalar_one_or_none()
-
-        if not user:
-            await message.answer(
-                "❌ Ошибка: пользователь не найден. Попробуйте перезапустить бота /start",
-                reply_markup=get_main_menu_keyboard()
-            )
-            await state.clear()
-            return
-
-        # Сохраняем заявку в базу с правильным user.id
-        request = Request(
-            user_id=user.id,  # ВАЖНО: используем внутренний ID, а не telegram_id
-            request_type="transfer",
+        # Заявка, событие и уведомление менеджерам - одним запросом
+        request = await submit_request(
+            db, message.from_user.id, "transfer",
             data={
                 "address": data.get('address'),
                 "date": data.get('date'),
                 "time": data.get('time'),
                 "guests": data.get('guests'),
                 "comment": data.get('comment', ''),
-                "user_info": user_info
             },
-            status="new",
-            created_at=datetime.utcnow()
+            event_type="transfer_request_submitted",
+            event_data={
+                "address": data.get('address'),
+                "guests": data.get('guests')
+            },
         )
 
-        db.add(request)
-        await db.commit()
-
-        await log_event(db, message.from_user.id, "transfer_request_submitted", {
-            "request_id": request.id,
-            "address": data.get('address'),
-            "guests": data.get('guests')
-        })
+        if not request:
+            await message.answer(
+                "❌ Ошибка: пользователь не найден. Попробуйте перезапустить бота /start",
+                reply_markup=get_main_menu_keyboard()
+            )
+            await state.clear()
+            return
 
         # Уведомление пользователю
         await message.answer(
@@ -282,14 +257,14 @@ async def process_transfer_confirm(message: Message, db: AsyncSession, state: FS
             parse_mode="HTML"
         )
 
-        # Отправляем уведомление менеджеру
-        await notify_manager_about_request(request, user_info)
+        # Уведомление менеджеру уже в outbox - будим диспетчер, доставка в фоне
+        outbox_dispatcher.wake()
 
         await state.clear()
         return
 
 
-@router.message(TransferRequestStates.edit)
+@form_router.message(TransferRequestStates.edit)
 async def process_transfer_edit(message: Message, state: FSMContext):
     """Редактирование полей заявки"""
     if message.text == "❌ Отмена":
@@ -346,7 +321,7 @@ async def start_manager_request(message: Message, db: AsyncSession, state: FSMCo
     )
 
 
-@router.message(ManagerRequestStates.message)
+@form_router.message(ManagerRequestStates.message)
 async def process_manager_message(message: Message, state: FSMContext):
     """Обработка сообщения менеджеру"""
     if message.text == "❌ Отмена":
@@ -399,14 +374,16 @@ async def process_manager_confirm(message: Message, db: AsyncSession, state: FSM
 
     if message.text == "✅ Да, отправить":
         data = await state.get_data()
-        user_info = await get_user_info(db, message.from_user.id)
 
-        # ===== ИСПРАВЛЕНИЕ: сначала находим пользователя по telegram_id =====
-        stmt = select(User).where(User.telegram_id == message.from_user.id)
-        result = await db.execute(stmt)
-        user = result.scalar_one_or_none()
+        # Заявка, событие и уведомление менеджерам - одним запросом
+        request = await submit_request(
+            db, message.from_user.id, "manager",
+            data={"message": data.get('message')},
+            event_type="manager_request_submitted",
+            event_data={"message_length": len(data.get('message', ''))},
+        )
 
-        if not user:
+        if not request:
             await message.answer(
                 "❌ Ошибка: пользователь не найден. Попробуйте перезапустить бота /start",
                 reply_markup=get_main_menu_keyboard()
@@ -414,26 +391,6 @@ async def process_manager_confirm(message: Message, db: AsyncSession, state: FSM
             await state.clear()
             return
 
-        # Сохраняем заявку в базу с правильным user.id
-        request = Request(
-            user_id=user.id,  # ВАЖНО: используем внутренний ID, а не telegram_id
-            request_type="manager",
-            data={
-                "message": data.get('message'),
-                "user_info": user_info
-            },
-            status="new",
-            created_at=datetime.utcnow()
-        )
-
-        db.add(request)
-        await db.commit()
-
-        await log_event(db, message.from_user.id, "manager_request_submitted", {
-            "request_id": request.id,
-            "message_length": len(data.get('message', ''))
-        })
-
         # Уведомление пользователю
         await message.answer(
             f"✅ <b>Заявка №{request.id} отправлена!</b>\n\n"
@@ -444,8 +401,8 @@ async def process_manager_confirm(message: Message, db: AsyncSession, state: FSM
             parse_mode="HTML"
         )
 
-        # Отправляем уведомление менеджеру
-        await notify_manager_about_request(request, user_info)
+        # Уведомление менеджеру уже в outbox - будим диспетчер, доставка в фоне
+        outbox_dispatcher.wake()
 
         await state.clear()
         return
@@ -475,19 +432,6 @@ def _validate_time(time_text: str) -> bool:
         return False
 
 
-async def notify_manager_about_request(request: Request, user_info: dict):
-    """
-    Уведомление менеджера о новой заявке
-    Пока заглушка - потом реализуем через Telegram бота или веб-хук
-    """
-    print(f"\n🔔 НОВАЯ ЗАЯВКА #{request.id}")
-    print(f"Тип: {request.request_type}")
-    print(f"Пользователь: {user_info['name']}")
-    print(f"Телефон: {user_info['phone']}")
-    print(f"Username: {user_info['username']}")
-    print(f"Время: {request.created_at}")
-    print("-" * 40)
-
-
 def register_requests_handlers(dp):
-    dp.include_router(router)
\ No newline at end of file
+    dp.include_router(router)
+    dp.include_router(form_router)
\ No newline at end of file
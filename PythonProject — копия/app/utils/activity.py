@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, column, or_, update, values
+
+from app.utils.database import User, async_session
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityTracker:
+    """
+    Отложенная запись last_activity пользователей.
+
+    Каждое действие пользователя отмечается в памяти, но не чаще раза в
+    granularity секунд на пользователя. Раз в flush_interval накопленные
+    отметки пишутся одним UPDATE ... FROM (VALUES ...), вместо отдельного
+    UPDATE на каждое сообщение. Пачка, которую не удалось записать, остается
+    в очереди до следующей записи. При остановке остаток дописывается.
+    """
+
+    def __init__(self, session_pool, granularity: float = 60.0, flush_interval: float = 30.0,
+                 batch_size: int = 1000):
+        self.session_pool = session_pool
+        self.granularity = granularity
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        # telegram_id -> время последней учтенной отметки (monotonic)
+        self._last_touch = {}
+        # telegram_id -> last_activity, которое еще не записано
+        self._pending = {}
+        self._task = None
+        self._lock = asyncio.Lock()
+
+        # Счетчики
+        self.touches = 0
+        self.recorded = 0
+        self.flushed = 0
+        self.failed = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def touch(self, telegram_id: int):
+        """Отметить активность пользователя (без обращения к БД)"""
+        self.touches += 1
+        now = time.monotonic()
+        last = self._last_touch.get(telegram_id)
+        if last is not None and now - last < self.granularity:
+            return
+        self._last_touch[telegram_id] = now
+        self._pending[telegram_id] = datetime.utcnow()
+        self.recorded += 1
+
+    async def start(self):
+        if self.is_running:
+            return
+        self._task = asyncio.create_task(self._run(), name="activity-tracker")
+
+    async def stop(self):
+        """Остановка с записью всех накопленных отметок"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "touches": self.touches,
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "pending": len(self._pending),
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """Записать накопленные отметки пачками"""
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            self._forget_stale()
+
+            rows = list(pending.items())
+            for start in range(0, len(rows), self.batch_size):
+                batch = rows[start:start + self.batch_size]
+                try:
+                    await self._write(batch)
+                    self.flushed += len(batch)
+                except Exception:
+                    self.failed += len(batch)
+                    self._requeue(batch)
+                    logger.exception("Не удалось записать last_activity для %s пользователей, повтор "
+                                     "при следующей записи", len(batch))
+
+    def _requeue(self, batch):
+        # Пока шла запись, могли прийти новые отметки - из двух остается более поздняя
+        for telegram_id, last_activity in batch:
+            current = self._pending.get(telegram_id)
+            if current is None or current < last_activity:
+                self._pending[telegram_id] = last_activity
+
+    def _forget_stale(self):
+        # Отметки старше granularity больше ничего не ограничивают
+        threshold = time.monotonic() - self.granularity
+        self._last_touch = {tid: ts for tid, ts in self._last_touch.items() if ts > threshold}
+
+    async def _write(self, batch):
+        activity = values(
+            column("telegram_id", BigInteger),
+            column("last_activity", DateTime),
+            name="activity",
+        ).data(batch)
+
+        stmt = (
+            update(User)
+            .where(User.telegram_id == activity.c.telegram_id)
+            .where(or_(User.last_activity.is_(None), User.last_activity < activity.c.last_activity))
+            # updated_at не трогаем: активность - не изменение профиля (иначе сработает onupdate)
+            .values(last_activity=activity.c.last_activity, updated_at=User.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        async with self.session_pool() as db:
+            await db.execute(stmt)
+            await db.commit()
+
+
+activity_tracker = ActivityTracker(
+    async_session,
+    granularity=Config.ACTIVITY_GRANULARITY,
+    flush_interval=Config.ACTIVITY_FLUSH_INTERVAL,
+)
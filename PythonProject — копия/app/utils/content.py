@@ -1,7 +1,13 @@
-from sqlalchemy import select
+import asyncio
+import time
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from sqlalchemy import select, func, literal_column
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.utils.database import ContentCategory, ContentItem
+from config import Config
 
 
 async def get_categories(db: AsyncSession):
@@ -23,14 +29,129 @@ async def get_category_items(db: AsyncSession, category_id: int):
     return result.scalars().all()
 
 
-async def format_category_text(category, items):
+async def get_active_items(db: AsyncSession):
+    """Получение всех активных позиций (для сборки меню целиком)"""
+    stmt = select(ContentItem).where(
+        ContentItem.is_active == True
+    ).order_by(ContentItem.category_id, ContentItem.order)
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+
+def format_category_text(category, items):
     """Форматирование текста категории"""
-    text = f"<b>{category.name}</b>\n\n"
+    if not items:
+        return f"<b>{category.name}</b>\n\nВ этой категории пока нет позиций"
 
+    parts = [f"<b>{category.name}</b>\n\n"]
     for item in items:
-        text += f"• <b>{item.name}</b>\n"
+        parts.append(f"• <b>{item.name}</b>\n")
         if item.description:
-            text += f"  {item.description}\n"
-        text += f"  {item.price_display}\n\n"
+            parts.append(f"  {item.description}\n")
+        parts.append(f"  {item.price_display}\n\n")
+
+    return "".join(parts)
+
+
+BACK_TO_MENU_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="◀️ Назад к меню", callback_data="back_to_menu")]
+])
+
+
+class MenuCache:
+    """
+    Готовые тексты и клавиатуры меню.
+
+    Меню собирается целиком двумя запросами и хранится в памяти.
+    Пересборка - по NOTIFY из админки (см. barsuk_app/signals.py) или если
+    при периодической проверке изменилась версия контента. Между проверками
+    показ меню не обращается к БД.
+    """
+
+    def __init__(self, check_interval: float = 60.0):
+        self.check_interval = check_interval
+        self._lock = asyncio.Lock()
+        self._version = None
+        self._checked_at = None
+        # Растет при каждом NOTIFY, чтобы сброс во время пересборки не потерялся
+        self._generation = 0
+
+        # Клавиатура категорий (None - меню пустое)
+        self.categories_keyboard = None
+        # category_id -> (текст, клавиатура)
+        self._categories = {}
+
+    def invalidate(self, payload=None):
+        """Сброс по NOTIFY: при следующем показе меню будет собрано заново"""
+        self._version = None
+        self._checked_at = None
+        self._generation += 1
+
+    def category(self, category_id: int):
+        return self._categories.get(category_id)
+
+    async def get(self, db: AsyncSession) -> "MenuCache":
+        """Актуальное меню; обращается к БД только когда пора проверить версию"""
+        if self._is_fresh():
+            return self
+
+        async with self._lock:
+            if self._is_fresh():
+                return self
+
+            generation = self._generation
+            version = await self._load_version(db)
+            if version != self._version:
+                await self._rebuild(db)
+            if generation == self._generation:
+                self._version = version
+                self._checked_at = time.monotonic()
+        return self
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._checked_at is not None
+            and time.monotonic() - self._checked_at < self.check_interval
+        )
+
+    async def _load_version(self, db: AsyncSession):
+        # У категорий нет updated_at, поэтому для них берется хэш видимых полей
+        categories_hash = select(func.md5(func.string_agg(
+            func.concat_ws("|", ContentCategory.id, ContentCategory.name,
+                           ContentCategory.order, ContentCategory.is_active),
+            aggregate_order_by(literal_column("','"), ContentCategory.id)
+        ))).scalar_subquery()
+
+        stmt = select(
+            func.count(ContentItem.id),
+            func.max(ContentItem.updated_at),
+            categories_hash,
+        )
+        result = await db.execute(stmt)
+        return tuple(result.one())
+
+    async def _rebuild(self, db: AsyncSession):
+        categories = await get_categories(db)
+        items = await get_active_items(db)
+
+        items_by_category = {}
+        for item in items:
+            items_by_category.setdefault(item.category_id, []).append(item)
+
+        rendered = {}
+        for category in categories:
+            category_items = items_by_category.get(category.id, [])
+            keyboard = BACK_TO_MENU_KEYBOARD if category_items else None
+            rendered[category.id] = (format_category_text(category, category_items), keyboard)
+
+        if categories:
+            self.categories_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text=cat.name, callback_data=f"category_{cat.id}")]
+                for cat in categories
+            ])
+        else:
+            self.categories_keyboard = None
+        self._categories = rendered
+
 
-    return text
\ No newline at end of file
+menu_cache = MenuCache(check_interval=Config.MENU_CACHE_CHECK_INTERVAL)
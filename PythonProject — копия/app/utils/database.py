@@ -1,10 +1,16 @@
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, Enum, Text, ForeignKey, JSON, BigInteger, DECIMAL
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from datetime import datetime
 import enum
-from sqlalchemy import select
+import time
+from sqlalchemy import select, func, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
+from app.utils import query_budget
+from app.utils.user_cache import CachedUser, user_cache
 from config import Config
 
 Base = declarative_base()
@@ -113,9 +119,76 @@ class ContentItem(Base):
         return "Цена по запросу"
 
 
+class Outbox(Base):
+    """Исходящие уведомления (транзакционный outbox, см. app/utils/outbox.py)"""
+    __tablename__ = "barsuk_app_outbox"
+
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String(50), nullable=False)
+    target = Column(String(100), nullable=False)  # telegram:<chat_id> или webhook
+    payload = Column(JSON, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
+    last_error = Column(Text, nullable=False, default="")
+    created_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class PoolStats:
+    """Статистика ожидания соединения из пула"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float):
+        self.checkouts += 1
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+
+pool_wait_stats = PoolStats()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, замеряющий время получения соединения. Для соединений
+    сверх pool_size в это время входит и открытие нового соединения с БД.
+    Таймаутами считаются только истекшие pool_timeout (ошибки подключения - нет).
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            pool_wait_stats.timeouts += 1
+            raise
+        finally:
+            pool_wait_stats.record(time.perf_counter() - started)
+
+
 # Настройки подключения к PostgreSQL
 DATABASE_URL = f"postgresql+asyncpg://{Config.DB_USER}:{Config.DB_PASSWORD}@{Config.DB_HOST}/{Config.DB_NAME}"
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=Config.DB_ECHO,
+    poolclass=TimedQueuePool,
+    pool_size=Config.DB_POOL_SIZE,
+    max_overflow=Config.DB_MAX_OVERFLOW,
+    pool_timeout=Config.DB_POOL_TIMEOUT,
+    pool_recycle=Config.DB_POOL_RECYCLE,
+    pool_pre_ping=Config.DB_POOL_PRE_PING,
+    connect_args={"prepared_statement_cache_size": Config.DB_STATEMENT_CACHE_SIZE},
+)
+
+# Запросы и время в БД на апдейт, медленные запросы (см. app/utils/query_budget.py)
+if Config.QUERY_BUDGET_ENABLED:
+    query_budget.install(engine.sync_engine)
 
 async_session = sessionmaker(
     bind=engine,
@@ -128,7 +201,24 @@ async def init_db():
     """Проверка подключения к БД"""
     async with engine.begin() as conn:
         pass
-    print("✅ Подключение к базе данных установлено")
+    print(f"✅ Подключение к базе данных установлено (профиль {Config.DB_PROFILE}, "
+          f"пул {Config.DB_POOL_SIZE}+{Config.DB_MAX_OVERFLOW})")
+
+
+def pool_stats() -> dict:
+    """Текущее состояние пула соединений"""
+    pool = engine.pool
+    checkouts = pool_wait_stats.checkouts
+    return {
+        "size": pool.size(),
+        "in_use": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "checkouts": checkouts,
+        "timeouts": pool_wait_stats.timeouts,
+        "wait_avg_ms": round(pool_wait_stats.total_wait / checkouts * 1000, 3) if checkouts else 0.0,
+        "wait_max_ms": round(pool_wait_stats.max_wait * 1000, 3),
+    }
 
 
 async def get_db():
@@ -137,52 +227,91 @@ async def get_db():
             yield session
 
 
-async def create_user(db: AsyncSession, telegram_user_id: str, username: str,
-                      first_name: str = None, last_name: str = None,
-                      language_code: str = "ru"):
+async def resolve_user(db: AsyncSession, telegram_id: int):
     """
-    Создать пользователя, если его ещё нет в базе данных.
+    Получить пользователя по telegram_id через кэш.
+    Возвращает CachedUser или None, если пользователь не зарегистрирован.
     """
-    telegram_id = int(telegram_user_id)
+    telegram_id = int(telegram_id)
+    cached = user_cache.get(telegram_id)
+    if cached is not None:
+        return cached
 
-    # Проверяем существующего пользователя
     stmt = select(User).where(User.telegram_id == telegram_id)
     result = await db.execute(stmt)
-    existing_user = result.scalar_one_or_none()
+    user = result.scalar_one_or_none()
+    if not user:
+        return None
 
-    if existing_user:
-        existing_user.last_activity = datetime.utcnow()
-        await db.commit()
-        return existing_user
+    cached = CachedUser.from_model(user)
+    user_cache.set(cached)
+    return cached
+
+
+async def notify_user_changed(db: AsyncSession, telegram_id: int):
+    """
+    Уведомить другие процессы бота об изменении пользователя.
+    NOTIFY доставляется только после commit текущей транзакции.
+    """
+    await db.execute(select(func.pg_notify(Config.USER_CACHE_CHANNEL, str(telegram_id))))
+
+
+async def create_user(db: AsyncSession, telegram_user_id: str, username: str,
+                      first_name: str = None, last_name: str = None,
+                      language_code: str = "ru") -> CachedUser:
+    """
+    Создать пользователя, если его ещё нет в базе данных, иначе обновить last_activity.
 
-    # Создаем нового пользователя
-    new_user = User(
+    Один INSERT ... ON CONFLICT (telegram_id) DO UPDATE ... RETURNING, поэтому
+    одновременные /start одного пользователя не конфликтуют. Событие bot_start
+    пишется только для действительно новой строки (xmax = 0).
+    """
+    telegram_id = int(telegram_user_id)
+    now = datetime.utcnow()
+
+    stmt = pg_insert(User).values(
         telegram_id=telegram_id,
         username=username,
         first_name=first_name,
         last_name=last_name,
         language_code=language_code,
         status=UserStatus.NEW,
-        created_at=datetime.utcnow(),
-        last_activity=datetime.utcnow()
+        created_at=now,
+        updated_at=now,
+        last_activity=now,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={"last_activity": now, "updated_at": now},
+    ).returning(
+        User.id, User.telegram_id, User.status, User.username,
+        User.first_name, User.last_name, User.phone,
+        literal_column("xmax = 0").label("inserted"),
     )
 
-    db.add(new_user)
+    row = (await db.execute(stmt)).one()
     await db.commit()
-    await db.refresh(new_user)
 
-    # Логируем событие
-    await log_event(db, telegram_id, "bot_start")
+    user = CachedUser.from_model(row)
+    user_cache.set(user)
+
+    if row.inserted:
+        await log_event(db, telegram_id, "bot_start")
 
-    return new_user
+    return user
 
 
 async def log_event(db: AsyncSession, telegram_id: int, event_type: str, event_data: dict = None):
     """Логирование события пользователя"""
+    # Основной путь - через фоновую очередь, которая пишет события пачками
+    from app.utils.events import event_sink
+    if event_sink.is_running:
+        await event_sink.put(telegram_id, event_type, event_data)
+        return
+
+    # Очередь не запущена (скрипты, тесты) - пишем напрямую
     # Сначала находим пользователя по telegram_id, чтобы получить его id
-    stmt = select(User).where(User.telegram_id == telegram_id)
-    result = await db.execute(stmt)
-    user = result.scalar_one_or_none()
+    user = await resolve_user(db, telegram_id)
 
     if not user:
         print(f"⚠️ Пользователь {telegram_id} не найден, событие {event_type} не записано")
@@ -219,7 +348,10 @@ async def confirm_age_and_save_phone(db: AsyncSession, telegram_user_id: str, ph
         user.status = UserStatus.ACTIVE
         user.last_activity = datetime.utcnow()
 
+        # Статус сменился - сбрасываем кэш в остальных процессах
+        await notify_user_changed(db, telegram_id)
         await db.commit()
+        user_cache.set(CachedUser.from_model(user))
 
         # Логируем события
         await log_event(db, telegram_id, "age_confirmed")
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, JSON, String, column, insert, select, values
+
+from app.utils.database import Event, User, async_session
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class EventSink:
+    """
+    Фоновая запись событий пачками.
+
+    Хендлеры кладут события в ограниченную очередь, фоновая задача
+    сбрасывает их в barsuk_app_event одним INSERT ... SELECT по размеру
+    пачки или по таймеру. Пользователь ищется по telegram_id прямо в запросе,
+    события неизвестных пользователей отбрасываются.
+    """
+
+    def __init__(self, session_pool, max_queue_size: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 1.0, put_timeout: float = 0.5):
+        self.session_pool = session_pool
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+
+        self._queue = None
+        self._task = None
+        self._batch = []
+        self._flushing = None
+
+        # Счетчики
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flush_count = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        """Запуск фоновой задачи сброса"""
+        if self.is_running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run(), name="event-sink")
+
+    async def stop(self):
+        """Остановка с дозаписью всего, что осталось в очереди"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        # Пачка, которую прервали посреди записи, дописывается до конца
+        if self._flushing is not None and not self._flushing.done():
+            await self._flushing
+        self._flushing = None
+
+        batch, self._batch = self._batch, []
+        batch.extend(self._drain(self.batch_size - len(batch)))
+        while batch:
+            await self._flush(batch)
+            batch = self._drain(self.batch_size)
+
+    async def put(self, telegram_id: int, event_type: str, event_data: dict = None) -> bool:
+        """
+        Поставить событие в очередь.
+        При заполненной очереди ждет put_timeout секунд (backpressure),
+        после чего событие отбрасывается.
+        """
+        item = (int(telegram_id), event_type, event_data or {}, datetime.utcnow())
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(item), timeout=self.put_timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                logger.warning("Очередь событий переполнена, событие %s отброшено", event_type)
+                return False
+        self.enqueued += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "queue_size": self.max_queue_size,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flush_count": self.flush_count,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flush_count, 2) if self.flush_count else 0.0,
+        }
+
+    def _drain(self, limit: int) -> list:
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = self._batch
+        while True:
+            batch.append(await self._queue.get())
+            deadline = loop.time() + self.flush_interval
+
+            # Добираем пачку до batch_size или до истечения flush_interval
+            while len(batch) < self.batch_size:
+                batch.extend(self._drain(self.batch_size - len(batch)))
+                if len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self._batch = []
+            self._flushing = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._flushing)
+            batch = self._batch
+
+    async def _flush(self, batch: list):
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        rows = values(
+            column("telegram_id", BigInteger),
+            column("event_type", String),
+            column("event_data", JSON),
+            column("created_at", DateTime),
+            name="new_events",
+        ).data(batch)
+
+        stmt = insert(Event).from_select(
+            ["user_id", "event_type", "event_data", "created_at"],
+            select(User.id, rows.c.event_type, rows.c.event_data, rows.c.created_at)
+            .join_from(rows, User, User.telegram_id == rows.c.telegram_id)
+        )
+
+        try:
+            async with self.session_pool() as session:
+                await session.execute(stmt)
+                await session.commit()
+        except Exception:
+            self.failed += len(batch)
+            logger.exception("Не удалось записать пачку из %s событий", len(batch))
+            return
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.flush_count += 1
+            self.last_flush_ms = elapsed
+            self.total_flush_ms += elapsed
+            self.max_flush_ms = max(self.max_flush_ms, elapsed)
+
+        self.flushed += len(batch)
+
+
+event_sink = EventSink(
+    async_session,
+    max_queue_size=Config.EVENT_QUEUE_SIZE,
+    batch_size=Config.EVENT_BATCH_SIZE,
+    flush_interval=Config.EVENT_FLUSH_INTERVAL,
+)
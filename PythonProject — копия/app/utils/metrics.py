@@ -0,0 +1,364 @@
+"""
+Метрики бота в формате Prometheus: /metrics на METRICS_HOST:METRICS_PORT.
+
+Что считается:
+- апдейты по типам и время их обработки целиком (UpdateMetricsMiddleware);
+- время и ошибки каждого хендлера (HandlerMetricsMiddleware);
+- переходы состояний FSM и время операций хранилища (MetricsStorage);
+- время и ошибки вызовов Bot API по методам (BotAPIMetricsMiddleware);
+- пул соединений с БД и очереди фоновой записи - снимаются в момент запроса /metrics.
+
+Накладные расходы минимальные: бот работает в одном потоке event loop,
+поэтому счетчики - обычные числа без блокировок, а серии с метками
+создаются один раз и дальше берутся из словаря (без новых объектов на
+каждый апдейт).
+"""
+import bisect
+import contextvars
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.types import TelegramObject, Update
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм, секунд
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class HistogramChild:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Последняя корзина - значения больше всех границ (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Metric:
+    """Метрика с метками; серии (children) создаются при первом обращении и кэшируются"""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield self.name + "_total", _format_labels(self.labelnames, values), child.value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                total += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                yield self.name + "_bucket", _format_labels(self.labelnames, values, le), total
+            labels = _format_labels(self.labelnames, values)
+            yield self.name + "_sum", labels, child.sum
+            yield self.name + "_count", labels, total
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        # Снимаемые при запросе значения: имя -> функция, возвращающая
+        # [(метрика, тип, описание, {метки}, значение)]
+        self._collectors = {}
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def _add(self, metric: Metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, func: Callable[[], list]):
+        """Повторная регистрация под тем же именем заменяет прежнюю (create_dispatcher зовут и бенчмарки)"""
+        self._collectors[func.__name__] = func
+        return func
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            family = metric.name + "_total" if metric.type == "counter" else metric.name
+            lines.append(f"# HELP {family} {metric.documentation}")
+            lines.append(f"# TYPE {family} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+
+        for func in list(self._collectors.values()):
+            try:
+                collected = func()
+            except Exception:
+                logger.exception("Метрики %s не собраны", func.__name__)
+                continue
+            described = set()
+            for name, metric_type, documentation, labels, value in collected:
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {documentation}")
+                    lines.append(f"# TYPE {name} {metric_type}")
+                lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+UPDATES = registry.counter("barsuk_updates", "Апдейтов получено, по типу", ["type"])
+UPDATE_DURATION = registry.histogram(
+    "barsuk_update_duration_seconds", "Время обработки апдейта диспетчером", ["type"])
+UPDATE_ERRORS = registry.counter("barsuk_update_errors", "Апдейтов, обработка которых упала", ["type"])
+HANDLER_DURATION = registry.histogram(
+    "barsuk_handler_duration_seconds", "Время хендлера вместе с сессией БД", ["router", "handler"])
+HANDLER_ERRORS = registry.counter(
+    "barsuk_handler_errors", "Исключения в хендлерах", ["router", "handler", "error"])
+FSM_TRANSITIONS = registry.counter("barsuk_fsm_transitions", "Переходы состояний FSM", ["from_state", "to_state"])
+FSM_STORAGE_DURATION = registry.histogram(
+    "barsuk_fsm_storage_duration_seconds", "Время операций хранилища FSM", ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+BOT_API_DURATION = registry.histogram("barsuk_bot_api_duration_seconds", "Время вызова Bot API", ["method"])
+BOT_API_ERRORS = registry.counter("barsuk_bot_api_errors", "Ошибки вызовов Bot API", ["method", "error"])
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer-middleware на dp.update: число и время обработки апдейтов по типам"""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        update_type = event.event_type if isinstance(event, Update) else "unknown"
+        UPDATES.labels(update_type).inc()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            UPDATE_ERRORS.labels(update_type).inc()
+            raise
+        finally:
+            UPDATE_DURATION.labels(update_type).observe(time.perf_counter() - started)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Middleware сообщений и колбэков: время и исключения по хендлерам.
+    Метка router - модуль хендлера (у роутеров нет постоянных имен), handler - имя функции.
+    """
+
+    def __init__(self):
+        # Функция хендлера -> (серия гистограммы, router, handler)
+        self._series = {}
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        callback = data["handler"].callback
+        series = self._series.get(callback)
+        if series is None:
+            router = getattr(callback, "__module__", "unknown")
+            name = getattr(callback, "__name__", "unknown")
+            series = self._series[callback] = (HANDLER_DURATION.labels(router, name), router, name)
+
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.labels(series[1], series[2], type(e).__name__).inc()
+            raise
+        finally:
+            series[0].observe(time.perf_counter() - started)
+
+
+class BotAPIMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота (bot.session.middleware): время и ошибки вызовов Bot API"""
+
+    async def __call__(self, make_request, bot, method):
+        api_method = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            BOT_API_ERRORS.labels(api_method, type(e).__name__).inc()
+            raise
+        finally:
+            BOT_API_DURATION.labels(api_method).observe(time.perf_counter() - started)
+
+
+# Состояние FSM, прочитанное в текущем апдейте (каждый апдейт - своя задача asyncio)
+_current_state = contextvars.ContextVar("fsm_state", default=None)
+
+
+class MetricsStorage(BaseStorage):
+    """Обертка хранилища FSM: время операций и переходы между состояниями"""
+
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+        self._get_state = FSM_STORAGE_DURATION.labels("get_state")
+        self._set_state = FSM_STORAGE_DURATION.labels("set_state")
+        self._get_data = FSM_STORAGE_DURATION.labels("get_data")
+        self._set_data = FSM_STORAGE_DURATION.labels("set_data")
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        started = time.perf_counter()
+        state = await self.storage.get_state(key)
+        self._get_state.observe(time.perf_counter() - started)
+        _current_state.set(state)
+        return state
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        started = time.perf_counter()
+        await self.storage.set_state(key, state)
+        self._set_state.observe(time.perf_counter() - started)
+
+        new_state = getattr(state, "state", state)
+        FSM_TRANSITIONS.labels(_current_state.get() or "none", new_state or "none").inc()
+        _current_state.set(new_state)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        started = time.perf_counter()
+        data = await self.storage.get_data(key)
+        self._get_data.observe(time.perf_counter() - started)
+        return data
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        started = time.perf_counter()
+        await self.storage.set_data(key, data)
+        self._set_data.observe(time.perf_counter() - started)
+
+    async def close(self) -> None:
+        await self.storage.close()
+
+
+def stats_collector(prefix: str, documentation: str, stats: Callable[[], dict], counters=()):
+    """
+    Collector для объектов со stats(): числовые поля становятся метриками
+    prefix_<поле>, поля из counters - счетчиками (_total), остальные - gauge.
+    """
+    def collect():
+        rows = []
+        for field, value in stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if field in counters:
+                rows.append((f"{prefix}_{field}_total", "counter", f"{documentation}: {field}", {}, value))
+            else:
+                rows.append((f"{prefix}_{field}", "gauge", f"{documentation}: {field}", {}, value))
+        return rows
+
+    collect.__name__ = prefix
+    return collect
+
+
+class MetricsServer:
+    """Отдельный маленький HTTP-сервер с /metrics (слушает локальный адрес)"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9108):
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def start(self):
+        if self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info("Метрики: http://%s:%s/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,139 @@
+from typing import Dict, Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Router
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from app.utils.database import UserStatus, resolve_user
+
+
+class LazySession:
+    """
+    Обертка над AsyncSession, которая создает сессию только при первом
+    обращении. Хендлеры, не трогающие БД, не создают сессию вовсе.
+    """
+
+    def __init__(self, session_pool):
+        self._session_pool = session_pool
+        self._session = None
+
+    @property
+    def is_used(self) -> bool:
+        return self._session is not None
+
+    def __getattr__(self, name):
+        if self._session is None:
+            self._session = self._session_pool()
+        return getattr(self._session, name)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class DatabaseMiddleware(BaseMiddleware):
+    """
+    Передает в хендлер ленивую сессию БД (data["db"]) и закрывает ее,
+    как только хендлер отработал - соединение сразу возвращается в пул.
+
+    Регистрируется как inner-middleware, поэтому видит хендлер и роутер:
+    - skip_routers: имена роутеров с чистыми FSM-шагами, им сессия не нужна;
+    - flags={"db": False} у хендлера отключает сессию точечно.
+    """
+
+    def __init__(self, session_pool, skip_routers=()):
+        self.session_pool = session_pool
+        self.skip_routers = set(skip_routers)
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        router = data.get("event_router")
+        if (router is not None and router.name in self.skip_routers) or get_flag(data, "db") is False:
+            return await handler(event, data)
+
+        session = LazySession(self.session_pool)
+        data["db"] = session
+        try:
+            return await handler(event, data)
+        finally:
+            await session.close()
+
+
+class ActivityMiddleware(BaseMiddleware):
+    """
+    Отмечает активность пользователя в ActivityTracker на каждом апдейте.
+    Регистрируется как outer-middleware на dp.update, запись в БД - пачками.
+    """
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            self.tracker.touch(user.id)
+        return await handler(event, data)
+
+
+class AccessMiddleware(BaseMiddleware):
+    """
+    Проверка доступа для роутеров, которые открыты только активным пользователям.
+
+    Пользователь берется из кэша (app/utils/user_cache.py, сброс по NOTIFY
+    из админки), в БД - только при промахе. Найденный пользователь
+    передается в хендлер как data["user"]. Незарегистрированные и
+    заблокированные получают отказ, и хендлер не вызывается.
+    flags={"access": False} у хендлера отключает проверку.
+    """
+
+    denied_text = "❌ Доступ запрещен. Пройдите регистрацию через /start"
+
+    def __init__(self, session_pool):
+        self.session_pool = session_pool
+
+    def attach(self, *routers: Router):
+        """Подключить к сообщениям и колбэкам роутеров"""
+        for router in routers:
+            router.message.middleware(self)
+            router.callback_query.middleware(self)
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        if from_user is None or get_flag(data, "access") is False:
+            return await handler(event, data)
+
+        user = await self._resolve(from_user.id, data.get("db"))
+        if user is None or user.status != UserStatus.ACTIVE:
+            await self._deny(event)
+            return None
+
+        data["user"] = user
+        return await handler(event, data)
+
+    async def _resolve(self, telegram_id: int, db):
+        if db is not None:
+            return await resolve_user(db, telegram_id)
+        # Роутер без сессии (чистые FSM-шаги) - короткая сессия только на промах кэша
+        async with self.session_pool() as session:
+            return await resolve_user(session, telegram_id)
+
+    async def _deny(self, event: TelegramObject):
+        if isinstance(event, CallbackQuery):
+            await event.answer(self.denied_text, show_alert=True)
+        elif isinstance(event, Message):
+            await event.answer(self.denied_text)
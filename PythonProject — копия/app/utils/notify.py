@@ -0,0 +1,77 @@
+import asyncio
+import logging
+
+import asyncpg
+
+from app.utils.database import engine
+
+logger = logging.getLogger(__name__)
+
+
+class NotifyListener:
+    """
+    Подписка на Postgres LISTEN/NOTIFY.
+
+    Держит отдельное соединение asyncpg вне пула SQLAlchemy и переподключается
+    при обрыве. После каждого (пере)подключения подписчики вызываются
+    с payload=None: уведомления за время обрыва могли потеряться.
+    """
+
+    def __init__(self, reconnect_delay: float = 5.0):
+        self.reconnect_delay = reconnect_delay
+        self._callbacks = {}
+        self._task = None
+
+    def subscribe(self, channel: str, callback):
+        self._callbacks.setdefault(channel, []).append(callback)
+
+    async def start(self):
+        if self._task is None and self._callbacks:
+            self._task = asyncio.create_task(self._run(), name="pg-notify-listener")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _dispatch(self, channel: str, payload):
+        for callback in self._callbacks.get(channel, []):
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception("Ошибка в обработчике NOTIFY %s", channel)
+
+    async def _run(self):
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda conn: closed.set())
+
+                for channel in self._callbacks:
+                    await connection.add_listener(
+                        channel, lambda conn, pid, ch, payload: self._dispatch(ch, payload)
+                    )
+                    self._dispatch(channel, None)
+
+                await closed.wait()
+                logger.warning("Соединение LISTEN потеряно, переподключаемся")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка соединения LISTEN")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+            await asyncio.sleep(self.reconnect_delay)
+
+
+notify_listener = NotifyListener()
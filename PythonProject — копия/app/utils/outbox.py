@@ -0,0 +1,260 @@
+import asyncio
+import html
+import logging
+from datetime import timedelta
+
+import aiohttp
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.utils.database import Outbox, async_session
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+MANAGER_REQUEST = "manager_request"
+
+REQUEST_TYPE_NAMES = {
+    "transfer": "Трансфер",
+    "manager": "Связь с менеджером",
+}
+
+
+class PermanentError(Exception):
+    """Ошибка, которую бесполезно повторять (чат удален, бот заблокирован и т.п.)"""
+
+
+class RetryLater(Exception):
+    """Получатель попросил подождать (429)"""
+
+    def __init__(self, message: str, delay: float):
+        super().__init__(message)
+        self.delay = delay
+
+
+def manager_targets() -> list:
+    """Куда доставлять уведомления о заявках"""
+    targets = [f"telegram:{chat_id}" for chat_id in Config.MANAGER_CHAT_IDS]
+    if Config.MANAGER_WEBHOOK_URL:
+        targets.append("webhook")
+    # Ничего не настроено - просто пишем в лог, как раньше
+    return targets or ["log"]
+
+
+def enqueue(db: AsyncSession, kind: str, payload: dict, targets: list):
+    """
+    Добавить уведомления в текущую транзакцию.
+    Commit делает вызывающий код - вместе с основной записью.
+    """
+    for target in targets:
+        db.add(Outbox(kind=kind, target=target, payload=payload))
+
+
+def format_manager_message(payload: dict) -> str:
+    """Текст уведомления менеджеру о новой заявке"""
+    user_info = payload.get("user_info") or {}
+    request_type = payload.get("request_type")
+    lines = [
+        f"🔔 <b>Новая заявка #{payload.get('request_id')}</b>",
+        f"Тип: {REQUEST_TYPE_NAMES.get(request_type, request_type)}",
+        f"Пользователь: {html.escape(str(user_info.get('name', '')))}",
+        f"Телефон: {html.escape(str(user_info.get('phone', '')))}",
+        f"Username: {html.escape(str(user_info.get('username', '')))}",
+    ]
+
+    data = payload.get("data") or {}
+    details = [
+        f"{key}: {html.escape(str(value))}"
+        for key, value in data.items()
+        if key != "user_info" and value not in (None, "")
+    ]
+    if details:
+        lines.append("")
+        lines.extend(details)
+    return "\n".join(lines)
+
+
+class OutboxDispatcher:
+    """
+    Доставка уведомлений из barsuk_app_outbox.
+
+    Строки забираются пачкой одним UPDATE ... WHERE id IN (SELECT ... FOR UPDATE
+    SKIP LOCKED), поэтому несколько процессов бота не доставят одно уведомление
+    дважды. Взятая строка "арендуется" на lease_seconds: если процесс упадет
+    посреди доставки, она снова станет доступна. Неудачные попытки
+    повторяются с растущей паузой, после max_attempts строка помечается dead.
+    """
+
+    def __init__(self, session_pool, batch_size: int = 50, poll_interval: float = 5.0,
+                 max_attempts: int = 8, lease_seconds: int = 60, webhook_url: str = ""):
+        self.session_pool = session_pool
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.webhook_url = webhook_url
+
+        self._bot = None
+        self._http = None
+        self._task = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+        # Счетчики
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, bot: Bot):
+        if self.is_running:
+            return
+        self._bot = bot
+        self._stopping = False
+        if self.webhook_url:
+            self._http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        self._task = asyncio.create_task(self._run(), name="outbox-dispatcher")
+
+    async def stop(self, timeout: float = 10.0):
+        """Остановка после текущей пачки (недоставленное останется в таблице)"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            # Аренда истечет, и строки доставит следующий запуск
+            logger.warning("Outbox: пачка не доставлена за %s сек, прерываем", timeout)
+        self._task = None
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    def wake(self):
+        """Разбудить диспетчер после commit новой заявки"""
+        self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "retried": self.retried, "dead": self.dead}
+
+    async def _run(self):
+        while not self._stopping:
+            # Сбрасываем до выборки, чтобы wake() во время доставки не потерялся
+            self._wakeup.clear()
+            try:
+                delivered = await self.process_batch()
+            except Exception:
+                logger.exception("Outbox: ошибка обработки пачки")
+                delivered = 0
+
+            if delivered < self.batch_size and not self._stopping:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def process_batch(self) -> int:
+        """Забрать и доставить одну пачку; возвращает число взятых строк"""
+        rows = await self._claim()
+        if not rows:
+            return 0
+
+        results = await asyncio.gather(*(self._deliver(row) for row in rows), return_exceptions=True)
+        await self._save_results(rows, results)
+        return len(rows)
+
+    async def _claim(self):
+        claimable = (
+            select(Outbox.id)
+            .where(Outbox.status == "pending", Outbox.next_attempt_at <= func.now())
+            .order_by(Outbox.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        stmt = (
+            update(Outbox)
+            .where(Outbox.id.in_(claimable.scalar_subquery()))
+            .values(
+                attempts=Outbox.attempts + 1,
+                next_attempt_at=func.now() + timedelta(seconds=self.lease_seconds),
+            )
+            .returning(Outbox.id, Outbox.kind, Outbox.target, Outbox.payload, Outbox.attempts)
+        )
+        async with self.session_pool() as db:
+            rows = (await db.execute(stmt)).all()
+            await db.commit()
+        return rows
+
+    async def _deliver(self, row):
+        if row.kind == MANAGER_REQUEST:
+            text = format_manager_message(row.payload)
+        else:
+            raise PermanentError(f"Неизвестный тип уведомления: {row.kind}")
+
+        if row.target.startswith("telegram:"):
+            chat_id = int(row.target.split(":", 1)[1])
+            try:
+                await self._bot.send_message(chat_id, text, parse_mode="HTML")
+            except TelegramRetryAfter as e:
+                raise RetryLater(str(e), e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                raise PermanentError(str(e))
+
+        elif row.target == "webhook":
+            if self._http is None:
+                raise PermanentError("MANAGER_WEBHOOK_URL не задан")
+            body = {"kind": row.kind, "id": row.id, "text": text, "payload": row.payload}
+            async with self._http.post(self.webhook_url, json=body) as response:
+                if response.status == 429:
+                    raise RetryLater("HTTP 429", float(response.headers.get("Retry-After", 30)))
+                if 400 <= response.status < 500:
+                    raise PermanentError(f"HTTP {response.status}")
+                response.raise_for_status()
+
+        elif row.target == "log":
+            print(f"\n{text}\n" + "-" * 40)
+
+        else:
+            raise PermanentError(f"Неизвестный получатель: {row.target}")
+
+    def _retry_delay(self, attempts: int) -> float:
+        return min(5 * 2 ** (attempts - 1), 3600)
+
+    async def _save_results(self, rows, results):
+        async with self.session_pool() as db:
+            for row, error in zip(rows, results):
+                if error is None:
+                    values = {"status": "sent", "sent_at": func.now(), "last_error": ""}
+                    self.sent += 1
+                elif isinstance(error, PermanentError) or row.attempts >= self.max_attempts:
+                    values = {"status": "dead", "last_error": f"{type(error).__name__}: {error}"}
+                    self.dead += 1
+                    logger.error("Outbox #%s -> %s: не доставлено (%s)", row.id, row.target, error)
+                else:
+                    delay = error.delay if isinstance(error, RetryLater) else self._retry_delay(row.attempts)
+                    values = {
+                        "next_attempt_at": func.now() + timedelta(seconds=delay),
+                        "last_error": f"{type(error).__name__}: {error}",
+                    }
+                    self.retried += 1
+                    logger.warning("Outbox #%s -> %s: попытка %s не удалась (%s), повтор через %s сек",
+                                   row.id, row.target, row.attempts, error, delay)
+
+                await db.execute(update(Outbox).where(Outbox.id == row.id).values(**values))
+            await db.commit()
+
+
+outbox_dispatcher = OutboxDispatcher(
+    async_session,
+    batch_size=Config.OUTBOX_BATCH_SIZE,
+    poll_interval=Config.OUTBOX_POLL_INTERVAL,
+    max_attempts=Config.OUTBOX_MAX_ATTEMPTS,
+    lease_seconds=Config.OUTBOX_LEASE_SECONDS,
+    webhook_url=Config.MANAGER_WEBHOOK_URL,
+)
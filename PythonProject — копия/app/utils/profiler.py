@@ -0,0 +1,175 @@
+"""
+Сэмплирующий профилировщик для работающего бота - без перезапуска.
+
+Включается на PROFILE_SECONDS сигналом SIGUSR1 (kill -USR1 <pid>, повторный
+сигнал - досрочная остановка) или командой администратора /profile. Пока
+он включен, отдельный поток каждые PROFILE_INTERVAL секунд снимает стек
+потока event loop (sys._current_frames). Сам бот не инструментируется, и
+вне окна профилирования накладных расходов нет.
+
+По окончании в PROFILE_DIR пишутся:
+- bot-<время>.collapsed - свернутые стеки (flamegraph.pl, speedscope);
+- bot-<время>-handlers.txt - время по хендлерам и функции, в которых оно
+  проведено (self-time), по числу сэмплов.
+
+В стеке видно только время, когда event loop выполняет Python-код:
+ожидание БД и Bot API сюда не попадает (его показывают /metrics и /queries).
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Листья стека, означающие простой event loop
+IDLE_FUNCTIONS = {"select", "poll", "epoll", "kqueue", "control", "_run_once"}
+OUTSIDE_HANDLERS = "(вне хендлеров)"
+IDLE = "(простой event loop)"
+
+
+def frame_name(code) -> str:
+    filename = code.co_filename
+    # Путь внутри проекта или библиотеки - без начала до site-packages/корня проекта
+    for marker in ("site-packages" + os.sep, os.getcwd() + os.sep):
+        index = filename.find(marker)
+        if index != -1:
+            filename = filename[index + len(marker):]
+            break
+    return f"{filename}:{code.co_name}"
+
+
+def handler_codes(dispatcher) -> dict:
+    """Код-объекты всех хендлеров диспетчера -> "модуль.функция" """
+    codes = {}
+    routers = [dispatcher]
+    while routers:
+        router = routers.pop()
+        routers.extend(router.sub_routers)
+        for observer in router.observers.values():
+            for handler in observer.handlers:
+                code = getattr(handler.callback, "__code__", None)
+                if code is not None:
+                    codes[code] = f"{handler.callback.__module__}.{handler.callback.__name__}"
+    return codes
+
+
+class SamplingProfiler:
+    """Поток-сэмплер стека одного потока (потока event loop)"""
+
+    def __init__(self, directory: str, interval: float = 0.01, default_seconds: float = 30.0,
+                 max_seconds: float = 300.0):
+        self.directory = directory
+        self.interval = interval
+        self.default_seconds = default_seconds
+        self.max_seconds = max_seconds
+        self.dispatcher = None
+        self.last_files = []
+
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def attach(self, dispatcher):
+        """Диспетчер, по хендлерам которого группируется время"""
+        self.dispatcher = dispatcher
+
+    def start(self, seconds: float = None):
+        """Запуск из потока event loop; возвращает длительность окна или None, если уже идет"""
+        if self.is_running:
+            return None
+        seconds = min(seconds or self.default_seconds, self.max_seconds)
+        codes = handler_codes(self.dispatcher) if self.dispatcher is not None else {}
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(threading.get_ident(), seconds, codes),
+            name="sampling-profiler", daemon=True,
+        )
+        self._thread.start()
+        logger.warning("Профилирование включено на %.0f с, интервал %.0f мс", seconds, self.interval * 1000)
+        return seconds
+
+    def stop(self):
+        """Досрочная остановка; файлы пишет поток сэмплера"""
+        self._stop.set()
+
+    def toggle(self):
+        """Обработчик SIGUSR1"""
+        if self.is_running:
+            self.stop()
+        else:
+            self.start()
+
+    def _run(self, thread_id: int, seconds: float, codes: dict):
+        # Стек - кортеж код-объектов от корня к листу; имена строятся только при записи
+        stacks = Counter()
+        current_frames = sys._current_frames
+        deadline = time.monotonic() + seconds
+        started = time.monotonic()
+
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            stack.reverse()
+            stacks[tuple(stack)] += 1
+
+        elapsed = time.monotonic() - started
+        try:
+            self.last_files = self._write(stacks, codes, elapsed)
+            logger.warning("Профилирование завершено: %s", ", ".join(self.last_files))
+        except Exception:
+            logger.exception("Не удалось записать результаты профилирования")
+
+    def _write(self, stacks: Counter, codes: dict, elapsed: float) -> list:
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = os.path.join(self.directory, f"bot-{datetime.now():%Y%m%d-%H%M%S}")
+        names = {}
+
+        def name(code):
+            if code not in names:
+                names[code] = frame_name(code)
+            return names[code]
+
+        # Хендлер -> сэмплов всего и по функциям-листьям
+        handler_total = Counter()
+        handler_self = defaultdict(Counter)
+        with open(prefix + ".collapsed", "w", encoding="utf-8") as f:
+            for stack, count in stacks.items():
+                if not stack:
+                    continue
+                f.write(";".join(name(code) for code in stack) + f" {count}\n")
+
+                handler = next((codes[code] for code in reversed(stack) if code in codes), None)
+                if handler is None:
+                    handler = IDLE if stack[-1].co_name in IDLE_FUNCTIONS else OUTSIDE_HANDLERS
+                handler_total[handler] += count
+                handler_self[handler][name(stack[-1])] += count
+
+        samples = sum(handler_total.values())
+        with open(prefix + "-handlers.txt", "w", encoding="utf-8") as f:
+            f.write(f"Окно {elapsed:.1f} с, сэмплов {samples}, интервал {self.interval * 1000:.0f} мс\n")
+            for handler, total in handler_total.most_common():
+                share = total * 100 / samples if samples else 0.0
+                f.write(f"\n{handler}: {total} сэмплов (~{total * self.interval * 1000:.0f} мс, {share:.1f}%)\n")
+                for function, count in handler_self[handler].most_common(15):
+                    f.write(f"    {count:>6}  {function}\n")
+        return [prefix + ".collapsed", prefix + "-handlers.txt"]
+
+
+profiler = SamplingProfiler(
+    Config.PROFILE_DIR,
+    interval=Config.PROFILE_INTERVAL,
+    default_seconds=Config.PROFILE_SECONDS,
+    max_seconds=Config.PROFILE_MAX_SECONDS,
+)
@@ -0,0 +1,220 @@
+"""
+Бюджет запросов к БД на апдейт и статистика медленных запросов.
+
+Хуки SQLAlchemy на engine (install) считают запросы и время в БД текущего
+апдейта: QueryBudgetMiddleware кладет счетчик в contextvar, а SQLAlchemy
+передает контекст в свои greenlet, поэтому запросы из хендлера и из
+middleware доступа попадают в счетчик своего апдейта. Запросы фоновых задач
+(очередь событий, outbox) не попадают ни в один апдейт.
+
+Апдейт дороже QUERY_BUDGET_COUNT запросов или QUERY_BUDGET_MS мс в БД
+пишется в лог с хендлером и отпечатками запросов - повтор одного отпечатка
+N раз и есть N+1. Отдельный запрос дольше QUERY_SLOW_MS пишется сразу.
+
+Все запросы копятся в скользящей статистике по отпечаткам (окно
+QUERY_STATS_WINDOW сек.), топ смотрит администратор командой /queries.
+"""
+import contextvars
+import logging
+import re
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import event
+
+from app.utils.metrics import registry
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+HANDLER_STATEMENTS = registry.histogram(
+    "barsuk_handler_db_statements", "Запросов к БД на апдейт", ["handler"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 20, 50))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# Списки параметров asyncpg ($1, $2, ...) - IN (...) разной длины дают один отпечаток
+_PARAMS_RE = re.compile(r"\$\d+(?:\s*,\s*\$\d+)*")
+_NUMBER_RE = re.compile(r"\b\d+\b")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+
+MAX_FINGERPRINT_CACHE = 5000
+
+
+class UpdateQueries:
+    """Запросы одного апдейта"""
+
+    __slots__ = ("handler", "statements", "db_time", "fingerprints")
+
+    def __init__(self, handler: str):
+        self.handler = handler
+        self.statements = 0
+        self.db_time = 0.0
+        self.fingerprints = []
+
+
+_current = contextvars.ContextVar("update_queries", default=None)
+_fingerprints = {}
+
+
+def fingerprint(statement: str) -> str:
+    """Текст запроса без параметров и литералов; результат кэшируется по тексту"""
+    result = _fingerprints.get(statement)
+    if result is None:
+        result = _WHITESPACE_RE.sub(" ", statement).strip()
+        result = _STRING_RE.sub("?", result)
+        result = _PARAMS_RE.sub("?", result)
+        result = _NUMBER_RE.sub("?", result)
+        if len(_fingerprints) >= MAX_FINGERPRINT_CACHE:
+            _fingerprints.clear()
+        _fingerprints[statement] = result
+    return result
+
+
+class QueryStats:
+    """
+    Скользящая статистика по отпечаткам: два окна по window секунд
+    (текущее и предыдущее), топ считается по обоим.
+    """
+
+    def __init__(self, window: float = 3600.0, max_fingerprints: int = 1000):
+        self.window = window
+        self.max_fingerprints = max_fingerprints
+        self._current = {}
+        self._previous = {}
+        self._started = time.monotonic()
+
+    def record(self, fingerprint_text: str, duration: float, slow: bool):
+        now = time.monotonic()
+        if now - self._started >= self.window:
+            self._previous = self._current
+            self._current = {}
+            self._started = now
+
+        row = self._current.get(fingerprint_text)
+        if row is None:
+            if len(self._current) >= self.max_fingerprints:
+                return
+            # [выполнений, суммарное время, максимум, медленных]
+            row = self._current[fingerprint_text] = [0, 0.0, 0.0, 0]
+        row[0] += 1
+        row[1] += duration
+        if duration > row[2]:
+            row[2] = duration
+        if slow:
+            row[3] += 1
+
+    def top(self, n: int = 10, by: str = "total") -> list:
+        merged = {}
+        for rows in (self._previous, self._current):
+            for text, (count, total, maximum, slow) in rows.items():
+                item = merged.setdefault(text, {"fingerprint": text, "count": 0, "total": 0.0,
+                                                "max": 0.0, "slow": 0})
+                item["count"] += count
+                item["total"] += total
+                item["max"] = max(item["max"], maximum)
+                item["slow"] += slow
+        return sorted(merged.values(), key=lambda item: item[by], reverse=True)[:n]
+
+    def reset(self):
+        self._current = {}
+        self._previous = {}
+        self._started = time.monotonic()
+
+
+query_stats = QueryStats(window=Config.QUERY_STATS_WINDOW)
+
+
+def install(sync_engine, slow_ms: float = None):
+    """Хуки на engine: время каждого запроса, счетчик апдейта, статистика"""
+    slow = (Config.QUERY_SLOW_MS if slow_ms is None else slow_ms) / 1000
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        duration = time.perf_counter() - started
+        text = fingerprint(statement)
+        is_slow = duration >= slow
+        query_stats.record(text, duration, is_slow)
+
+        current = _current.get()
+        if current is not None:
+            current.statements += 1
+            current.db_time += duration
+            current.fingerprints.append(text)
+        if is_slow:
+            logger.warning("Медленный запрос %.0f мс (%s): %s", duration * 1000,
+                           current.handler if current is not None else "фон", text[:500])
+
+    @event.listens_for(sync_engine, "handle_error")
+    def on_error(exception_context):
+        # Упавший запрос не доходит до after_cursor_execute
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+
+class QueryBudgetMiddleware(BaseMiddleware):
+    """
+    Middleware сообщений и колбэков: запросы и время в БД каждого апдейта,
+    предупреждение в лог при превышении бюджета.
+    Регистрируется раньше DatabaseMiddleware - коммит и закрытие сессии тоже считаются.
+    """
+
+    def __init__(self, max_statements: int = 10, max_db_ms: float = 200.0):
+        self.max_statements = max_statements
+        self.max_db_time = max_db_ms / 1000
+        # Функция хендлера -> (имя для лога, серия гистограммы)
+        self._names = {}
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        callback = data["handler"].callback
+        names = self._names.get(callback)
+        if names is None:
+            name = f"{getattr(callback, '__module__', '?')}.{getattr(callback, '__name__', '?')}"
+            names = self._names[callback] = (name, HANDLER_STATEMENTS.labels(name))
+
+        queries = UpdateQueries(names[0])
+        token = _current.set(queries)
+        try:
+            return await handler(event, data)
+        finally:
+            _current.reset(token)
+            names[1].observe(queries.statements)
+            if queries.statements > self.max_statements or queries.db_time > self.max_db_time:
+                self.report(queries)
+
+    def report(self, queries: UpdateQueries):
+        repeated = Counter(queries.fingerprints).most_common()
+        lines = "\n".join(f"  x{count} {text[:300]}" for text, count in repeated)
+        logger.warning(
+            "Бюджет запросов превышен: %s - %s запросов, %.0f мс в БД (бюджет %s запросов, %.0f мс)\n%s",
+            queries.handler, queries.statements, queries.db_time * 1000,
+            self.max_statements, self.max_db_time * 1000, lines,
+        )
+
+
+def format_top(rows: list) -> str:
+    """Топ отпечатков для команды /queries"""
+    if not rows:
+        return "Запросов пока не было"
+    lines = []
+    for index, row in enumerate(rows, 1):
+        avg = row["total"] / row["count"] * 1000 if row["count"] else 0.0
+        lines.append(
+            f"{index}. всего {row['total'] * 1000:.0f} мс, x{row['count']}, "
+            f"сред. {avg:.1f} мс, макс. {row['max'] * 1000:.0f} мс, медленных {row['slow']}\n"
+            f"{row['fingerprint'][:300]}"
+        )
+    return "\n\n".join(lines)
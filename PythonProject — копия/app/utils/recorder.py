@@ -0,0 +1,257 @@
+"""
+Запись входящих апдейтов для офлайн-воспроизведения (benchmarks/replay.py).
+
+Апдейты пишутся в gzip JSONL ({"ts": время получения, "update": {...}}) в
+RECORD_DIR, новый файл - каждые RECORD_MAX_UPDATES строк. Запись идет из
+памяти пачками раз в RECORD_FLUSH_INTERVAL секунд в отдельном потоке и не
+задерживает обработку апдейта.
+
+Персональные данные не пишутся:
+- id пользователей и чатов заменяются на HMAC(RECORD_SALT, id), приведенный
+  к диапазону ANON_ID_BASE..ANON_ID_BASE + ANON_ID_RANGE - один и тот же
+  пользователь в записи всегда под одним id. Диапазон лежит выше 2**52:
+  по документации Bot API id пользователей и чатов занимают до 52 бит;
+- телефоны заменяются на фиктивные, имена, username и геопозиция удаляются;
+- текст сохраняется, только если это команда, надпись кнопки клавиатуры
+  или значение поля формы: время ЧЧ:ММ, дата ДД.ММ, число гостей 1-10,
+  "сегодня" / "завтра"; остальное (в том числе любые другие цифры -
+  телефоны, номера карт) заменяется на "x" той же длины (проверки длины
+  в хендлерах ведут себя так же).
+
+Выборка - по пользователям (RECORD_SAMPLE): у попавшего в выборку
+пользователя пишутся все апдейты, иначе сценарии рвались бы посередине.
+"""
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import secrets
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import ReplyKeyboardMarkup, TelegramObject, Update
+
+from app.utils import keyboards
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Выше 52-битных id Telegram и ниже 2**53 (id остаются точными и в JSON/JavaScript)
+ANON_ID_BASE = 2 ** 52
+ANON_ID_RANGE = 2 ** 40
+
+# Объекты, в которых "id" - это пользователь или чат
+PERSON_KEYS = {"from", "chat", "user", "sender_chat", "forward_from", "forward_from_chat",
+               "sender_user", "actor_chat"}
+ID_KEYS = {"user_id", "chat_id"}
+DROP_KEYS = {"last_name", "username", "title", "bio", "vcard", "location", "venue",
+             "invite_link", "active_usernames"}
+TEXT_KEYS = {"text", "caption"}
+# Значения, которые вводят в формах: время ЧЧ:ММ, дата ДД.ММ, число гостей 1-10
+SAFE_TEXT_RE = re.compile(
+    r"([01]?\d|2[0-3]):[0-5]\d"
+    r"|(0?[1-9]|[12]\d|3[01])\.(0?[1-9]|1[0-2])"
+    r"|[1-9]|10"
+    r"|сегодня|завтра|послезавтра",
+    re.IGNORECASE,
+)
+
+
+def keyboard_labels() -> set:
+    """Надписи кнопок всех reply-клавиатур из app/utils/keyboards.py"""
+    labels = set()
+    for name in dir(keyboards):
+        factory = getattr(keyboards, name)
+        if not name.startswith("get_") or not callable(factory):
+            continue
+        try:
+            markup = factory()
+        except TypeError:
+            continue
+        if isinstance(markup, ReplyKeyboardMarkup):
+            labels.update(button.text for row in markup.keyboard for button in row)
+    return labels
+
+
+class UpdateRecorder(BaseMiddleware):
+    """Outer-middleware на dp.update: копия апдейта в запись, затем обработка как обычно"""
+
+    def __init__(self, directory: str, salt: str = "", sample: float = 1.0, max_updates: int = 100_000,
+                 flush_interval: float = 5.0, max_buffer: int = 50_000):
+        self.directory = directory
+        # Без соли id нельзя связать между перезапусками - это безопаснее, но записи несопоставимы
+        self.salt = (salt or secrets.token_hex(16)).encode()
+        self.sample = sample
+        self.max_updates = max_updates
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.safe_texts = keyboard_labels()
+
+        self._buffer = []
+        self._path = None
+        self._lines_in_file = 0
+        self._files = 0
+        self._task = None
+
+        # Счетчики
+        self.recorded = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        if isinstance(event, Update) and self.is_running:
+            try:
+                self.record(event, data.get("event_from_user"))
+            except Exception:
+                # Запись не должна ломать обработку
+                logger.exception("Не удалось записать апдейт %s", event.update_id)
+        return await handler(event, data)
+
+    def _digest(self, value) -> bytes:
+        return hmac.new(self.salt, str(value).encode(), hashlib.sha256).digest()
+
+    def anon_id(self, value):
+        if not isinstance(value, int) or isinstance(value, bool):
+            return value
+        anon = ANON_ID_BASE + int.from_bytes(self._digest(abs(value))[:8], "big") % ANON_ID_RANGE
+        # Знак сохраняется: отрицательные id - группы и каналы
+        return -anon if value < 0 else anon
+
+    def anon_phone(self, value: str) -> str:
+        return "+7" + f"{int.from_bytes(self._digest(value)[8:16], 'big') % 10 ** 10:010d}"
+
+    def anon_text(self, value: str) -> str:
+        if value.startswith("/"):
+            # Команда сохраняется, аргументы (deep link и т.п.) - нет
+            command, space, args = value.partition(" ")
+            return command + space + "x" * len(args)
+        if value in self.safe_texts or SAFE_TEXT_RE.fullmatch(value.strip()):
+            return value
+        return "x" * len(value)
+
+    def anonymize(self, value, key: str = None):
+        if isinstance(value, list):
+            return [self.anonymize(item, key) for item in value]
+        if not isinstance(value, dict):
+            return value
+
+        result = {}
+        for name, item in value.items():
+            if name in DROP_KEYS:
+                continue
+            if name in ID_KEYS or (name == "id" and key in PERSON_KEYS):
+                item = self.anon_id(item)
+            elif name == "first_name":
+                item = "User"
+            elif name == "phone_number":
+                item = self.anon_phone(item)
+            elif name in TEXT_KEYS and isinstance(item, str):
+                item = self.anon_text(item)
+            else:
+                item = self.anonymize(item, name)
+            result[name] = item
+        return result
+
+    def sampled(self, user) -> bool:
+        if self.sample >= 1:
+            return True
+        if user is None:
+            return False
+        return int.from_bytes(self._digest(user.id)[:4], "big") / 2 ** 32 < self.sample
+
+    def record(self, update: Update, user=None):
+        if not self.sampled(user):
+            self.skipped += 1
+            return
+        if len(self._buffer) >= self.max_buffer:
+            # Диск не успевает - лучше потерять запись, чем память
+            self.dropped += 1
+            return
+        payload = update.model_dump(mode="json", exclude_none=True, by_alias=True)
+        line = json.dumps({"ts": time.time(), "update": self.anonymize(payload)}, ensure_ascii=False)
+        self._buffer.append(line)
+        self.recorded += 1
+
+    async def start(self):
+        if self.is_running:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._task = asyncio.create_task(self._run(), name="update-recorder")
+        logger.info("Запись апдейтов в %s (выборка %.0f%%)", self.directory, self.sample * 100)
+
+    async def stop(self):
+        """Остановка с записью всего накопленного"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "file": self._path,
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        try:
+            await asyncio.to_thread(self._write, lines)
+            self.written += len(lines)
+        except Exception:
+            self.failed += len(lines)
+            logger.exception("Не удалось записать %s апдейтов", len(lines))
+
+    def _write(self, lines: list):
+        while lines:
+            if self._path is None or self._lines_in_file >= self.max_updates:
+                self._files += 1
+                name = f"updates-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}-{self._files}.jsonl.gz"
+                self._path = os.path.join(self.directory, name)
+                self._lines_in_file = 0
+            chunk = lines[:self.max_updates - self._lines_in_file]
+            lines = lines[len(chunk):]
+            # Каждая пачка - отдельный gzip-член: файл читается целиком, даже если процесс упал
+            with gzip.open(self._path, "at", encoding="utf-8") as f:
+                f.write("\n".join(chunk) + "\n")
+            self._lines_in_file += len(chunk)
+
+
+update_recorder = UpdateRecorder(
+    Config.RECORD_DIR,
+    salt=Config.RECORD_SALT,
+    sample=Config.RECORD_SAMPLE,
+    max_updates=Config.RECORD_MAX_UPDATES,
+    flush_interval=Config.RECORD_FLUSH_INTERVAL,
+)
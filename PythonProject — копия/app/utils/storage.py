@@ -0,0 +1,105 @@
+import time
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisStorage
+
+from app.utils.metrics import MetricsStorage
+from config import Config
+
+
+class PipelinedRedisStorage(RedisStorage):
+    """
+    RedisStorage, который читает состояние и данные формы одним запросом.
+
+    FSM-middleware aiogram запрашивает состояние на каждый апдейт, а хендлер
+    формы следом читает данные. Здесь оба ключа читаются одним pipeline,
+    а данные отдаются хендлеру без второго похода в Redis.
+    TTL состояния и данных продлевается вместе, поэтому брошенная форма
+    исчезает целиком.
+    """
+
+    # Сколько секунд предзагруженные данные считаются свежими
+    prefetch_ttl = 1.0
+    max_prefetched = 10000
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._prefetched = {}
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state_key = self.key_builder.build(key, "state")
+        data_key = self.key_builder.build(key, "data")
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.get(state_key)
+            pipe.get(data_key)
+            state, data = await pipe.execute()
+
+        if len(self._prefetched) >= self.max_prefetched:
+            self._prefetched.clear()
+        self._prefetched[data_key] = (data, time.monotonic())
+
+        if isinstance(state, bytes):
+            return state.decode("utf-8")
+        return state
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        data_key = self.key_builder.build(key, "data")
+        prefetched = self._prefetched.pop(data_key, None)
+        if prefetched is not None and time.monotonic() - prefetched[1] <= self.prefetch_ttl:
+            value = prefetched[0]
+        else:
+            value = await self.redis.get(data_key)
+
+        if value is None:
+            return {}
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        return self.json_loads(value)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state_key = self.key_builder.build(key, "state")
+        data_key = self.key_builder.build(key, "data")
+        self._prefetched.pop(data_key, None)
+
+        if state is None:
+            await self.redis.delete(state_key)
+            return
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(state_key, getattr(state, "state", state), ex=self.state_ttl)
+            if self.data_ttl:
+                pipe.expire(data_key, self.data_ttl)
+            await pipe.execute()
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        self._prefetched.pop(self.key_builder.build(key, "data"), None)
+        await super().set_data(key, data)
+
+
+def create_fsm_storage():
+    """
+    Хранилище FSM по настройкам:
+    - memory: состояние в памяти процесса (теряется при перезапуске);
+    - redis: общее хранилище для нескольких воркеров с TTL брошенных форм.
+
+    Возвращает (storage, events_isolation).
+    """
+    if Config.FSM_STORAGE == "redis":
+        ttl = Config.FSM_STATE_TTL or None
+        storage: BaseStorage = PipelinedRedisStorage.from_url(
+            Config.REDIS_URL,
+            state_ttl=ttl,
+            data_ttl=ttl,
+        )
+        # Апдейты одного пользователя не обрабатываются параллельно в разных воркерах
+        events_isolation: Optional[BaseEventIsolation] = storage.create_isolation()
+    else:
+        storage, events_isolation = MemoryStorage(), None
+
+    if Config.METRICS_ENABLED:
+        # Время операций и переходы состояний для /metrics
+        storage = MetricsStorage(storage)
+    return storage, events_isolation
@@ -0,0 +1,98 @@
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import DateTime, String, bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.utils.outbox import MANAGER_REQUEST, manager_targets
+
+
+# Один запрос: пользователь по telegram_id -> заявка -> событие -> уведомления в outbox.
+# Если пользователя нет, CTE u пустая и ничего не вставляется.
+# Время заявки и события - параметр :now с datetime.utcnow() и типом DateTime, так же
+# пишут остальные записи бота (ORM-умолчания, EventSink, ActivityTracker). now() сессии
+# с TimeZone не UTC сдвигал бы заявки относительно других событий. Outbox живет по
+# now() БД - с ним же сравнивается next_attempt_at.
+SUBMIT_REQUEST_SQL = text("""
+WITH u AS (
+    SELECT id,
+           jsonb_build_object(
+               'name', btrim(coalesce(first_name, '') || ' ' || coalesce(last_name, '')),
+               'phone', coalesce(phone, 'Не указан'),
+               'username', CASE WHEN coalesce(username, '') <> ''
+                                THEN '@' || username ELSE 'Нет username' END
+           ) AS user_info
+    FROM barsuk_app_telegramuser
+    WHERE telegram_id = :telegram_id
+),
+r AS (
+    INSERT INTO barsuk_app_request (user_id, request_type, data, status, created_at, updated_at)
+    SELECT u.id, :request_type,
+           CAST(:data AS jsonb) || jsonb_build_object('user_info', u.user_info),
+           'new', :now, :now
+    FROM u
+    RETURNING id, user_id, request_type, data, created_at
+),
+e AS (
+    INSERT INTO barsuk_app_event (user_id, event_type, event_data, created_at)
+    SELECT r.user_id, :event_type,
+           CAST(:event_data AS jsonb) || jsonb_build_object('request_id', r.id),
+           r.created_at
+    FROM r
+),
+o AS (
+    INSERT INTO barsuk_app_outbox (kind, target, payload, status, attempts, next_attempt_at, last_error, created_at)
+    SELECT :outbox_kind, t.target,
+           jsonb_build_object(
+               'request_id', r.id,
+               'request_type', r.request_type,
+               'data', r.data,
+               'user_info', r.data -> 'user_info',
+               'created_at', r.created_at
+           ),
+           'pending', 0, now(), '', now()
+    FROM r CROSS JOIN unnest(CAST(:targets AS text[])) AS t(target)
+)
+SELECT r.id, r.data -> 'user_info' AS user_info, r.created_at FROM r
+""").bindparams(bindparam("targets", type_=ARRAY(String)), bindparam("now", type_=DateTime))
+
+
+@dataclass(frozen=True)
+class SubmittedRequest:
+    id: int
+    user_info: dict
+    created_at: datetime
+
+
+async def submit_request(db: AsyncSession, telegram_id: int, request_type: str, data: dict,
+                         event_type: str, event_data: dict = None) -> Optional[SubmittedRequest]:
+    """
+    Сохранение заявки одним запросом к БД.
+
+    В одной транзакции вставляются заявка, событие о ней и уведомления
+    менеджерам (outbox). user_info собирается из той же строки пользователя.
+    Возвращает None, если пользователь не зарегистрирован.
+    """
+    result = await db.execute(SUBMIT_REQUEST_SQL, {
+        "telegram_id": int(telegram_id),
+        "request_type": request_type,
+        "data": json.dumps(data, ensure_ascii=False),
+        "event_type": event_type,
+        "event_data": json.dumps(event_data or {}, ensure_ascii=False),
+        "outbox_kind": MANAGER_REQUEST,
+        "now": datetime.utcnow(),
+        "targets": manager_targets(),
+    })
+    row = result.one_or_none()
+    await db.commit()
+
+    if row is None:
+        return None
+
+    user_info = row.user_info
+    if isinstance(user_info, str):
+        user_info = json.loads(user_info)
+    return SubmittedRequest(id=row.id, user_info=user_info, created_at=row.created_at)
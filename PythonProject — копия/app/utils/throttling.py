@@ -0,0 +1,221 @@
+import hashlib
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject
+from redis.asyncio import Redis
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryThrottleStorage:
+    """Token bucket'ы и окна дедупликации в памяти процесса"""
+
+    # Как часто чистить устаревшие ключи (по числу обращений)
+    cleanup_every = 10000
+
+    def __init__(self):
+        self._buckets = {}
+        self._seen = {}
+        self._calls = 0
+
+    async def take(self, buckets) -> bool:
+        """
+        Взять по токену из каждого ведра [(key, rate, burst)]; если хоть одно
+        пустое - False, и токены не берутся ни из одного.
+        """
+        self._maybe_cleanup()
+        now = time.monotonic()
+        refilled = []
+        for key, rate, burst in buckets:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            refilled.append((key, min(burst, tokens + (now - updated_at) * rate)))
+        allowed = all(tokens >= 1 for _, tokens in refilled)
+        for key, tokens in refilled:
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+        return allowed
+
+    async def seen(self, key: str, window: float) -> bool:
+        """True, если key уже встречался за последние window секунд; иначе запоминает его"""
+        self._maybe_cleanup()
+        now = time.monotonic()
+        expires_at = self._seen.get(key)
+        if expires_at is not None and expires_at > now:
+            return True
+        self._seen[key] = now + window
+        return False
+
+    async def forget(self, key: str):
+        self._seen.pop(key, None)
+
+    def _maybe_cleanup(self):
+        self._calls += 1
+        if self._calls % self.cleanup_every:
+            return
+        now = time.monotonic()
+        self._seen = {key: exp for key, exp in self._seen.items() if exp > now}
+        # Ведро, не трогавшееся минуту, уже полное - хранить его незачем
+        self._buckets = {key: value for key, value in self._buckets.items() if now - value[1] < 60}
+
+
+class RedisThrottleStorage:
+    """Общее для всех процессов бота хранилище на Redis"""
+
+    # KEYS - ведра, ARGV - now, затем rate и burst каждого ведра
+    TOKEN_BUCKET_LUA = """
+    local now = tonumber(ARGV[1])
+    local tokens = {}
+    local allowed = 1
+    for i, key in ipairs(KEYS) do
+        local rate = tonumber(ARGV[i * 2])
+        local burst = tonumber(ARGV[i * 2 + 1])
+        local state = redis.call('HMGET', key, 'tokens', 'ts')
+        local value = tonumber(state[1]) or burst
+        local ts = tonumber(state[2]) or now
+        tokens[i] = math.min(burst, value + math.max(0, now - ts) * rate)
+        if tokens[i] < 1 then
+            allowed = 0
+        end
+    end
+    for i, key in ipairs(KEYS) do
+        local rate = tonumber(ARGV[i * 2])
+        local burst = tonumber(ARGV[i * 2 + 1])
+        redis.call('HSET', key, 'tokens', tokens[i] - allowed, 'ts', now)
+        redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+    end
+    return allowed
+    """
+
+    def __init__(self, redis: Redis, prefix: str = "throttle"):
+        self.redis = redis
+        self.prefix = prefix
+        self._take = redis.register_script(self.TOKEN_BUCKET_LUA)
+
+    async def take(self, buckets) -> bool:
+        keys = [f"{self.prefix}:tb:{key}" for key, _, _ in buckets]
+        args = [time.time()]
+        for _, rate, burst in buckets:
+            args.extend((rate, burst))
+        return bool(await self._take(keys=keys, args=args))
+
+    async def seen(self, key: str, window: float) -> bool:
+        # SET NX атомарен: из двух одновременных апдейтов пройдет только один
+        created = await self.redis.set(f"{self.prefix}:seen:{key}", 1, nx=True, px=int(window * 1000))
+        return not created
+
+    async def forget(self, key: str):
+        await self.redis.delete(f"{self.prefix}:seen:{key}")
+
+
+def create_throttle_storage():
+    """Хранилище по настройкам: memory (по умолчанию) или redis (общее для воркеров)"""
+    if Config.THROTTLE_STORAGE == "redis":
+        return RedisThrottleStorage(Redis.from_url(Config.REDIS_URL))
+    return MemoryThrottleStorage()
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Защита от флуда и повторных нажатий.
+
+    - дедупликация: повтор того же апдейта (update_id) и то же сообщение /
+      тот же колбэк от пользователя в течение dedup_window отбрасываются -
+      двойное "✅ Да, отправить" не создаст вторую заявку. Колбэк считается
+      повтором, только пока обрабатывается первое нажатие: хендлер меняет
+      сообщение, и то же нажатие после этого - новое действие (навигация
+      по меню туда и обратно);
+    - token bucket на пользователя (все хендлеры вместе) и на пару
+      пользователь + хендлер; токен берется, только если есть в обоих.
+
+    Регистрируется inner-middleware до DatabaseMiddleware, поэтому
+    отброшенные апдейты не занимают соединение с БД.
+    Лимиты хендлера задаются флагом: flags={"throttle": {"rate": 0.5, "burst": 2}},
+    flags={"throttle": False} отключает ограничение (дедупликация остается).
+    """
+
+    def __init__(self, storage, rate: float = 1.0, burst: int = 3,
+                 user_rate: float = 3.0, user_burst: int = 10, dedup_window: float = 2.0):
+        self.storage = storage
+        self.rate = rate
+        self.burst = burst
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.dedup_window = dedup_window
+
+        # Счетчики
+        self.duplicates = 0
+        self.throttled = 0
+
+    def stats(self) -> dict:
+        return {"duplicates": self.duplicates, "throttled": self.throttled}
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        if await self._is_duplicate(event, data, user.id):
+            self.duplicates += 1
+            if isinstance(event, CallbackQuery):
+                await event.answer()
+            return None
+
+        try:
+            throttle = get_flag(data, "throttle")
+            if throttle is not False and not await self._allowed(data, user.id, throttle or {}):
+                self.throttled += 1
+                await self._warn(event, user.id)
+                return None
+
+            return await handler(event, data)
+        finally:
+            if isinstance(event, CallbackQuery):
+                await self.storage.forget(self._fingerprint_key(event, user.id))
+
+    def _fingerprint_key(self, event: TelegramObject, user_id: int):
+        if isinstance(event, CallbackQuery):
+            message_id = event.message.message_id if event.message else event.inline_message_id
+            fingerprint = f"cb:{message_id}:{event.data}"
+        elif isinstance(event, Message) and event.text:
+            fingerprint = f"msg:{event.chat.id}:{event.text}"
+        else:
+            return None
+
+        digest = hashlib.blake2b(fingerprint.encode("utf-8"), digest_size=12).hexdigest()
+        return f"dup:{user_id}:{digest}"
+
+    async def _is_duplicate(self, event: TelegramObject, data: Dict[str, Any], user_id: int) -> bool:
+        update = data.get("event_update")
+        if update is not None and await self.storage.seen(f"upd:{update.update_id}", 60):
+            return True
+
+        key = self._fingerprint_key(event, user_id)
+        return key is not None and await self.storage.seen(key, self.dedup_window)
+
+    async def _allowed(self, data: Dict[str, Any], user_id: int, limits: dict) -> bool:
+        handler = data.get("handler")
+        callback = getattr(handler, "callback", None)
+        name = f"{callback.__module__}.{callback.__qualname__}" if callback else "unknown"
+        # Отказ по лимиту хендлера не тратит общий лимит пользователя
+        return await self.storage.take([
+            (f"user:{user_id}", self.user_rate, self.user_burst),
+            (f"handler:{user_id}:{name}", limits.get("rate", self.rate), limits.get("burst", self.burst)),
+        ])
+
+    async def _warn(self, event: TelegramObject, user_id: int):
+        if isinstance(event, CallbackQuery):
+            await event.answer("⏳ Слишком часто, подождите немного")
+        elif isinstance(event, Message):
+            # Предупреждаем один раз за окно, чтобы не отвечать на каждое сообщение флуда
+            if not await self.storage.seen(f"warn:{user_id}", 10):
+                await event.answer("⏳ Слишком много запросов, подождите несколько секунд")
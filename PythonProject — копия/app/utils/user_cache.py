@@ -0,0 +1,99 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from config import Config
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """Снимок пользователя, достаточный для проверки доступа и подписи заявок"""
+    id: int
+    telegram_id: int
+    status: object
+    username: str = None
+    first_name: str = None
+    last_name: str = None
+    phone: str = None
+
+    @classmethod
+    def from_model(cls, user) -> "CachedUser":
+        return cls(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            status=user.status,
+            username=user.username,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            phone=user.phone,
+        )
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.first_name or ''} {self.last_name or ''}".strip()
+
+
+class UserCache:
+    """
+    LRU-кэш пользователей по telegram_id с ограничением по времени жизни.
+
+    Записи из бота обновляют кэш явно, изменения из админки приходят
+    через LISTEN/NOTIFY (см. app/utils/notify.py). TTL ограничивает
+    устаревание, если уведомление потерялось.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id: int):
+        item = self._items.get(telegram_id)
+        if item is None:
+            self.misses += 1
+            return None
+
+        user, expires_at = item
+        if expires_at < time.monotonic():
+            del self._items[telegram_id]
+            self.misses += 1
+            return None
+
+        self._items.move_to_end(telegram_id)
+        self.hits += 1
+        return user
+
+    def set(self, user: CachedUser):
+        self._items[user.telegram_id] = (user, time.monotonic() + self.ttl)
+        self._items.move_to_end(user.telegram_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, telegram_id: int):
+        self._items.pop(telegram_id, None)
+
+    def clear(self):
+        self._items.clear()
+
+    def on_notify(self, payload):
+        """Обработчик NOTIFY: payload - telegram_id или None (сбросить всё)"""
+        if not payload:
+            self.clear()
+            return
+        try:
+            self.invalidate(int(payload))
+        except ValueError:
+            self.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+user_cache = UserCache(max_size=Config.USER_CACHE_SIZE, ttl=Config.USER_CACHE_TTL)
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик вебхука с ограничением числа одновременно
+    обрабатываемых апдейтов.
+
+    Апдейты обрабатываются в фоне, но не больше max_in_flight сразу:
+    при превышении ответ Telegram задерживается, и он сам снижает темп.
+    При остановке новые апдейты отклоняются (Telegram повторит их позже),
+    а уже принятые дорабатывают до конца.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_in_flight: int = 100, **kwargs):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self.max_in_flight = max_in_flight
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._closing = False
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._background_feed_update_tasks)
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        if self._closing:
+            return web.Response(status=503, text="Shutting down")
+
+        await self._semaphore.acquire()
+        try:
+            update = await request.json(loads=bot.session.json_loads)
+        except Exception:
+            self._semaphore.release()
+            raise
+
+        task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._on_update_done)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    def _on_update_done(self, task: asyncio.Task):
+        self._background_feed_update_tasks.discard(task)
+        self._semaphore.release()
+
+    async def drain(self, timeout: float):
+        """Дождаться завершения принятых апдейтов"""
+        self._closing = True
+        tasks = set(self._background_feed_update_tasks)
+        if not tasks:
+            return
+
+        logger.info("Ожидание завершения %s апдейтов...", len(tasks))
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            logger.warning("Не дождались %s апдейтов за %s сек", len(pending), timeout)
+
+
+def create_webhook_app(dispatcher: Dispatcher, bot: Bot, path: str, secret_token: str = None,
+                       max_in_flight: int = 100, drain_timeout: float = 30.0) -> web.Application:
+    """
+    Сборка aiohttp-приложения для режима вебхука.
+
+    Порядок остановки: дождаться текущих апдейтов -> shutdown диспетчера
+    (сброс очередей записи) -> закрытие сессии бота.
+    """
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        max_in_flight=max_in_flight,
+        secret_token=secret_token,
+    )
+
+    async def drain_updates(_app: web.Application):
+        await handler.drain(drain_timeout)
+
+    app.on_shutdown.append(drain_updates)
+    setup_application(app, dispatcher, bot=bot)
+    handler.register(app, path=path)
+    return app
@@ -0,0 +1,97 @@
+"""
+Фейковый Bot API для нагрузочных тестов: отвечает на любые методы как
+Telegram, с настраиваемой задержкой, и запоминает последнее сообщение
+бота в каждом чате (по нему виртуальные пользователи находят кнопки).
+
+Отдельный запуск (например, для бота в режиме вебхука):
+    python -m benchmarks.fake_bot_api --port 8081 --latency 0.05
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "Barsuk Load Test", "username": "barsuk_load_bot"}
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = Counter()
+        # chat_id -> последнее отправленное/отредактированное сообщение
+        self.last_message = {}
+        # chat_id -> сколько сообщений бот отправил или изменил
+        self.replies = Counter()
+        self._message_ids = itertools.count(1_000_000)
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=10 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запуск в текущем event loop; возвращает базовый URL сервера"""
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        self.calls[method] += 1
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+
+        return web.json_response({"ok": True, "result": self.result(method.lower(), data)})
+
+    def result(self, method: str, data: dict):
+        if method == "getme":
+            return BOT_USER
+        if method in ("sendmessage", "editmessagetext", "sendphoto"):
+            return self._message(method, data)
+        return True
+
+    def _message(self, method: str, data: dict) -> dict:
+        chat_id = int(data["chat_id"])
+        message_id = int(data["message_id"]) if method == "editmessagetext" else next(self._message_ids)
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": data.get("text") or data.get("caption") or "",
+        }
+        if data.get("reply_markup"):
+            message["reply_markup"] = json.loads(data["reply_markup"])
+        self.last_message[chat_id] = message
+        self.replies[chat_id] += 1
+        return message
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа, секунд")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Случайная добавка к задержке, секунд")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(latency=args.latency, jitter=args.jitter)
+    web.run_app(api.create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""
+Нагрузочный тест бота: настоящий Dispatcher из main.create_dispatcher,
+локальный PostgreSQL и фейковый Bot API (benchmarks/fake_bot_api.py).
+
+N виртуальных пользователей одновременно проходят регистрацию
+(/start -> 18+ -> согласие -> контакт), затем несколько раз листают меню
+(кнопки category_ и back_to_menu) и оформляют заявку на трансфер
+(TransferRequestStates до "✅ Да, отправить"). Апдейты подаются через
+dp.feed_update - так же, как их обрабатывает вебхук.
+
+Отчет: p50/p95/p99 времени обработки апдейта (всего и по шагам), апдейтов в
+секунду, запросов к БД на апдейт, ожидание соединения из пула.
+Сценарий засчитывается завершенным, только если после каждого шага бот
+перешел в ожидаемое состояние FSM и прислал ожидаемый экран; ответы об
+ошибке ввода, отказе в доступе и троттлинге считаются в unexpected.
+
+Запуск из корня проекта на тестовой базе (MANAGER_WEBHOOK_URL лучше не задавать):
+    python -m benchmarks.loadtest --users 200 --iterations 3 --api-latency 0.05
+    python -m benchmarks.loadtest --users 500 --json report.json --max-p95 0.5
+
+Пользователи создаются с telegram_id от --base-id и удаляются (вместе с
+заявками, событиями и уведомлениями) до и после прогона. --base-id должен
+быть не меньше 2**52 - id Telegram занимают до 52 бит, поэтому удаление
+диапазона не задевает настоящих пользователей. По умолчанию - сразу за
+диапазоном анонимных id записи (benchmarks/replay.py).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.enums import ParseMode
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.types import Update
+from sqlalchemy import text
+
+from app.request import TransferRequestStates
+from app.start import RegistrationStates
+from app.utils.database import engine, async_session, pool_wait_stats, pool_stats
+from app.utils.recorder import ANON_ID_BASE, ANON_ID_RANGE
+from app.utils.throttling import ThrottlingMiddleware
+from benchmarks.fake_bot_api import FakeBotAPI
+from benchmarks.submission_roundtrips import RoundTripCounter
+from config import Config
+from main import create_dispatcher
+
+logger = logging.getLogger(__name__)
+
+# id пользователей и чатов Telegram занимают до 52 бит; тестовые id - выше
+TELEGRAM_ID_LIMIT = 2 ** 52
+DEFAULT_BASE_ID = ANON_ID_BASE + ANON_ID_RANGE
+
+# Таблицы, ссылающиеся на пользователя (удаляются до самого пользователя)
+USER_TABLES = (
+    "barsuk_app_event",
+    "barsuk_app_broadcastrecipient",
+    "barsuk_app_funneluserprogress",
+    "barsuk_app_useractiveday",
+)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))
+    return values[index]
+
+
+class LoadTest:
+    """Подача апдейтов в диспетчер и сбор замеров"""
+
+    def __init__(self, dp, bot, api: FakeBotAPI, think: float):
+        self.dp = dp
+        self.bot = bot
+        self.api = api
+        self.think = think
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.no_reply = Counter()
+        self.unexpected = Counter()
+        self._update_ids = itertools.count(1)
+
+    async def pause(self):
+        if self.think:
+            await asyncio.sleep(random.uniform(self.think / 2, self.think * 1.5))
+
+    async def feed(self, label: str, chat_id: int, update: dict) -> bool:
+        """Обработать апдейт; True, если бот ответил (отправил или изменил сообщение)"""
+        update["update_id"] = next(self._update_ids)
+        replies = self.api.replies[chat_id]
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, Update.model_validate(update, context={"bot": self.bot}))
+        except Exception:
+            self.errors[label] += 1
+            logger.exception("Ошибка обработки %s", label)
+            return False
+        finally:
+            self.latencies[label].append(time.perf_counter() - started)
+
+        if self.api.replies[chat_id] == replies:
+            self.no_reply[label] += 1
+            return False
+        return True
+
+
+class VirtualUser:
+    def __init__(self, test: LoadTest, telegram_id: int):
+        self.test = test
+        self.telegram_id = telegram_id
+        self.user = {"id": telegram_id, "is_bot": False, "first_name": "Load", "last_name": str(telegram_id),
+                     "username": f"load{telegram_id}", "language_code": "ru"}
+        self.chat = {"id": telegram_id, "type": "private"}
+        self._message_ids = itertools.count(1)
+        self.completed = Counter()
+        self.key = StorageKey(bot_id=test.bot.id, chat_id=telegram_id, user_id=telegram_id)
+
+    def _message(self, **fields) -> dict:
+        return {"message": {"message_id": next(self._message_ids), "date": int(time.time()),
+                            "chat": self.chat, "from": self.user, **fields}}
+
+    async def say(self, label: str, message_text: str) -> bool:
+        await self.test.pause()
+        return await self.test.feed(label, self.telegram_id, self._message(text=message_text))
+
+    async def share_contact(self) -> bool:
+        await self.test.pause()
+        contact = {"phone_number": f"+7{self.telegram_id % 10_000_000_000:010d}",
+                   "first_name": "Load", "user_id": self.telegram_id}
+        return await self.test.feed("contact", self.telegram_id, self._message(contact=contact))
+
+    async def click(self, label: str, data: str) -> bool:
+        await self.test.pause()
+        message = self.test.api.last_message.get(self.telegram_id)
+        update = {"callback_query": {
+            "id": f"{self.telegram_id}-{next(self._message_ids)}",
+            "from": self.user,
+            "chat_instance": str(self.telegram_id),
+            "data": data,
+            "message": {"message_id": message["message_id"], "date": message["date"],
+                        "chat": self.chat, "from": message["from"], "text": message["text"]},
+        }}
+        return await self.test.feed(label, self.telegram_id, update)
+
+    async def check(self, label: str, state=None, reply: str = None) -> bool:
+        """Бот перешел в ожидаемое состояние FSM и прислал ожидаемый экран"""
+        current = await self.test.dp.fsm.storage.get_state(self.key)
+        message = self.test.api.last_message.get(self.telegram_id) or {}
+        if current != (state.state if state else None) or (reply and reply not in message.get("text", "")):
+            # Ответ был, но не тот: ошибка ввода, отказ в доступе, троттлинг
+            self.test.unexpected[label] += 1
+            return False
+        return True
+
+    def buttons(self, prefix: str):
+        """callback_data inline-кнопок последнего сообщения бота"""
+        message = self.test.api.last_message.get(self.telegram_id) or {}
+        keyboard = (message.get("reply_markup") or {}).get("inline_keyboard", [])
+        return [button["callback_data"] for row in keyboard for button in row
+                if button.get("callback_data", "").startswith(prefix)]
+
+    async def register(self):
+        steps = [
+            ("/start", lambda: self.say("/start", "/start"), RegistrationStates.age_confirmation, None),
+            ("age", lambda: self.say("age", "✅ Мне 18+"), RegistrationStates.consent, None),
+            ("consent", lambda: self.say("consent", "✅ Я согласен на обработку данных"),
+             RegistrationStates.phone, None),
+            ("contact", self.share_contact, None, "Регистрация завершена"),
+        ]
+        for label, step, state, reply in steps:
+            if not await step() or not await self.check(label, state, reply):
+                return
+        self.completed["registration"] += 1
+
+    async def browse_menu(self):
+        if (not await self.say("menu", "📌 Меню / Программы")
+                or not await self.check("menu", reply="Выберите категорию")):
+            return
+        categories = self.buttons("category_")
+        for data in random.sample(categories, min(2, len(categories))):
+            if not await self.click("category", data):
+                return
+            if not self.buttons("back_to_menu"):
+                self.test.unexpected["category"] += 1
+                return
+            if (not await self.click("back_to_menu", "back_to_menu")
+                    or not await self.check("back_to_menu", reply="Выберите категорию")):
+                return
+        self.completed["menu"] += 1
+
+    async def submit_transfer(self):
+        # Текст шага и состояние, в которое бот должен перейти после него
+        steps = [
+            ("transfer", "🚖 Заказать трансфер", TransferRequestStates.address, None),
+            ("address", f"ул. Нагрузочная, д. {random.randint(1, 200)}", TransferRequestStates.date, None),
+            ("date", "завтра", TransferRequestStates.time, None),
+            ("time", f"{random.randint(18, 23)}:{random.choice(['00', '30'])}", TransferRequestStates.guests, None),
+            ("guests", str(random.randint(1, 10)), TransferRequestStates.comment, None),
+            ("comment", "нагрузочный тест", TransferRequestStates.confirm, None),
+            ("confirm", "✅ Да, отправить", None, "отправлена!"),
+        ]
+        for label, message_text, state, reply in steps:
+            if not await self.say(label, message_text) or not await self.check(label, state, reply):
+                return
+        self.completed["transfer"] += 1
+
+    async def run(self, iterations: int):
+        await self.register()
+        for _ in range(iterations):
+            await self.browse_menu()
+            await self.submit_transfer()
+
+
+async def cleanup(base_id: int, users: int):
+    """Удаление виртуальных пользователей и всего, что они создали"""
+    if base_id < TELEGRAM_ID_LIMIT:
+        raise ValueError(f"Диапазон от {base_id} может содержать настоящих пользователей")
+    params = {"first": base_id, "last": base_id + users - 1}
+    user_ids = "SELECT id FROM barsuk_app_telegramuser WHERE telegram_id BETWEEN :first AND :last"
+    request_ids = f"SELECT id FROM barsuk_app_request WHERE user_id IN ({user_ids})"
+    async with async_session() as db:
+        await db.execute(text(
+            f"DELETE FROM barsuk_app_outbox WHERE (payload ->> 'request_id')::bigint IN ({request_ids})"
+        ), params)
+        await db.execute(text(f"DELETE FROM barsuk_app_request WHERE user_id IN ({user_ids})"), params)
+        for table in USER_TABLES:
+            exists = (await db.execute(text("SELECT to_regclass(:table)"), {"table": table})).scalar()
+            if exists:
+                await db.execute(text(f"DELETE FROM {table} WHERE user_id IN ({user_ids})"), params)
+        await db.execute(text("DELETE FROM barsuk_app_telegramuser WHERE telegram_id BETWEEN :first AND :last"),
+                         params)
+        await db.commit()
+
+
+def create_test_bot(api_url: str, connections: int) -> Bot:
+    """Бот, который ходит в фейковый Bot API"""
+    return Bot(
+        token=Config.BOT_TOKEN,
+        session=AiohttpSession(api=TelegramAPIServer.from_base(api_url), limit=connections),
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+
+
+def find_throttling(dp):
+    for middleware in dp.message.middleware:
+        if isinstance(middleware, ThrottlingMiddleware):
+            return middleware
+    return None
+
+
+def build_report(test: LoadTest, elapsed: float, counter: RoundTripCounter, pool_before: dict,
+                 users: list, throttling) -> dict:
+    all_latencies = [value for values in test.latencies.values() for value in values]
+    updates = len(all_latencies)
+    checkouts = pool_wait_stats.checkouts - pool_before["checkouts"]
+    total_wait = pool_wait_stats.total_wait - pool_before["total_wait"]
+
+    def summary(values):
+        return {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": max(values) if values else 0.0,
+        }
+
+    completed = Counter()
+    for user in users:
+        completed.update(user.completed)
+
+    return {
+        "users": len(users),
+        "elapsed": elapsed,
+        "updates": updates,
+        "updates_per_sec": updates / elapsed if elapsed else 0.0,
+        "latency": summary(all_latencies),
+        "steps": {label: summary(values) for label, values in sorted(test.latencies.items())},
+        "db_statements_per_update": counter.statements / updates if updates else 0.0,
+        "db_commits_per_update": counter.commits / updates if updates else 0.0,
+        "pool": {
+            "checkouts": checkouts,
+            "avg_wait": total_wait / checkouts if checkouts else 0.0,
+            "max_wait": pool_wait_stats.max_wait,
+            "timeouts": pool_wait_stats.timeouts - pool_before["timeouts"],
+            "size": pool_stats()["size"],
+        },
+        "completed": dict(completed),
+        "errors": dict(test.errors),
+        "no_reply": dict(test.no_reply),
+        "unexpected": dict(test.unexpected),
+        "throttling": throttling.stats() if throttling else {},
+        "api_calls": dict(test.api.calls),
+    }
+
+
+def print_report(report: dict):
+    ms = 1000
+    latency = report["latency"]
+    print(f"\nПользователей: {report['users']}, апдейтов: {report['updates']} за {report['elapsed']:.1f} с "
+          f"({report['updates_per_sec']:.1f} апд/с)")
+    print(f"Время обработки: p50 {latency['p50'] * ms:.1f} мс, p95 {latency['p95'] * ms:.1f} мс, "
+          f"p99 {latency['p99'] * ms:.1f} мс, max {latency['max'] * ms:.1f} мс")
+    print(f"Запросов к БД на апдейт: {report['db_statements_per_update']:.2f} "
+          f"(commit {report['db_commits_per_update']:.2f})")
+    pool = report["pool"]
+    print(f"Пул: выдач {pool['checkouts']}, ожидание в среднем {pool['avg_wait'] * ms:.2f} мс, "
+          f"max {pool['max_wait'] * ms:.1f} мс, таймаутов {pool['timeouts']}")
+
+    print(f"\n{'Шаг':<14}{'кол-во':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for label, step in report["steps"].items():
+        print(f"{label:<14}{step['count']:>8}{step['p50'] * ms:>10.1f}{step['p95'] * ms:>10.1f}"
+              f"{step['p99'] * ms:>10.1f}")
+
+    print(f"\nЗавершено сценариев: {report['completed']}")
+    if report["errors"]:
+        print(f"Ошибки: {report['errors']}")
+    if report["no_reply"]:
+        print(f"Без ответа бота (троттлинг, дубликаты, отказ в доступе): {report['no_reply']}")
+    if report["unexpected"]:
+        print(f"Неожиданный ответ бота (сценарий не засчитан): {report['unexpected']}")
+    print(f"Троттлинг: {report['throttling']}")
+    print(f"Вызовы Bot API: {report['api_calls']}")
+
+
+async def run(args) -> dict:
+    api = FakeBotAPI(latency=args.api_latency, jitter=args.api_jitter)
+    api_url = await api.start()
+
+    bot = create_test_bot(api_url, args.api_connections)
+    dp = create_dispatcher()
+    engine.echo = False
+    counter = RoundTripCounter()
+    counter.install(engine.sync_engine)
+
+    await cleanup(args.base_id, args.users)
+    await dp.emit_startup(bot=bot, dispatcher=dp, bots=[bot])
+
+    test = LoadTest(dp, bot, api, think=args.think)
+    users = [VirtualUser(test, args.base_id + index) for index in range(args.users)]
+
+    async def start_user(index, user):
+        # Плавный разгон: пользователи подключаются в течение --ramp секунд
+        await asyncio.sleep(args.ramp * index / max(1, len(users)))
+        await user.run(args.iterations)
+
+    counter.reset()
+    pool_before = {"checkouts": pool_wait_stats.checkouts, "total_wait": pool_wait_stats.total_wait,
+                   "timeouts": pool_wait_stats.timeouts}
+    pool_wait_stats.max_wait = 0.0
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(start_user(index, user) for index, user in enumerate(users)))
+        elapsed = time.perf_counter() - started
+        report = build_report(test, elapsed, counter, pool_before, users, find_throttling(dp))
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, bots=[bot])
+        if not args.keep:
+            await cleanup(args.base_id, args.users)
+        await bot.session.close()
+        await api.stop()
+        await engine.dispose()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100, help="Виртуальных пользователей")
+    parser.add_argument("--iterations", type=int, default=2, help="Циклов меню + заявка на пользователя")
+    parser.add_argument("--think", type=float, default=1.0, help="Пауза между действиями пользователя, секунд")
+    parser.add_argument("--ramp", type=float, default=10.0, help="Время подключения всех пользователей, секунд")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Задержка фейкового Bot API, секунд")
+    parser.add_argument("--api-jitter", type=float, default=0.02)
+    parser.add_argument("--api-connections", type=int, default=100, help="Лимит соединений бота к Bot API")
+    parser.add_argument("--base-id", type=int, default=DEFAULT_BASE_ID,
+                        help="Первый telegram_id пользователей (не меньше 2**52)")
+    parser.add_argument("--keep", action="store_true", help="Не удалять созданные данные после прогона")
+    parser.add_argument("--json", help="Сохранить отчет в файл (для сравнения прогонов)")
+    parser.add_argument("--max-p95", type=float, help="Код возврата 1, если p95 больше (секунд)")
+    args = parser.parse_args()
+    if args.base_id < TELEGRAM_ID_LIMIT:
+        parser.error("--base-id должен быть не меньше 2**52, иначе cleanup может удалить настоящих пользователей")
+
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+
+    if args.max_p95 is not None and report["latency"]["p95"] > args.max_p95:
+        print(f"\n❌ p95 {report['latency']['p95']:.3f} с больше порога {args.max_p95} с")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Воспроизведение записанных апдейтов (app/utils/recorder.py) через настоящий
+Dispatcher из main.create_dispatcher с фейковым Bot API - для сравнения
+производительности двух сборок на реальном трафике, а не на сценарии.
+
+Апдейты подаются с исходными интервалами, деленными на --speed (0 - без
+пауз). Апдейты одного чата идут строго по очереди, как в проде. Для каждого
+апдейта замеряются время обработки и число запросов к БД; профиль
+группируется по виду апдейта (команда, кнопка, callback_data с # вместо
+чисел, contact, text).
+
+Запуск из корня проекта на тестовой базе:
+    python -m benchmarks.replay run captures/*.jsonl.gz --speed 10 --json old.json
+    (переключиться на новую сборку)
+    python -m benchmarks.replay run captures/*.jsonl.gz --speed 10 --json new.json
+    python -m benchmarks.replay compare old.json new.json --threshold 0.2
+
+Пользователи из записи, у которых нет /start в начале, создаются заранее
+как зарегистрированные. Все пользователи из диапазона анонимных id (выше
+2**52, см. app/utils/recorder.py) удаляются вместе с заявками и событиями
+до и после прогона. Запись с id вне этого диапазона не воспроизводится.
+"""
+import argparse
+import asyncio
+import contextvars
+import gzip
+import json
+import logging
+import re
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.utils.database import User, UserStatus, async_session, engine
+from app.utils.recorder import ANON_ID_BASE, ANON_ID_RANGE, keyboard_labels
+from benchmarks.fake_bot_api import FakeBotAPI
+from benchmarks.loadtest import LoadTest, cleanup, create_test_bot, find_throttling, percentile
+from config import Config
+from main import create_dispatcher
+
+logger = logging.getLogger(__name__)
+
+# Счетчик запросов к БД текущего апдейта (SQLAlchemy передает контекст в свои greenlet)
+_current_queries = contextvars.ContextVar("replay_queries", default=None)
+
+
+def install_query_counter(sync_engine):
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def on_execute(*args):
+        counter = _current_queries.get()
+        if counter is not None:
+            counter[0] += 1
+
+
+def load_capture(paths, limit=None):
+    """Апдейты из файлов записи, по времени получения"""
+    items = []
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    items.append(json.loads(line))
+    items.sort(key=lambda item: item["ts"])
+    return items[:limit] if limit else items
+
+
+def update_chat(update: dict):
+    """Чат апдейта (по нему апдейты выстраиваются в очередь) и пользователь"""
+    for name, payload in update.items():
+        if isinstance(payload, dict):
+            user = payload.get("from") or payload.get("user") or {}
+            chat = payload.get("chat") or (payload.get("message") or {}).get("chat") or {}
+            return chat.get("id", user.get("id")), user.get("id")
+    return None, None
+
+
+def update_label(update: dict, labels: set) -> str:
+    if "message" in update:
+        message = update["message"]
+        text = message.get("text")
+        if message.get("contact"):
+            return "contact"
+        if text is None:
+            return "message"
+        if text.startswith("/"):
+            return text.split()[0].split("@")[0]
+        return text if text in labels else "text"
+    if "callback_query" in update:
+        return "cb:" + re.sub(r"\d+", "#", update["callback_query"].get("data") or "")
+    return next((name for name in update if name != "update_id"), "unknown")
+
+
+def preregistered_users(items) -> list:
+    """Пользователи, чей первый апдейт в записи - не /start: они уже были зарегистрированы"""
+    first = {}
+    for item in items:
+        chat_id, user_id = update_chat(item["update"])
+        if user_id is not None and user_id not in first:
+            text = (item["update"].get("message") or {}).get("text") or ""
+            first[user_id] = text.startswith("/start")
+    return [user_id for user_id, started in first.items() if not started]
+
+
+async def seed_users(telegram_ids: list):
+    now = datetime.utcnow()
+    async with async_session() as db:
+        for start in range(0, len(telegram_ids), 1000):
+            rows = [{
+                "telegram_id": telegram_id, "first_name": "User", "language_code": "ru",
+                "phone": f"+7{telegram_id % 10 ** 10:010d}", "status": UserStatus.ACTIVE,
+                "is_18_confirmed": True, "consent_accepted": True, "consent_version": "1.0",
+                "consent_accepted_at": now, "created_at": now, "updated_at": now, "last_activity": now,
+            } for telegram_id in telegram_ids[start:start + 1000]]
+            await db.execute(pg_insert(User).values(rows).on_conflict_do_nothing(index_elements=["telegram_id"]))
+        await db.commit()
+
+
+class Replay(LoadTest):
+    """LoadTest, который дополнительно считает запросы к БД каждого апдейта"""
+
+    def __init__(self, dp, bot, api: FakeBotAPI):
+        super().__init__(dp, bot, api, think=0)
+        self.queries = defaultdict(list)
+        self.schedule_lag = []
+
+    async def feed(self, label: str, chat_id: int, update: dict) -> bool:
+        counter = [0]
+        token = _current_queries.set(counter)
+        try:
+            return await super().feed(label, chat_id, update)
+        finally:
+            _current_queries.reset(token)
+            self.queries[label].append(counter[0])
+
+    async def play(self, items, speed: float, labels: set):
+        chats = defaultdict(list)
+        for item in items:
+            chat_id, _ = update_chat(item["update"])
+            chats[chat_id].append(item)
+
+        first_ts = items[0]["ts"]
+        started = time.perf_counter()
+
+        async def play_chat(chat_id, chat_items):
+            for item in chat_items:
+                due = started + (item["ts"] - first_ts) / speed if speed else started
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                # Насколько апдейт опоздал против расписания (бот или чат не успевают)
+                self.schedule_lag.append(max(0.0, -delay))
+                update = item["update"]
+                await self.feed(update_label(update, labels), chat_id, update)
+
+        await asyncio.gather(*(play_chat(chat_id, chat_items) for chat_id, chat_items in chats.items()))
+        return time.perf_counter() - started
+
+
+def summary(values) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def build_profile(replay: Replay, elapsed: float, args, throttling) -> dict:
+    all_latencies = [value for values in replay.latencies.values() for value in values]
+    all_queries = [value for values in replay.queries.values() for value in values]
+    labels = {}
+    for label, values in sorted(replay.latencies.items()):
+        queries = replay.queries[label]
+        labels[label] = {
+            **summary(values),
+            "queries_mean": sum(queries) / len(queries) if queries else 0.0,
+            "queries_max": max(queries) if queries else 0,
+            "errors": replay.errors[label],
+            "no_reply": replay.no_reply[label],
+        }
+    return {
+        "build": args.build,
+        "captures": args.captures,
+        "speed": args.speed,
+        "elapsed": elapsed,
+        "updates": len(all_latencies),
+        "latency": summary(all_latencies),
+        "queries_mean": sum(all_queries) / len(all_queries) if all_queries else 0.0,
+        "schedule_lag": summary(replay.schedule_lag),
+        "labels": labels,
+        "throttling": throttling.stats() if throttling else {},
+        "api_calls": dict(replay.api.calls),
+    }
+
+
+def print_profile(profile: dict):
+    ms = 1000
+    latency = profile["latency"]
+    print(f"\nСборка {profile['build'] or '-'}: апдейтов {profile['updates']} за {profile['elapsed']:.1f} с "
+          f"(скорость x{profile['speed'] or 'max'})")
+    print(f"Время обработки: p50 {latency['p50'] * ms:.1f} мс, p95 {latency['p95'] * ms:.1f} мс, "
+          f"p99 {latency['p99'] * ms:.1f} мс; запросов к БД на апдейт {profile['queries_mean']:.2f}")
+    print(f"Отставание от расписания: p95 {profile['schedule_lag']['p95'] * ms:.1f} мс")
+
+    print(f"\n{'Вид апдейта':<32}{'кол-во':>8}{'p50, мс':>10}{'p95, мс':>10}{'запросов':>10}{'ошибок':>8}")
+    for label, row in sorted(profile["labels"].items(), key=lambda item: -item[1]["count"]):
+        print(f"{label[:31]:<32}{row['count']:>8}{row['p50'] * ms:>10.1f}{row['p95'] * ms:>10.1f}"
+              f"{row['queries_mean']:>10.2f}{row['errors']:>8}")
+
+
+def compare_profiles(old: dict, new: dict, threshold: float, min_delta: float) -> list:
+    """
+    Строки сравнения по видам апдейтов. Регрессия - p95 выросло больше чем на
+    threshold (доля) и на min_delta секунд, или в среднем стало больше запросов к БД.
+    """
+    rows = []
+    for label in sorted(set(old["labels"]) | set(new["labels"])):
+        before, after = old["labels"].get(label), new["labels"].get(label)
+        if before is None or after is None:
+            rows.append({"label": label, "before": before, "after": after, "regressions": []})
+            continue
+        regressions = []
+        p95_delta = after["p95"] - before["p95"]
+        if p95_delta > min_delta and p95_delta > before["p95"] * threshold:
+            regressions.append("p95")
+        # Число запросов от нагрузки почти не зависит - любой заметный рост подозрителен
+        if after["queries_mean"] - before["queries_mean"] >= 0.1:
+            regressions.append("queries")
+        if after["errors"] > before["errors"]:
+            regressions.append("errors")
+        rows.append({"label": label, "before": before, "after": after, "regressions": regressions})
+    return rows
+
+
+def print_comparison(old: dict, new: dict, rows: list):
+    ms = 1000
+    print(f"\n{old['build'] or 'old'} -> {new['build'] or 'new'}")
+    print(f"{'Вид апдейта':<32}{'кол-во':>8}{'p50, мс':>18}{'p95, мс':>18}{'запросов':>16}")
+    for row in rows:
+        before, after = row["before"], row["after"]
+        if before is None or after is None:
+            print(f"{row['label'][:31]:<32}  только в {'новом' if before is None else 'старом'} профиле")
+            continue
+        p95_change = (after["p95"] / before["p95"] - 1) * 100 if before["p95"] else 0.0
+        mark = "  ❌ " + ", ".join(row["regressions"]) if row["regressions"] else ""
+        print(f"{row['label'][:31]:<32}{after['count']:>8}"
+              f"{before['p50'] * ms:>8.1f} -> {after['p50'] * ms:<6.1f}"
+              f"{before['p95'] * ms:>8.1f} -> {after['p95'] * ms:<6.1f}"
+              f"{before['queries_mean']:>6.2f} -> {after['queries_mean']:<6.2f}"
+              f" ({p95_change:+.0f}% p95){mark}")
+
+
+async def run(args) -> dict:
+    items = load_capture(args.captures, limit=args.limit)
+    if not items:
+        raise SystemExit("В записи нет апдейтов")
+    foreign = {user_id for user_id in (update_chat(item["update"])[1] for item in items)
+               if user_id is not None and not ANON_ID_BASE <= user_id < ANON_ID_BASE + ANON_ID_RANGE}
+    if foreign:
+        # Такие пользователи не удаляются cleanup - и могут оказаться реальными
+        raise SystemExit(f"В записи {len(foreign)} id вне диапазона анонимных (запись старой версии?)")
+    labels = keyboard_labels()
+
+    api = FakeBotAPI(latency=args.api_latency, jitter=args.api_jitter)
+    api_url = await api.start()
+    bot = create_test_bot(api_url, args.api_connections)
+
+    # Воспроизведение не должно писать само себя
+    Config.RECORD_UPDATES = False
+    dp = create_dispatcher()
+    throttling = find_throttling(dp)
+    if args.no_throttle and throttling is not None:
+        dp.message.middleware.unregister(throttling)
+        dp.callback_query.middleware.unregister(throttling)
+        throttling = None
+
+    engine.echo = False
+    install_query_counter(engine.sync_engine)
+
+    await cleanup(ANON_ID_BASE, ANON_ID_RANGE)
+    await seed_users(preregistered_users(items))
+    await dp.emit_startup(bot=bot, dispatcher=dp, bots=[bot])
+
+    replay = Replay(dp, bot, api)
+    try:
+        elapsed = await replay.play(items, args.speed, labels)
+        profile = build_profile(replay, elapsed, args, throttling)
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, bots=[bot])
+        if not args.keep:
+            await cleanup(ANON_ID_BASE, ANON_ID_RANGE)
+        await bot.session.close()
+        await api.stop()
+        await engine.dispose()
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Воспроизвести запись и снять профиль")
+    run_parser.add_argument("captures", nargs="+", help="Файлы *.jsonl.gz из RECORD_DIR")
+    run_parser.add_argument("--speed", type=float, default=1.0, help="Ускорение (0 - без пауз)")
+    run_parser.add_argument("--limit", type=int, help="Только первые N апдейтов")
+    run_parser.add_argument("--build", default="", help="Метка сборки в профиле")
+    run_parser.add_argument("--no-throttle", action="store_true",
+                            help="Отключить троттлинг (при большом ускорении он отсекает часть апдейтов)")
+    run_parser.add_argument("--api-latency", type=float, default=0.05, help="Задержка фейкового Bot API, секунд")
+    run_parser.add_argument("--api-jitter", type=float, default=0.02)
+    run_parser.add_argument("--api-connections", type=int, default=100, help="Лимит соединений бота к Bot API")
+    run_parser.add_argument("--keep", action="store_true", help="Не удалять созданные данные после прогона")
+    run_parser.add_argument("--json", help="Сохранить профиль в файл")
+
+    compare_parser = commands.add_parser("compare", help="Сравнить два профиля")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="Допустимый рост p95 (доля)")
+    compare_parser.add_argument("--min-delta", type=float, default=0.005,
+                                help="Рост p95 меньше этого (секунд) не считается регрессией")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.old, encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        rows = compare_profiles(old, new, args.threshold, args.min_delta)
+        print_comparison(old, new, rows)
+        if any(row["regressions"] for row in rows):
+            sys.exit(1)
+        return
+
+    logging.basicConfig(level=logging.WARNING)
+    profile = asyncio.run(run(args))
+    print_profile(profile)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(profile, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
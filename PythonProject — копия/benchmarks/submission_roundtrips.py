@@ -0,0 +1,135 @@
+"""
+Сравнение числа обращений к БД при отправке заявки: старый путь
+(get_user_info + повторный select(User) + INSERT/commit + log_event) и
+submit_request (один INSERT ... SELECT ... RETURNING).
+
+Запуск из корня проекта на тестовой базе:
+    python -m benchmarks.submission_roundtrips --telegram-id 123456789 -n 50
+
+Пользователь с таким telegram_id должен существовать. Созданные заявки,
+события и уведомления удаляются в конце.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, event, select
+
+from app.utils.database import Event, Outbox, Request, User, async_session, engine
+from app.utils.submission import submit_request
+
+BENCH_EVENT = "benchmark_request_submitted"
+
+
+class RoundTripCounter:
+    """Считает запросы, BEGIN и COMMIT - каждый из них отдельный поход в БД"""
+
+    def __init__(self):
+        self.statements = 0
+        self.begins = 0
+        self.commits = 0
+
+    @property
+    def total(self) -> int:
+        return self.statements + self.begins + self.commits
+
+    def reset(self):
+        self.statements = self.begins = self.commits = 0
+
+    def install(self, sync_engine):
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def on_execute(*args):
+            self.statements += 1
+
+        @event.listens_for(sync_engine, "begin")
+        def on_begin(conn):
+            self.begins += 1
+
+        @event.listens_for(sync_engine, "commit")
+        def on_commit(conn):
+            self.commits += 1
+
+
+async def legacy_submit(db, telegram_id: int, data: dict):
+    """Путь, как он был в process_transfer_confirm до сервиса (без кэша пользователей)"""
+    # get_user_info
+    user = (await db.execute(select(User).where(User.telegram_id == telegram_id))).scalar_one()
+    user_info = {
+        "name": f"{user.first_name or ''} {user.last_name or ''}".strip(),
+        "phone": user.phone or "Не указан",
+        "username": f"@{user.username}" if user.username else "Нет username",
+    }
+    # повторный поиск пользователя
+    user = (await db.execute(select(User).where(User.telegram_id == telegram_id))).scalar_one()
+
+    request = Request(user_id=user.id, request_type="transfer", data={**data, "user_info": user_info},
+                      status="new", created_at=datetime.utcnow())
+    db.add(request)
+    await db.commit()
+
+    # log_event
+    user = (await db.execute(select(User).where(User.telegram_id == telegram_id))).scalar_one()
+    db.add(Event(user_id=user.id, event_type=BENCH_EVENT, event_data={"request_id": request.id},
+                 created_at=datetime.utcnow()))
+    await db.commit()
+    return request.id
+
+
+async def new_submit(db, telegram_id: int, data: dict):
+    request = await submit_request(db, telegram_id, "transfer", data, BENCH_EVENT, {})
+    return request.id
+
+
+async def measure(name, submit, counter, telegram_id, iterations):
+    data = {"address": "Бенчмарк", "date": "01.01", "time": "12:00", "guests": 2, "comment": ""}
+    request_ids = []
+    round_trips = []
+    timings = []
+
+    for _ in range(iterations):
+        async with async_session() as db:
+            counter.reset()
+            started = time.perf_counter()
+            request_ids.append(await submit(db, telegram_id, data))
+            timings.append((time.perf_counter() - started) * 1000)
+            round_trips.append(counter.total)
+
+    print(f"{name:<8} обращений к БД: {statistics.mean(round_trips):.1f} "
+          f"(запросов {counter.statements}, begin {counter.begins}, commit {counter.commits} в последнем прогоне); "
+          f"время: медиана {statistics.median(timings):.2f} мс, max {max(timings):.2f} мс")
+    return request_ids
+
+
+async def cleanup(request_ids):
+    async with async_session() as db:
+        await db.execute(delete(Event).where(Event.event_type == BENCH_EVENT))
+        await db.execute(delete(Outbox).where(
+            Outbox.payload["request_id"].as_integer().in_(request_ids)
+        ))
+        await db.execute(delete(Request).where(Request.id.in_(request_ids)))
+        await db.commit()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--telegram-id", type=int, required=True)
+    parser.add_argument("-n", "--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    engine.echo = False
+    counter = RoundTripCounter()
+    counter.install(engine.sync_engine)
+
+    request_ids = []
+    try:
+        request_ids += await measure("до", legacy_submit, counter, args.telegram_id, args.iterations)
+        request_ids += await measure("после", new_submit, counter, args.telegram_id, args.iterations)
+    finally:
+        await cleanup(request_ids)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
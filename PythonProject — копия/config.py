@@ -19,4 +19,113 @@ class Config:
     DB_HOST = os.getenv("DB_HOST", "localhost")
     DB_NAME = os.getenv("DB_NAME", "barsuk_db")
     DB_USER = os.getenv("DB_USER", "postgres")
-    DB_PASSWORD = os.getenv("DB_PASSWORD", "")
\ No newline at end of file
+    DB_PASSWORD = os.getenv("DB_PASSWORD", "")
+
+    # Профиль движка БД: dev - с выводом SQL, prod - настроенный пул
+    DB_PROFILE = os.getenv("DB_PROFILE", "dev")
+    _prod = DB_PROFILE == "prod"
+
+    DB_ECHO = os.getenv("DB_ECHO", "0" if _prod else "1") == "1"
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20" if _prod else "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10" if _prod else "5"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10" if _prod else "30"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1" if _prod else "0") == "1"
+    # Кэш подготовленных запросов asyncpg на соединение (0 - выключен, нужно для pgbouncer в режиме transaction)
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500" if _prod else "100"))
+
+    # Фоновая запись событий (см. app/utils/events.py)
+    EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "10000"))
+    EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "500"))
+    EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "1.0"))
+
+    # Кэш пользователей (см. app/utils/user_cache.py)
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+    # Канал NOTIFY, в который админка пишет telegram_id изменённого пользователя
+    USER_CACHE_CHANNEL = os.getenv("USER_CACHE_CHANNEL", "barsuk_user_changed")
+
+    # Режим работы бота: polling или webhook
+    BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+    # Настройки вебхука (для BOT_MODE=webhook)
+    WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")  # публичный адрес, например https://bot.example.com
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+    WEBHOOK_MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "100"))
+    WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+    WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+    WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+
+    # Хранилище FSM: memory или redis (нужно для нескольких воркеров)
+    FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    # Через сколько секунд брошенная форма удаляется (0 - хранить бессрочно)
+    FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", "86400"))
+
+    # Кэш меню: как часто сверять версию контента с БД (сек.)
+    MENU_CACHE_CHECK_INTERVAL = float(os.getenv("MENU_CACHE_CHECK_INTERVAL", "60"))
+    # Канал NOTIFY, в который админка пишет об изменении категорий и позиций
+    MENU_CACHE_CHANNEL = os.getenv("MENU_CACHE_CHANNEL", "barsuk_menu_changed")
+
+    # Уведомления менеджеров о заявках (см. app/utils/outbox.py)
+    # Чаты менеджеров через запятую и/или адрес вебхука CRM
+    MANAGER_CHAT_IDS = [int(x) for x in os.getenv("MANAGER_CHAT_IDS", "").split(",") if x.strip()]
+    MANAGER_WEBHOOK_URL = os.getenv("MANAGER_WEBHOOK_URL", "")
+    OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+    OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+    # Сколько секунд строка считается занятой диспетчером (после падения процесса ее подхватят снова)
+    OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+
+    # Запись last_activity (см. app/utils/activity.py): не чаще раза в ACTIVITY_GRANULARITY сек.
+    # на пользователя, в БД - пачкой раз в ACTIVITY_FLUSH_INTERVAL сек.
+    ACTIVITY_GRANULARITY = float(os.getenv("ACTIVITY_GRANULARITY", "60"))
+    ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "30"))
+
+    # Защита от флуда (см. app/utils/throttling.py): memory или redis (общие лимиты для воркеров)
+    THROTTLE_STORAGE = os.getenv("THROTTLE_STORAGE", "memory")
+    # Лимит на хендлер: токенов в секунду и размер "пачки"
+    THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "1"))
+    THROTTLE_BURST = int(os.getenv("THROTTLE_BURST", "3"))
+    # Общий лимит пользователя на все хендлеры
+    THROTTLE_USER_RATE = float(os.getenv("THROTTLE_USER_RATE", "3"))
+    THROTTLE_USER_BURST = int(os.getenv("THROTTLE_USER_BURST", "10"))
+    # Окно, в котором одинаковые сообщения/колбэки считаются повтором (сек.)
+    DEDUP_WINDOW = float(os.getenv("DEDUP_WINDOW", "2"))
+
+    # Запись апдейтов для воспроизведения (см. app/utils/recorder.py и benchmarks/replay.py)
+    RECORD_UPDATES = os.getenv("RECORD_UPDATES", "0") == "1"
+    RECORD_DIR = os.getenv("RECORD_DIR", "captures")
+    # Ключ HMAC для id пользователей; без него id в разных запусках не совпадут
+    RECORD_SALT = os.getenv("RECORD_SALT", "")
+    # Доля пользователей, чьи апдейты пишутся (0..1)
+    RECORD_SAMPLE = float(os.getenv("RECORD_SAMPLE", "1"))
+    RECORD_MAX_UPDATES = int(os.getenv("RECORD_MAX_UPDATES", "100000"))
+    RECORD_FLUSH_INTERVAL = float(os.getenv("RECORD_FLUSH_INTERVAL", "5"))
+
+    # Метрики Prometheus (см. app/utils/metrics.py): /metrics на METRICS_HOST:METRICS_PORT, 0 - без сервера
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+    # Telegram id администраторов через запятую - им доступны отладочные команды (/queries)
+    ADMIN_IDS = [int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()]
+
+    # Бюджет запросов к БД на апдейт (см. app/utils/query_budget.py): превышение пишется в лог
+    QUERY_BUDGET_ENABLED = os.getenv("QUERY_BUDGET_ENABLED", "1") == "1"
+    QUERY_BUDGET_COUNT = int(os.getenv("QUERY_BUDGET_COUNT", "10"))
+    QUERY_BUDGET_MS = float(os.getenv("QUERY_BUDGET_MS", "200"))
+    # Запрос дольше QUERY_SLOW_MS пишется в лог сразу
+    QUERY_SLOW_MS = float(os.getenv("QUERY_SLOW_MS", "100"))
+    # Окно статистики по отпечаткам запросов (сек.) и размер топа в /queries
+    QUERY_STATS_WINDOW = float(os.getenv("QUERY_STATS_WINDOW", "3600"))
+    QUERY_STATS_TOP = int(os.getenv("QUERY_STATS_TOP", "10"))
+
+    # Профилирование по запросу (см. app/utils/profiler.py): SIGUSR1 или /profile
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+    PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", "30"))
+    PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+    # Интервал между снимками стека (сек.)
+    PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.01"))
\ No newline at end of file
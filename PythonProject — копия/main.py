@@ -1,50 +1,188 @@
 import asyncio
-from aiogram import Bot, Dispatcher, BaseMiddleware
+import signal
+from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
-from typing import Dict, Any, Awaitable, Callable
-from aiogram.types import Update
+from aiohttp import web
 
-from app import setup_handlers
-from app.utils.database import init_db, async_session
+from app import setup_handlers, NO_DB_ROUTERS
+from app.utils.activity import activity_tracker
+from app.utils.content import menu_cache
+from app.utils.database import init_db, async_session, pool_stats
+from app.utils.events import event_sink
+from app.utils.metrics import (
+    BotAPIMetricsMiddleware, HandlerMetricsMiddleware, MetricsServer, UpdateMetricsMiddleware,
+    registry, stats_collector,
+)
+from app.utils.middlewares import ActivityMiddleware, DatabaseMiddleware
+from app.utils.notify import notify_listener
+from app.utils.outbox import outbox_dispatcher
+from app.utils.profiler import profiler
+from app.utils.query_budget import QueryBudgetMiddleware
+from app.utils.recorder import update_recorder
+from app.utils.storage import create_fsm_storage
+from app.utils.throttling import ThrottlingMiddleware, create_throttle_storage
+from app.utils.user_cache import user_cache
+from app.utils.webhook import create_webhook_app
 from config import Config
 
+metrics_server = MetricsServer(Config.METRICS_HOST, Config.METRICS_PORT)
 
-class DatabaseMiddleware(BaseMiddleware):
-    def __init__(self, session_pool):
-        self.session_pool = session_pool
 
-    async def __call__(
-            self,
-            handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
-            event: Update,
-            data: Dict[str, Any]
-    ) -> Any:
-        async with self.session_pool() as session:
-            data["db"] = session
-            return await handler(event, data)
-
-
-async def main():
+async def on_startup(bot: Bot, dispatcher: Dispatcher):
     print("Инициализация базы данных...")
     await init_db()
+    await event_sink.start()
+    await activity_tracker.start()
+    if Config.RECORD_UPDATES:
+        await update_recorder.start()
+    if Config.METRICS_ENABLED and Config.METRICS_PORT:
+        await metrics_server.start()
+    # kill -USR1 <pid> - включить/выключить профилирование (на Windows сигнала нет, только /profile)
+    if hasattr(signal, "SIGUSR1"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, profiler.toggle)
+
+    # Сброс кэшей при изменениях из админки
+    notify_listener.subscribe(Config.USER_CACHE_CHANNEL, user_cache.on_notify)
+    # Пересборка меню при изменении категорий и позиций
+    notify_listener.subscribe(Config.MENU_CACHE_CHANNEL, menu_cache.invalidate)
+    await notify_listener.start()
+
+    # Доставка уведомлений менеджерам из outbox
+    await outbox_dispatcher.start(bot)
+
+    if Config.BOT_MODE == "webhook":
+        await bot.set_webhook(
+            url=Config.WEBHOOK_BASE_URL.rstrip("/") + Config.WEBHOOK_PATH,
+            secret_token=Config.WEBHOOK_SECRET or None,
+            max_connections=Config.WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+        )
+        print(f"Вебхук установлен: {Config.WEBHOOK_BASE_URL}{Config.WEBHOOK_PATH}")
+
+
+async def on_shutdown():
+    profiler.stop()
+    await metrics_server.stop()
+    await outbox_dispatcher.stop()
+    print(f"Outbox остановлен: {outbox_dispatcher.stats()}")
+    await notify_listener.stop()
+    # Дописываем накопленные события перед выходом
+    await event_sink.stop()
+    print(f"Очередь событий остановлена: {event_sink.stats()}")
+    await activity_tracker.stop()
+    print(f"Активность пользователей записана: {activity_tracker.stats()}")
+    if update_recorder.is_running:
+        await update_recorder.stop()
+        print(f"Запись апдейтов остановлена: {update_recorder.stats()}")
 
-    storage = MemoryStorage()
 
+def create_bot() -> Bot:
     bot = Bot(
         token=Config.BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
-    dp = Dispatcher(storage=storage)
+    if Config.METRICS_ENABLED:
+        bot.session.middleware(BotAPIMetricsMiddleware())
+    return bot
+
+
+def setup_metrics(dp: Dispatcher, throttling: ThrottlingMiddleware):
+    """Middleware метрик и счетчики фоновых очередей для /metrics"""
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+
+    registry.collector(stats_collector("barsuk_db_pool", "Пул соединений с БД", pool_stats,
+                                       counters=("checkouts", "timeouts")))
+    registry.collector(stats_collector("barsuk_event_sink", "Очередь событий", event_sink.stats,
+                                       counters=("enqueued", "flushed", "dropped", "failed", "flush_count")))
+    registry.collector(stats_collector("barsuk_activity", "Запись last_activity", activity_tracker.stats,
+                                       counters=("touches", "recorded", "flushed", "failed")))
+    registry.collector(stats_collector("barsuk_outbox", "Уведомления менеджерам", outbox_dispatcher.stats,
+                                       counters=("sent", "retried", "dead")))
+    registry.collector(stats_collector("barsuk_user_cache", "Кэш пользователей", user_cache.stats,
+                                       counters=("hits", "misses")))
+    registry.collector(stats_collector("barsuk_throttling", "Троттлинг", throttling.stats,
+                                       counters=("duplicates", "throttled")))
+
+
+def create_dispatcher() -> Dispatcher:
+    storage, events_isolation = create_fsm_storage()
+    dp = Dispatcher(storage=storage, events_isolation=events_isolation)
+
+    # Копия входящих апдейтов для benchmarks/replay.py - первой, до троттлинга
+    if Config.RECORD_UPDATES:
+        dp.update.outer_middleware(update_recorder)
+
+    # last_activity копится в памяти и пишется пачками
+    dp.update.outer_middleware(ActivityMiddleware(activity_tracker))
+
+    # Флуд и повторные нажатия отсекаются до того, как хендлер возьмет соединение с БД
+    throttling = ThrottlingMiddleware(
+        create_throttle_storage(),
+        rate=Config.THROTTLE_RATE,
+        burst=Config.THROTTLE_BURST,
+        user_rate=Config.THROTTLE_USER_RATE,
+        user_burst=Config.THROTTLE_USER_BURST,
+        dedup_window=Config.DEDUP_WINDOW,
+    )
+    dp.message.middleware(throttling)
+    dp.callback_query.middleware(throttling)
+
+    if Config.METRICS_ENABLED:
+        setup_metrics(dp, throttling)
+        # После троттлинга: отсеченные апдейты не размывают время хендлеров
+        handler_metrics = HandlerMetricsMiddleware()
+        dp.message.middleware(handler_metrics)
+        dp.callback_query.middleware(handler_metrics)
 
-    dp.update.middleware(DatabaseMiddleware(async_session))
+    # Раньше сессии БД: в бюджет входят и запросы доступа, и коммит
+    if Config.QUERY_BUDGET_ENABLED:
+        query_budget = QueryBudgetMiddleware(Config.QUERY_BUDGET_COUNT, Config.QUERY_BUDGET_MS)
+        dp.message.middleware(query_budget)
+        dp.callback_query.middleware(query_budget)
+
+    # Сессия создается лениво и закрывается сразу после хендлера
+    db_middleware = DatabaseMiddleware(async_session, skip_routers=NO_DB_ROUTERS)
+    dp.message.middleware(db_middleware)
+    dp.callback_query.middleware(db_middleware)
 
     setup_handlers(dp)
+    profiler.attach(dp)
+
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return dp
+
 
+async def run_polling(dp: Dispatcher, bot: Bot):
+    # Вебхук и getUpdates несовместимы - снимаем вебхук, если он остался
+    await bot.delete_webhook()
     print("Бот запущен! Используйте Ctrl+C для остановки.")
     await dp.start_polling(bot)
 
 
+def run_webhook(dp: Dispatcher, bot: Bot):
+    app = create_webhook_app(
+        dp, bot,
+        path=Config.WEBHOOK_PATH,
+        secret_token=Config.WEBHOOK_SECRET or None,
+        max_in_flight=Config.WEBHOOK_MAX_IN_FLIGHT,
+        drain_timeout=Config.WEBHOOK_DRAIN_TIMEOUT,
+    )
+    print(f"Бот запущен в режиме вебхука на {Config.WEBAPP_HOST}:{Config.WEBAPP_PORT}")
+    # run_app сам обрабатывает SIGTERM/SIGINT и вызывает on_shutdown
+    web.run_app(app, host=Config.WEBAPP_HOST, port=Config.WEBAPP_PORT)
+
+
+def main():
+    dp = create_dispatcher()
+    bot = create_bot()
+
+    if Config.BOT_MODE == "webhook":
+        run_webhook(dp, bot)
+    else:
+        asyncio.run(run_polling(dp, bot))
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    main()
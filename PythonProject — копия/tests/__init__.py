@@ -0,0 +1,10 @@
+"""
+Тесты бота (админка тестируется через manage.py test).
+
+Запуск из корня проекта:
+    python -m unittest discover -s tests -t .
+"""
+import os
+
+# config.Config требует токен при импорте; в тестах Bot API не вызывается
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:TEST")
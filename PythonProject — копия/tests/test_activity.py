@@ -0,0 +1,48 @@
+import unittest
+from datetime import datetime, timedelta
+
+from app.utils.activity import ActivityTracker
+
+
+class FlakyActivityTracker(ActivityTracker):
+    """Первая запись падает (БД недоступна), следующие проходят"""
+
+    def __init__(self):
+        super().__init__(session_pool=None, granularity=60.0)
+        self.fail_next = True
+        self.written = []
+
+    async def _write(self, batch):
+        if self.fail_next:
+            self.fail_next = False
+            # Пока шла неудачная запись, пользователь 1 успел снова проявить активность
+            self._pending[1] = batch[0][1] + timedelta(minutes=5)
+            raise ConnectionError("database is unavailable")
+        self.written.extend(batch)
+
+
+class ActivityTrackerTests(unittest.IsolatedAsyncioTestCase):
+    """Отметки из упавшей пачки не теряются"""
+
+    async def test_failed_batch_is_retried(self):
+        tracker = FlakyActivityTracker()
+        tracker.touch(1)
+        tracker.touch(2)
+        first = dict(tracker._pending)
+
+        with self.assertLogs("app.utils.activity", level="ERROR"):
+            await tracker.flush()
+        self.assertEqual(tracker.failed, 2)
+        self.assertEqual(set(tracker._pending), {1, 2})
+        # Более поздняя отметка не заменяется старой из упавшей пачки
+        self.assertEqual(tracker._pending[1], first[1] + timedelta(minutes=5))
+        self.assertEqual(tracker._pending[2], first[2])
+
+        await tracker.flush()
+        self.assertEqual(dict(tracker.written), {1: first[1] + timedelta(minutes=5), 2: first[2]})
+        self.assertEqual(tracker._pending, {})
+        self.assertIsInstance(tracker.written[0][1], datetime)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+
+from app.utils.recorder import UpdateRecorder
+
+
+class AnonTextTests(unittest.TestCase):
+    """В запись попадают только значения полей формы, остальные цифры маскируются"""
+
+    def setUp(self):
+        self.recorder = UpdateRecorder(directory="", salt="test")
+
+    def test_form_values_are_kept(self):
+        for value in ["22:30", "9:05", "15.02", "1", "10", "завтра", "Сегодня", "🚖 Заказать трансфер"]:
+            self.assertEqual(self.recorder.anon_text(value), value)
+
+    def test_other_digits_are_masked(self):
+        for value in ["+7 900 123-45-67", "89001234567", "900-12-34", "4276 1234 5678 9012",
+                      "11", "0", "25:00", "15.02.2025"]:
+            self.assertEqual(self.recorder.anon_text(value), "x" * len(value), value)
+
+    def test_command_arguments_are_masked(self):
+        self.assertEqual(self.recorder.anon_text("/start"), "/start")
+        self.assertEqual(self.recorder.anon_text("/start 79001234567"), "/start xxxxxxxxxxx")
+
+
+if __name__ == "__main__":
+    unittest.main()
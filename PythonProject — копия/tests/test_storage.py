@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from aiogram.fsm.storage.base import StorageKey
+from fakeredis import FakeAsyncRedis, FakeServer
+
+from app.utils.storage import PipelinedRedisStorage
+
+KEY = StorageKey(bot_id=1, chat_id=100, user_id=100)
+
+
+class PipelinedRedisStorageTests(unittest.IsolatedAsyncioTestCase):
+    """Предзагрузка данных формы вместе с состоянием и TTL брошенных форм"""
+
+    async def asyncSetUp(self):
+        # Два воркера на одном Redis
+        server = FakeServer()
+        self.storage = PipelinedRedisStorage(FakeAsyncRedis(server=server), state_ttl=60, data_ttl=60)
+        self.other = PipelinedRedisStorage(FakeAsyncRedis(server=server), state_ttl=60, data_ttl=60)
+
+    async def asyncTearDown(self):
+        await self.storage.close()
+        await self.other.close()
+
+    async def test_get_data_uses_prefetch_once(self):
+        await self.storage.set_state(KEY, "Form:name")
+        await self.storage.set_data(KEY, {"name": "Иван"})
+
+        self.assertEqual(await self.storage.get_state(KEY), "Form:name")
+        with mock.patch.object(self.storage.redis, "get", wraps=self.storage.redis.get) as redis_get:
+            self.assertEqual(await self.storage.get_data(KEY), {"name": "Иван"})
+            self.assertEqual(redis_get.call_count, 0)
+            # Предзагрузка одноразовая: следующее чтение идет в Redis
+            self.assertEqual(await self.storage.get_data(KEY), {"name": "Иван"})
+            self.assertEqual(redis_get.call_count, 1)
+
+    async def test_stale_prefetch_is_not_used(self):
+        await self.storage.set_data(KEY, {"step": 1})
+        with mock.patch("app.utils.storage.time.monotonic", return_value=1000.0):
+            await self.storage.get_state(KEY)
+        await self.other.set_data(KEY, {"step": 2})
+
+        with mock.patch("app.utils.storage.time.monotonic",
+                        return_value=1000.0 + self.storage.prefetch_ttl + 0.1):
+            self.assertEqual(await self.storage.get_data(KEY), {"step": 2})
+
+    async def test_set_data_invalidates_prefetch(self):
+        await self.storage.set_data(KEY, {"step": 1})
+        await self.storage.get_state(KEY)
+        await self.storage.set_data(KEY, {"step": 2})
+        self.assertEqual(await self.storage.get_data(KEY), {"step": 2})
+
+    async def test_set_state_invalidates_prefetch(self):
+        await self.storage.set_data(KEY, {"step": 1})
+        await self.storage.get_state(KEY)
+        await self.other.set_data(KEY, {"step": 2})
+        await self.storage.set_state(KEY, "Form:phone")
+        self.assertEqual(await self.storage.get_data(KEY), {"step": 2})
+
+    async def test_set_state_extends_data_ttl(self):
+        await self.storage.set_data(KEY, {"step": 1})
+        data_key = self.storage.key_builder.build(KEY, "data")
+        await self.storage.redis.expire(data_key, 5)
+
+        await self.storage.set_state(KEY, "Form:phone")
+        self.assertGreater(await self.storage.redis.ttl(data_key), 5)
+
+    async def test_abandoned_form_expires(self):
+        storage = PipelinedRedisStorage(FakeAsyncRedis(), state_ttl=1, data_ttl=1)
+        await storage.set_data(KEY, {"name": "Иван"})
+        await storage.set_state(KEY, "Form:name")
+
+        await asyncio.sleep(1.1)
+        self.assertIsNone(await storage.get_state(KEY))
+        self.assertEqual(await storage.get_data(KEY), {})
+        await storage.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from app.utils.throttling import MemoryThrottleStorage, ThrottlingMiddleware
+
+USER = User(id=100, is_bot=False, first_name="Test")
+MESSAGE = Message(message_id=7, date=0, chat=Chat(id=100, type="private"), text="🍷 Наше меню")
+
+
+def callback(update_id: int, data: str):
+    query = CallbackQuery(id=str(update_id), from_user=USER, chat_instance="1", data=data, message=MESSAGE)
+    return query, {"event_from_user": USER, "event_update": Update(update_id=update_id, callback_query=query)}
+
+
+class ThrottlingMiddlewareTests(unittest.IsolatedAsyncioTestCase):
+    """Дедупликация колбэков и порядок списания токенов"""
+
+    def setUp(self):
+        self.middleware = ThrottlingMiddleware(MemoryThrottleStorage(), rate=100, burst=100,
+                                               user_rate=100, user_burst=100, dedup_window=2.0)
+        self.handled = []
+        patcher = mock.patch.object(CallbackQuery, "answer", new=mock.AsyncMock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def handler(self, event, data):
+        self.handled.append(event.data)
+
+    async def test_menu_navigation_is_not_deduplicated(self):
+        for update_id, data in enumerate(["category_1", "back_to_menu", "category_1"], 1):
+            await self.middleware(self.handler, *callback(update_id, data))
+        self.assertEqual(self.handled, ["category_1", "back_to_menu", "category_1"])
+        self.assertEqual(self.middleware.duplicates, 0)
+
+    async def test_double_tap_during_handler_is_dropped(self):
+        release = asyncio.Event()
+
+        async def slow_handler(event, data):
+            await release.wait()
+            self.handled.append(event.data)
+
+        first = asyncio.create_task(self.middleware(slow_handler, *callback(1, "category_1")))
+        await asyncio.sleep(0)
+        await self.middleware(slow_handler, *callback(2, "category_1"))
+        release.set()
+        await first
+        self.assertEqual(self.handled, ["category_1"])
+        self.assertEqual(self.middleware.duplicates, 1)
+
+    async def test_redelivered_update_is_dropped(self):
+        await self.middleware(self.handler, *callback(1, "category_1"))
+        await self.middleware(self.handler, *callback(1, "category_1"))
+        self.assertEqual(self.handled, ["category_1"])
+
+    async def test_handler_limit_does_not_drain_user_limit(self):
+        storage = MemoryThrottleStorage()
+        user_bucket = ("user:100", 0.001, 3)
+        self.assertTrue(await storage.take([user_bucket, ("handler:100:a", 0.001, 1)]))
+        for _ in range(5):
+            self.assertFalse(await storage.take([user_bucket, ("handler:100:a", 0.001, 1)]))
+        # В общем лимите осталось 2 токена из 3 - отказы по хендлеру "a" их не тронули
+        self.assertTrue(await storage.take([user_bucket, ("handler:100:b", 0.001, 5)]))
+        self.assertTrue(await storage.take([user_bucket, ("handler:100:b", 0.001, 5)]))
+        self.assertFalse(await storage.take([user_bucket, ("handler:100:b", 0.001, 5)]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import asyncio
+import unittest
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+from aiohttp import test_utils
+
+from app.utils.webhook import BoundedRequestHandler
+
+PATH = "/webhook"
+
+
+def message_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 1000 + update_id, "type": "private"},
+            "from": {"id": 1000 + update_id, "is_bot": False, "first_name": "Test"},
+            "text": "ping",
+        },
+    }
+
+
+class BoundedRequestHandlerTests(unittest.IsolatedAsyncioTestCase):
+    """Режим вебхука: ограничение одновременных апдейтов, 503 при остановке, drain"""
+
+    async def asyncSetUp(self):
+        self.release = asyncio.Event()
+        self.started = []
+        self.finished = []
+
+        dp = Dispatcher()
+
+        @dp.message()
+        async def slow_handler(message):
+            self.started.append(message.message_id)
+            await self.release.wait()
+            self.finished.append(message.message_id)
+
+        self.bot = Bot("123456:TEST")
+        self.handler = BoundedRequestHandler(dispatcher=dp, bot=self.bot, max_in_flight=2)
+        app = web.Application()
+        self.handler.register(app, path=PATH)
+
+        self.client = test_utils.TestClient(test_utils.TestServer(app))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        self.release.set()
+        await self.client.close()
+        await self.bot.session.close()
+
+    async def post(self, update_id: int):
+        response = await self.client.post(PATH, json=message_update(update_id))
+        await response.read()
+        return response.status
+
+    async def wait_started(self, count: int):
+        for _ in range(100):
+            if len(self.started) >= count:
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f"Начато {len(self.started)} апдейтов из {count}")
+
+    async def test_response_delayed_over_limit(self):
+        self.assertEqual(await self.post(1), 200)
+        self.assertEqual(await self.post(2), 200)
+        await self.wait_started(2)
+
+        # Третий апдейт ждет свободного места - ответ Telegram задерживается
+        third = asyncio.create_task(self.post(3))
+        await asyncio.sleep(0.1)
+        self.assertFalse(third.done())
+        self.assertEqual(self.handler.in_flight, 2)
+
+        self.release.set()
+        self.assertEqual(await asyncio.wait_for(third, 5), 200)
+        await self.wait_started(3)
+
+    async def test_rejects_updates_while_closing(self):
+        self.assertEqual(await self.post(1), 200)
+        await self.wait_started(1)
+
+        drain = asyncio.create_task(self.handler.drain(timeout=5))
+        await asyncio.sleep(0)
+        self.assertEqual(await self.post(2), 503)
+        self.assertFalse(drain.done())
+
+        self.release.set()
+        await asyncio.wait_for(drain, 5)
+        self.assertEqual(self.finished, [1])
+        self.assertEqual(self.started, [1])
+
+    async def test_drain_gives_up_after_timeout(self):
+        self.assertEqual(await self.post(1), 200)
+        await self.wait_started(1)
+
+        with self.assertLogs("app.utils.webhook", level="WARNING"):
+            await self.handler.drain(timeout=0.05)
+        self.assertEqual(self.finished, [])
+        self.assertEqual(self.handler.in_flight, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()